@@ -1,6 +1,8 @@
-from lib.from_scratch.indexer import read_term_counts, read_index
+from lib.from_scratch.indexer import read_ngram_index, read_positional_index, read_term_counts, read_index
+from lib.shared_utils import tracing
 
 from argparse import ArgumentParser
+from sys import stderr
 
 parser = ArgumentParser(description='Performs queries from a query file using a BM25 retrieval model.')
 parser.add_argument("index_path", help="the path to read the index from")
@@ -10,13 +12,31 @@ parser.add_argument("-r", help="the number of scores to output for each query",
 parser.add_argument("-k1", help="the k1 value", type=float, default=1.2)
 parser.add_argument("-b", help="the b value", type=float, default=0.75)
 parser.add_argument("-k2", help="the k2 value", type=float, default=100)
+parser.add_argument("-pos", help="the path to read the positional index from (required for proximity-boosted scoring)", default=None)
+parser.add_argument("-ngrams", help="the path to read the compact n-gram index from (answers two- and three-word phrases for proximity-boosted scoring)", default=None)
+parser.add_argument("-proximity", help="the weight of proximity-boosted scoring for phrases (\"a b\"), ordered (#odN(a b)) and unordered (#uwN(a b)) windows, and windows over adjacent query terms (0 disables it)", type=float, default=0)
+parser.add_argument("-window", help="the width of the unordered windows over adjacent query terms used by proximity-boosted scoring (0 for none)", type=int, default=8)
+parser.add_argument("--topk", help="use top-k (MaxScore) pruning and print the number of skipped postings for each query to stderr", action='store_true')
+parser.add_argument("--batch", help="score all queries at once using sparse matrix products", action='store_true')
+parser.add_argument("-cache", help="cache the ranked results of up to this many queries, so that repeated queries are answered without reading postings (hit and miss counts are printed to stderr)", type=int, default=None)
+parser.add_argument("--profile", help="trace each query and print its per-stage wall times and counters (postings touched, candidates scored, cache hits) as a JSON line to stderr (not with --batch)", action='store_true')
 
 args = parser.parse_args()
 
+if args.profile:
+    tracing.enable()
+
 # Read the term counts
 read_term_counts(args.term_counts_path)
 read_index(args.index_path)
+if args.ngrams is not None:
+    read_ngram_index(args.ngrams)
+if args.pos is not None:
+    read_positional_index(args.pos)
+elif args.proximity > 0 and (args.ngrams is None or args.window > 0):
+    parser.error("-proximity requires the positional index (-pos), or the n-gram index (-ngrams) with -window 0")
 
+from lib.from_scratch.result_cache import ResultCache
 from lib.from_scratch.retrieval_model import BM25RetrievalModel
 
 # Create the retrieval model
@@ -24,6 +44,19 @@ model = BM25RetrievalModel()
 model.k1 = args.k1
 model.b = args.b
 model.k2 = args.k2
+model.proximity_weight = args.proximity
+model.proximity_window = args.window
+model.top_k_pruning = args.topk
+if args.cache is not None:
+    model.result_cache = ResultCache(args.cache)
 
 # Perform the retrieval
-model.process_query_file(args.query_file_path, 100)
+if args.batch:
+    model.process_query_file_batch(args.query_file_path, 100)
+else:
+    model.process_query_file(args.query_file_path, 100, print_stats=args.topk)
+
+if args.profile:
+    tracing.write_records(stderr)
+if args.cache is not None:
+    print("Result cache: %(hits)s hits, %(misses)s misses, %(entries)s entries" % model.result_cache.stats(), file=stderr)
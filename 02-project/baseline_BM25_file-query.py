@@ -1,8 +1,11 @@
-from lib.from_scratch.indexer import read_term_counts, read_index
+from lib.from_scratch.indexer import read_ngram_index, read_positional_index, read_spelling_index, read_term_counts, read_index
+from lib.shared_utils.summarizer import read_document_store, read_sentence_store
+from lib.shared_utils import tracing
 
 from csv import reader as csv_reader
 
 from argparse import ArgumentParser
+from sys import stderr
 
 parser = ArgumentParser(description='Performs queries from a file using a BM25 retrieval model w/ user interface.')
 parser.add_argument("index_path", help="the path to read the index from")
@@ -14,13 +17,43 @@ parser.add_argument("-r", help="the number of scores to output for each query",
 parser.add_argument("-k1", help="the k1 value", type=float, default=1.2)
 parser.add_argument("-b", help="the b value", type=float, default=0.75)
 parser.add_argument("-k2", help="the k2 value", type=float, default=100)
+parser.add_argument("-sentences", help="the path to read the sentence store built with build_sentence_store.py from (documents are read from files_path otherwise)", default=None)
+parser.add_argument("-docstore", help="the path to read the document store written by preprocess_cacm.py --store from (documents are read from files_path otherwise)", default=None)
+parser.add_argument("-spelling", help="the path to read the spelling index from (built from the index when the first suggestion is needed otherwise)", default=None)
+parser.add_argument("-bi", help="the path to read the bigram index from (used by --correct, unless -ngrams is given)", default=None)
+parser.add_argument("--correct", help="suggest a correction of the whole query, choosing between the corrections of each term using bigram statistics", action='store_true')
+parser.add_argument("-budget", help="the time limit in milliseconds for correcting each query with --correct (terms left when it runs out are not corrected)", type=float, default=None)
+parser.add_argument("-pos", help="the path to read the positional index from (required for proximity-boosted scoring)", default=None)
+parser.add_argument("-ngrams", help="the path to read the compact n-gram index from (answers two- and three-word phrases for proximity-boosted scoring)", default=None)
+parser.add_argument("-proximity", help="the weight of proximity-boosted scoring for phrases (\"a b\"), ordered (#odN(a b)) and unordered (#uwN(a b)) windows, and windows over adjacent query terms (0 disables it)", type=float, default=0)
+parser.add_argument("-window", help="the width of the unordered windows over adjacent query terms used by proximity-boosted scoring (0 for none)", type=int, default=8)
+parser.add_argument("-cache", help="cache the ranked results of up to this many queries, so that repeated queries are answered without reading postings (hit and miss counts are printed to stderr)", type=int, default=None)
+parser.add_argument("--profile", help="trace each query and print its per-stage wall times and counters (postings touched, candidates scored, cache hits) as a JSON line to stderr", action='store_true')
 
 args = parser.parse_args()
 
+if args.profile:
+    tracing.enable()
+
 # Read the term counts
 read_term_counts(args.term_counts_path)
 read_index(args.index_path)
+if args.sentences is not None:
+    read_sentence_store(args.sentences)
+if args.docstore is not None:
+    read_document_store(args.docstore)
+if args.spelling is not None:
+    read_spelling_index(args.spelling)
+if args.bi is not None:
+    read_index(args.bi, n=2)
+if args.ngrams is not None:
+    read_ngram_index(args.ngrams)
+if args.pos is not None:
+    read_positional_index(args.pos)
+elif args.proximity > 0 and (args.ngrams is None or args.window > 0):
+    parser.error("-proximity requires the positional index (-pos), or the n-gram index (-ngrams) with -window 0")
 
+from lib.from_scratch.result_cache import ResultCache
 from lib.from_scratch.retrieval_model import BM25RetrievalModel
 
 # Create the retrieval model
@@ -28,6 +61,12 @@ model = BM25RetrievalModel()
 model.k1 = args.k1
 model.b = args.b
 model.k2 = args.k2
+model.proximity_weight = args.proximity
+model.proximity_window = args.window
+model.spell_corrector.whole_query = args.correct
+model.spell_corrector.time_budget = None if args.budget is None else args.budget / 1000
+if args.cache is not None:
+    model.result_cache = ResultCache(args.cache)
 
 with open(args.query_file_path) as query_file:
     reader = csv_reader(query_file, delimiter='\t')
@@ -36,4 +75,9 @@ with open(args.query_file_path) as query_file:
         query_string = query_row[1].strip()
         print("QUERY: %s" % query_id)
         # Perform the retrieval
-        model.display_documents(query_string, args.files_path, args.files_ext, num_results=args.r)
\ No newline at end of file
+        model.display_documents(query_string, args.files_path, args.files_ext, num_results=args.r)
+
+if args.profile:
+    tracing.write_records(stderr)
+if args.cache is not None:
+    print("Result cache: %(hits)s hits, %(misses)s misses, %(entries)s entries" % model.result_cache.stats(), file=stderr)
\ No newline at end of file
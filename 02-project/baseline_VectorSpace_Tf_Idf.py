@@ -1,6 +1,8 @@
-from lib.from_scratch.indexer import read_term_counts, read_index
+from lib.from_scratch.indexer import read_document_norms, read_term_counts, read_index
+from lib.shared_utils import tracing
 
 from argparse import ArgumentParser
+from sys import stderr
 
 parser = ArgumentParser(description='Performs queries from a query file using a Vector Space retrieval model.')
 parser.add_argument("index_path", help="the path to read the index from")
@@ -8,17 +10,41 @@ parser.add_argument("term_counts_path", help="the path to read the term counts f
 parser.add_argument("query_file_path", help="the path to a TSV query file containing query IDs and stopped, case-folded test queries")
 parser.add_argument("-r", help="the number of scores to output for each query", type=int, default=None)
 parser.add_argument("-rel", help="the path to a cacm relevance file to enable optimal query transformation using Rocchio's Algorithm", default=None)
+parser.add_argument("-alpha", help="the weight of the original query in Rocchio's Algorithm", type=float, default=8)
+parser.add_argument("-beta", help="the weight of the relevant document centroid in Rocchio's Algorithm", type=float, default=16)
+parser.add_argument("-gamma", help="the weight of the non-relevant document centroid in Rocchio's Algorithm", type=float, default=4)
+parser.add_argument("-terms", help="the number of highest weighted terms kept in the query modified by Rocchio's Algorithm", type=int, default=100)
+parser.add_argument("-norms", help="the path to read the document vector norms written with the index from (computed when the model is created otherwise)", default=None)
+parser.add_argument("--batch", help="score all queries at once using sparse matrix products (ignores -rel)", action='store_true')
+parser.add_argument("-cache", help="cache the ranked results of up to this many queries, so that repeated queries are answered without reading postings (hit and miss counts are printed to stderr)", type=int, default=None)
+parser.add_argument("--profile", help="trace each query and print its per-stage wall times and counters (postings touched, candidates scored, cache hits) as a JSON line to stderr (not with --batch)", action='store_true')
 
 args = parser.parse_args()
 
+if args.profile:
+    tracing.enable()
+
 # Read the term counts
 read_term_counts(args.term_counts_path)
 read_index(args.index_path)
+if args.norms is not None:
+    read_document_norms(args.norms)
 
+from lib.from_scratch.result_cache import ResultCache
 from lib.from_scratch.retrieval_model import VectorSpaceRetrievalModel
 
 # Create the retrieval model
-model = VectorSpaceRetrievalModel()
+model = VectorSpaceRetrievalModel(args.alpha, args.beta, args.gamma, args.terms)
+if args.cache is not None:
+    model.result_cache = ResultCache(args.cache)
 
 # Perform the retrieval
-model.process_query_file(args.query_file_path, args.rel, args.r)
\ No newline at end of file
+if args.batch:
+    model.process_query_file_batch(args.query_file_path, args.r)
+else:
+    model.process_query_file(args.query_file_path, args.rel, args.r)
+
+if args.profile:
+    tracing.write_records(stderr)
+if args.cache is not None:
+    print("Result cache: %(hits)s hits, %(misses)s misses, %(entries)s entries" % model.result_cache.stats(), file=stderr)
\ No newline at end of file
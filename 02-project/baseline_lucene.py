@@ -1,6 +1,8 @@
 from lib.lucene.basic_index_query import process_query_file
+from lib.shared_utils import tracing
 
 from argparse import ArgumentParser
+from sys import stderr
 
 parser = ArgumentParser(description='Performs queries from a query file using a Lucene retrieval model.')
 parser.add_argument("index_path", help="the path to read the index from")
@@ -9,7 +11,14 @@ parser.add_argument("-r", help="the number of results to print per query", type=
 parser.add_argument("-k", help="the number of top ranked documents to expand the query", type=int, default=0)
 parser.add_argument("-n", help="the maximum number of terms to select for expanding queries from the top `k` documents", type=int, default=0)
 parser.add_argument("-w", help="the path to the trained Word2Vec-trained word vectors (if provided, this will perform word embedding query expansion and ignore the arguments for pseudo-relevance feedback query expansion)")
+parser.add_argument("--profile", help="trace each query and print its per-stage wall times and counters (postings touched, candidates scored, cache hits) as a JSON line to stderr", action='store_true')
 
 args = parser.parse_args()
 
-process_query_file(args.index_path, args.query_file_path, args.r, args.k, args.n, args.w)
\ No newline at end of file
+if args.profile:
+    tracing.enable()
+
+process_query_file(args.index_path, args.query_file_path, args.r, args.k, args.n, args.w)
+
+if args.profile:
+    tracing.write_records(stderr)
\ No newline at end of file
@@ -1,6 +1,8 @@
 from lib.from_scratch.indexer import read_term_counts, read_index
+from lib.shared_utils import tracing
 
 from argparse import ArgumentParser
+from sys import stderr
 
 parser = ArgumentParser(description='Performs queries from a query file using a Dirichlet-smoothed query likelihood model.')
 parser.add_argument("index_path", help="the path to read the index from")
@@ -8,17 +10,34 @@ parser.add_argument("term_counts_path", help="the path to read the term counts f
 parser.add_argument("query_file_path", help="the path to a TSV query file containing query IDs and stopped, case-folded test queries")
 parser.add_argument("-r", help="the number of scores to output for each query", type=int, default=None)
 parser.add_argument("-l", help="the μ value for Dirichlet smoothing", type=float, default=0.1)
+parser.add_argument("--batch", help="score all queries at once using sparse matrix products", action='store_true')
+parser.add_argument("-cache", help="cache the ranked results of up to this many queries, so that repeated queries are answered without reading postings (hit and miss counts are printed to stderr)", type=int, default=None)
+parser.add_argument("--profile", help="trace each query and print its per-stage wall times and counters (postings touched, candidates scored, cache hits) as a JSON line to stderr (not with --batch)", action='store_true')
 
 args = parser.parse_args()
 
+if args.profile:
+    tracing.enable()
+
 # Read the term counts
 read_term_counts(args.term_counts_path)
 read_index(args.index_path)
 
+from lib.from_scratch.result_cache import ResultCache
 from lib.from_scratch.retrieval_model import DirichletQueryLikelihoodModel
 
 # Create the retrieval model
 model = DirichletQueryLikelihoodModel(args.l)
+if args.cache is not None:
+    model.result_cache = ResultCache(args.cache)
 
 # Perform the retrieval
-model.process_query_file(args.query_file_path, args.r)
\ No newline at end of file
+if args.batch:
+    model.process_query_file_batch(args.query_file_path, args.r)
+else:
+    model.process_query_file(args.query_file_path, args.r)
+
+if args.profile:
+    tracing.write_records(stderr)
+if args.cache is not None:
+    print("Result cache: %(hits)s hits, %(misses)s misses, %(entries)s entries" % model.result_cache.stats(), file=stderr)
\ No newline at end of file
@@ -0,0 +1,44 @@
+from lib.from_scratch.benchmark import MODELS, compare_results, run_benchmarks
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from json import dump as json_dump, load as json_load
+from subprocess import run, DEVNULL, PIPE
+from sys import stdout
+from tempfile import mkdtemp
+
+parser = ArgumentParser(description='Benchmarks index building and the retrieval models on a directory of parsed, tokenized text files (such as cacm-clean, or a collection written by generate_corpus.py): index build time and size, cold and warm startup, per-query latency percentiles and throughput.')
+parser.add_argument("input_directory", help="the directory to read text files from")
+parser.add_argument("query_file_path", help="the path to a TSV query file containing query IDs and stopped, case-folded test queries")
+parser.add_argument("-o", help="the path to write the results to as JSON (printed otherwise)", default=None)
+parser.add_argument("-index_dir", help="the directory to write the benchmarked indexes to (a temporary directory by default)", default=None)
+parser.add_argument("-models", help="the from scratch models to benchmark", nargs='+', choices=list(MODELS.keys()), default=list(MODELS.keys()))
+parser.add_argument("--nolucene", help="skip the Lucene benchmark", action='store_true')
+parser.add_argument("-workers", help="the number of processes indexing files in parallel", type=int, default=1)
+parser.add_argument("-r", help="the number of results ranked for each query", type=int, default=100)
+parser.add_argument("-repeats", help="the number of passes over the queries when measuring latency", type=int, default=3)
+parser.add_argument("-compare", help="the path of earlier results (JSON) to compare against; the relative change of every measurement is printed", default=None)
+
+# The benchmarks run in spawned processes, which import this script again
+if __name__ == "__main__":
+    args = parser.parse_args()
+    index_dir = args.index_dir if args.index_dir is not None else mkdtemp(prefix="benchmark-")
+    results = run_benchmarks(args.input_directory, index_dir, args.query_file_path, args.models, not args.nolucene, args.workers, args.r, args.repeats)
+
+    # Record what was measured, so that results can be compared between commits
+    commit = run(["git", "rev-parse", "HEAD"], stdout=PIPE, stderr=DEVNULL, universal_newlines=True)
+    results["commit"] = commit.stdout.strip() if commit.returncode == 0 else None
+    results["date"] = datetime.now(timezone.utc).isoformat()
+
+    if args.o is not None:
+        with open(args.o, "w") as output_file:
+            json_dump(results, output_file, indent=2)
+    else:
+        json_dump(results, stdout, indent=2)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare) as old_file:
+            old_results = json_load(old_file)
+        for path, old, new, change in compare_results(old_results, results):
+            print("%s: %.6g -> %.6g (%s)" % (path, old, new, "%+.1f%%" % (change * 100) if change is not None else "n/a"))
\ No newline at end of file
@@ -0,0 +1,14 @@
+from lib.shared_utils.summarizer import SentenceStore
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description='Segments and tokenizes the sentences of a directory of documents once, for generating snippets without reading the documents at query time.')
+parser.add_argument("files_path", help="the path to the documents (must be named with doc id)")
+parser.add_argument("files_ext", help="the extension for the documents")
+parser.add_argument("output_path", help="the path to write the sentence store to")
+
+args = parser.parse_args()
+
+store = SentenceStore()
+store.add_directory(args.files_path, args.files_ext)
+store.write(args.output_path)
\ No newline at end of file
@@ -0,0 +1,11 @@
+from lib.from_scratch.compact_index import convert_index_file
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description='Converts a pickled "from scratch" index to the compact (array-backed) index format.')
+parser.add_argument("index_path", help="the path to read the index from (e.g. index.p)")
+parser.add_argument("output_path", help="the path to write the compact index to")
+
+args = parser.parse_args()
+
+convert_index_file(args.index_path, args.output_path)
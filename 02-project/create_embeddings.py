@@ -1,7 +1,8 @@
+from lib.shared_utils.analyzer import Analyzer
+
 from argparse import ArgumentParser
 from gensim.models import Word2Vec
 from lxml import etree
-from re import sub
 
 import numpy as np
 import pandas as pd
@@ -19,10 +20,10 @@ parser.add_argument("title_count", help="the number of titles to read from the X
 
 args = parser.parse_args()
 
+analyzer = Analyzer()
+
 def tokenize_document_title(doc_title):
-    title = doc_title
-    title = sub('[^0-9a-zA-Z-]+', ' ', title)
-    return title.lower().split()
+    return analyzer.tokens(doc_title)
 
 def read_document_titles(file, to_read=3000000):
     document_titles = []
@@ -1,114 +1,74 @@
+from lib.shared_utils.evaluation import DEFAULT_K_VALUES, compare_runs, evaluate_runs, mean_scores, read_binary_relevance_file, read_result_file, write_json
+
 from argparse import ArgumentParser
-from collections import defaultdict
-from statistics import mean
+from os.path import basename, splitext
+from sys import stdout
 
-parser = ArgumentParser(description='Performs evaluation metrics based on a relevance file (assumed to be binary) and a retrieval results file.')
+parser = ArgumentParser(description='Performs evaluation metrics based on a relevance file (assumed to be binary) and one or more retrieval results files. With several results files, the others are compared against the first with paired significance tests.')
 parser.add_argument("relevance_file_path", help="the path to read the trec binary relevance file from")
-parser.add_argument("results_file_path", help="the path to read the trec results file from")
+parser.add_argument("results_file_paths", help="the paths to read the trec results files from", nargs='+')
+parser.add_argument("-k", help="the rank cutoffs for precision and NDCG at k", type=int, nargs='+', default=list(DEFAULT_K_VALUES))
+parser.add_argument("--json", help="print the metrics (per query and overall) and the comparisons as JSON", action='store_true')
 
 args = parser.parse_args()
 
-# FILE MANAGEMENT
-################################################################################
-
-# Applies `function` to the split content of each line in the file at `path`.
-def _apply_to_split_rows(path, function):
-    with open(path, 'r') as infile:
-        for line in infile.readlines():
-            content = line.split()
-            function(content)
-
-def read_binary_relevance_file(path):
-    # map of query_id -> set of relevant documents
-    relevant_docs = defaultdict(set)
-    # c[0] is query_id
-    # c[2] is doc_id
-    _apply_to_split_rows(path, lambda c: relevant_docs[c[0]].add(c[2]))
-    return relevant_docs
-
-def read_result_file(path):
-    # map of query_id -> ordered list of relevant documents
-    results = defaultdict(list)
-    # c[0] is query_id
-    # c[2] is doc_id
-    _apply_to_split_rows(path, lambda c: results[c[0]].append(c[2]))
-    return results
-
 relevance_data = read_binary_relevance_file(args.relevance_file_path)
-results_data = read_result_file(args.results_file_path)
+run_names = [splitext(basename(path))[0] for path in args.results_file_paths]
+runs = [read_result_file(path) for path in args.results_file_paths]
 
-# Average Precision
-################################################################################
+query_ids, scores = evaluate_runs(relevance_data, runs, args.k)
+means = mean_scores(scores)
+comparisons = compare_runs(scores) if len(runs) > 1 else None
 
-def precision(query_id, k):
-    relevant_documents = relevance_data[query_id]
-    retrieved_documents = set(results_data[query_id][:k])
-    return len(relevant_documents & retrieved_documents) / len(retrieved_documents)
-
-def average_precision(query_id):
-    return mean([precision(query_id, k) for k in range(1, len(results_data[query_id]) + 1)])
-
-def print_mean_average_precision():
+# Prints the metrics of the run `r` in the layout of the `eval_*.txt` files.
+# R-precision and NDCG are only printed with --json or several runs.
+def print_run(r):
     print("MEAN AVERAGE PRECISION")
     print("-" * 80)
-    print("MAP: ", mean([(average_precision(query_id)) for query_id in relevance_data.keys()]))
-    for query_id in relevance_data.keys():
-        print("Query %s : %s" % (query_id, average_precision(query_id)))
-
-
-
-# Reciprocal Rank
-################################################################################
-
-def reciprocal_rank(query_id):
-    query_results = results_data[query_id]
-    for i in range(0, len(query_results)):
-        if query_results[i] in relevance_data[query_id]:
-            return 1.0 / float(i + 1)
-    return float(0)
-
-def print_mean_reciprocal_rank():
+    print("MAP: ", means["map"][r])
+    for q, query_id in enumerate(query_ids):
+        print("Query %s : %s" % (query_id, scores["map"][r][q]))
+    print()
     print("MEAN RECIPROCAL RANK")
     print("-" * 80)
-    print("MRR: ", mean([(reciprocal_rank(query_id)) for query_id in relevance_data.keys()]))
-    for query_id in relevance_data.keys():
-        print("Query %s : %s" % (query_id, reciprocal_rank(query_id)))
-
-# P@K
-################################################################################
-
-def print_p_at_k(k_values):
+    print("MRR: ", means["mrr"][r])
+    for q, query_id in enumerate(query_ids):
+        print("Query %s : %s" % (query_id, scores["mrr"][r][q]))
+    print()
     print("PRECISION AT K")
     print("-" * 80)
-    for k in k_values:
-        print("Overall @k=%s: " % (k,), mean([(precision(query_id, k)) for query_id in relevance_data.keys()]))
-    for query_id in relevance_data.keys():
-        for k in k_values:
-            print("Query %s (k=%s): %s" % (query_id, k, precision(query_id, k)))
-
-# Precision and Recall
-################################################################################
-
-def recall(query_id, k):
-    relevant_documents = relevance_data[query_id]
-    retrieved_documents = set(results_data[query_id][:k])
-    return len(relevant_documents & retrieved_documents) / len(relevant_documents)
-
-def print_precision_and_recall():
+    for k in args.k:
+        print("Overall @k=%s: " % (k,), means["p@%s" % k][r])
+    for q, query_id in enumerate(query_ids):
+        for k in args.k:
+            print("Query %s (k=%s): %s" % (query_id, k, scores["p@%s" % k][r][q]))
+    print()
     print("PRECISION AND RECALL")
     print("-" * 80)
-    print("Overall Precision: ", mean([(precision(query_id, len(results_data[query_id]))) for query_id in relevance_data.keys()]))
-    print("Overall Recall: ", mean([(recall(query_id, len(results_data[query_id]))) for query_id in relevance_data.keys()]))
-    for query_id in relevance_data.keys():
-        print("Query %s : P=%s, R=%s" % (query_id, precision(query_id, len(results_data[query_id])), recall(query_id, len(results_data[query_id]))))
+    print("Overall Precision: ", means["precision"][r])
+    print("Overall Recall: ", means["recall"][r])
+    for q, query_id in enumerate(query_ids):
+        print("Query %s : P=%s, R=%s" % (query_id, scores["precision"][r][q], scores["recall"][r][q]))
 
-################################################################################
+def print_comparisons():
+    print("RUNS")
+    print("-" * 80)
+    metrics = list(scores.keys())
+    print("\t".join(["run"] + metrics))
+    for r, name in enumerate(run_names):
+        print("\t".join([name] + ["%.4f" % means[metric][r] for metric in metrics]))
+    print()
+    print("PAIRED SIGNIFICANCE TESTS (against %s)" % (run_names[0],))
+    print("-" * 80)
+    for r, comparison in enumerate(comparisons):
+        if comparison is not None:
+            for metric, (difference, t_pvalue, w_pvalue) in comparison.items():
+                print("%s %s: difference=%+.4f, t-test p=%.4g, wilcoxon p=%.4g" % (run_names[r], metric, difference, t_pvalue, w_pvalue))
 
 # Print it all...
-print_mean_average_precision()
-print()
-print_mean_reciprocal_rank()
-print()
-print_p_at_k([5, 20])
-print()
-print_precision_and_recall()
\ No newline at end of file
+if args.json:
+    write_json(stdout, run_names, query_ids, scores, comparisons)
+elif comparisons is None:
+    print_run(0)
+else:
+    print_comparisons()
\ No newline at end of file
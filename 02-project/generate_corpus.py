@@ -0,0 +1,16 @@
+from lib.shared_utils.synthetic_corpus import CorpusModel
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description='Generates a synthetic collection of parsed, tokenized text files that is statistically like a real one (term frequencies, vocabulary growth and document lengths) but larger, for benchmarking.')
+parser.add_argument("input_directory", help="the directory to read the real text files from (such as cacm-clean)")
+parser.add_argument("output_directory", help="the directory to write the synthetic text files to")
+parser.add_argument("-scale", help="the size of the synthetic collection, in number of documents, relative to the real one (e.g. 10 to 1000)", type=float, default=10)
+parser.add_argument("-seed", help="the random seed", type=int, default=0)
+
+args = parser.parse_args()
+
+model = CorpusModel.from_directory(args.input_directory)
+print("Zipf exponent %.3f, Heaps' law K=%.2f beta=%.3f" % (model.zipf_exponent, model.heaps_k, model.heaps_beta))
+num_docs, num_tokens = model.generate(args.output_directory, args.scale, args.seed)
+print("Wrote %d documents (%d tokens)" % (num_docs, num_tokens))
\ No newline at end of file
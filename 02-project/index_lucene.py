@@ -5,8 +5,9 @@ from argparse import ArgumentParser
 parser = ArgumentParser(description='Indexes documents from a directory of raw text (.txt) files.')
 parser.add_argument("input_directory", help="the directory to read HTML files from (will only read files with .html extension)")
 parser.add_argument("index_path", help="the path to write the index to")
+parser.add_argument("-docstore", help="the path to read the documents from instead, as a document store written by preprocess_cacm.py --store (input_directory is then ignored, and the clean text is indexed instead of the raw HTML)", default=None)
 
 args = parser.parse_args()
 
 # Index the documents
-index_documents(args.input_directory, args.index_path)
\ No newline at end of file
+index_documents(args.input_directory, args.index_path, args.docstore)
\ No newline at end of file
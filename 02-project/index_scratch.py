@@ -1,4 +1,7 @@
-from lib.from_scratch.indexer import index_documents, write_index, write_positional_index, write_term_counts
+from lib.from_scratch.indexer import index_documents, index_token_lists, read_segments, write_binary_index, write_document_norms, write_index, write_ngram_index, write_positional_index, write_spelling_index, write_term_counts
+from lib.from_scratch.ngram_index import MIN_FREQUENCY
+from lib.from_scratch.segments import open_segments
+from lib.shared_utils.article_processor import stream_documents
 
 from argparse import ArgumentParser
 
@@ -7,13 +10,31 @@ parser.add_argument("input_directory", help="the directory to read text files fr
 parser.add_argument("--uni", help="the output file for writing the unigram index")
 parser.add_argument("--bi", help="the output file for writing the bigram index")
 parser.add_argument("--tri", help="the output file for writing the trigram index")
+parser.add_argument("--ngrams", help="the output file for writing the compact bigram and trigram index used for phrase queries")
+parser.add_argument("--minfreq", help="the minimum collection frequency of the n-grams kept in the compact n-gram index", type=int, default=MIN_FREQUENCY)
+parser.add_argument("--spelling", help="the output file for writing the spelling index used for query suggestions")
 parser.add_argument("--pos", help="the output file for writing the positional index")
 parser.add_argument("--termcounts", help="the output file (CSV) for writing the count of terms in each document (includes non-unique terms)")
+parser.add_argument("--norms", help="the output file for writing the tf-idf vector norms of the documents (used by the vector space model)")
+parser.add_argument("--workers", help="the number of processes indexing files in parallel (the output is the same as with one)", type=int, default=1)
+parser.add_argument("--segments", help="a segmented index directory to update incrementally: new and changed files are indexed into a delta segment and removed files are deleted (the other outputs are written from the updated index)")
+parser.add_argument("--raw", help="read raw HTML documents from input_directory, preprocessing them in --workers processes and indexing the tokens as they are produced, without writing text files", action='store_true')
+parser.add_argument("--bin", help="the output file for writing the unigram index and term counts in the binary, memory-mapped format")
 
 args = parser.parse_args()
+if args.raw and args.segments is not None:
+    parser.error("--raw cannot be used with --segments")
 
 # Index the documents
-index_documents(args.input_directory)
+if args.segments is not None:
+    segmented_index = open_segments(args.segments)
+    segmented_index.update_directory(args.input_directory, args.workers)
+    segmented_index.wait()
+    read_segments(args.segments)
+elif args.raw:
+    index_token_lists(stream_documents(args.input_directory, args.workers))
+else:
+    index_documents(args.input_directory, args.workers)
 
 # Write indexes
 if args.uni is not None:
@@ -23,10 +44,26 @@ if args.bi is not None:
 if args.tri is not None:
     write_index(args.tri, n=3)
 
+# Write the compact n-gram index
+if args.ngrams is not None:
+    write_ngram_index(args.ngrams, args.minfreq)
+
+# Write the spelling index
+if args.spelling is not None:
+    write_spelling_index(args.spelling)
+
 # Write positional index for unigrams
 if args.pos is not None:
     write_positional_index(args.pos)
 
 # Write the [Document ID, Term count] table
 if args.termcounts is not None:
-    write_term_counts(args.termcounts, human_readable=False)
\ No newline at end of file
+    write_term_counts(args.termcounts, human_readable=False)
+
+# Write the tf-idf document vector norms
+if args.norms is not None:
+    write_document_norms(args.norms)
+
+# Write the unigram index and term counts in the binary format
+if args.bin is not None:
+    write_binary_index(args.bin)
\ No newline at end of file
@@ -0,0 +1,117 @@
+from csv import reader as csv_reader
+from scipy.sparse import csr_matrix
+import numpy as np
+
+# Reads a TSV query file, returning a list of (query ID, query string) rows
+def read_query_file(query_file_path):
+	with open(query_file_path) as query_file:
+		return [(query_row[0], query_row[1]) for query_row in csv_reader(query_file, delimiter='\t')]
+
+# The unigram index as a sparse term-document count matrix, used to score many
+# queries at once.
+#
+# Rows follow the iteration order of the index and columns follow docID order,
+# so that sums taken along a row of a query matrix add terms in the same order
+# as the per-query scorers, and ties can be broken on the column number.
+class TermDocumentMatrix:
+
+	def __init__(self, index, doc_lengths):
+		self.doc_ids = sorted(set(doc_lengths.keys()).union(doc_id for postings in index.values() for doc_id in postings.keys()))
+		columns = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+		self.term_rows = dict()
+		indptr = [0]
+		indices = []
+		data = []
+		for term, postings in index.items():
+			self.term_rows[term] = len(self.term_rows)
+			for column, count in sorted((columns[doc_id], count) for doc_id, count in postings.items() if count > 0):
+				indices.append(column)
+				data.append(count)
+			indptr.append(len(indices))
+
+		shape = (len(self.term_rows), len(self.doc_ids))
+		self.counts = csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)), shape=shape)
+
+		# Number of distinct terms in each document
+		self.unique_terms = np.bincount(self.counts.indices, minlength=len(self.doc_ids)).astype(np.float64)
+
+	# Returns a matrix with the same non-zero structure as the count matrix,
+	# holding `values` (in the order of `counts.data`) instead of the counts
+	def with_values(self, values):
+		return csr_matrix((np.asarray(values, dtype=np.float64), self.counts.indices, self.counts.indptr), shape=self.counts.shape)
+
+	# Returns the (columns, counts) arrays of the postings of `term`
+	def postings(self, term):
+		row = self.term_rows.get(term)
+		if row is None:
+			return (self.counts.indices[:0], self.counts.data[:0])
+		start, end = self.counts.indptr[row], self.counts.indptr[row + 1]
+		return (self.counts.indices[start:end], self.counts.data[start:end])
+
+	# Returns the slice of `counts.data` holding the postings of `term`
+	def posting_slice(self, term):
+		row = self.term_rows.get(term)
+		if row is None:
+			return slice(0, 0)
+		return slice(self.counts.indptr[row], self.counts.indptr[row + 1])
+
+	# Returns a sparse query-term matrix with one row per query. Each query is
+	# a list of (term, weight) pairs; terms missing from the index are dropped
+	# and the remaining entries are stored in the given order.
+	def query_matrix(self, weighted_queries):
+		indptr = [0]
+		indices = []
+		data = []
+		for weighted_terms in weighted_queries:
+			for term, weight in weighted_terms:
+				row = self.term_rows.get(term)
+				if row is not None:
+					indices.append(row)
+					data.append(weight)
+			indptr.append(len(indices))
+		shape = (len(weighted_queries), len(self.term_rows))
+		return csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)), shape=shape)
+
+	# Returns a sparse query-document matrix whose non-zero entries mark the
+	# documents containing at least one term of each query
+	def candidates(self, query_matrix):
+		query_pattern = csr_matrix((np.ones(query_matrix.nnz), query_matrix.indices, query_matrix.indptr), shape=query_matrix.shape)
+		return query_pattern @ self.with_values(np.ones(self.counts.nnz))
+
+	# Returns the candidate columns of row `row` of a candidate matrix
+	@staticmethod
+	def row_columns(matrix, row):
+		return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+	# Returns row `row` of a sparse score matrix as a dense array
+	def dense_row(self, matrix, row):
+		scores = np.zeros(len(self.doc_ids))
+		start, end = matrix.indptr[row], matrix.indptr[row + 1]
+		scores[matrix.indices[start:end]] = matrix.data[start:end]
+		return scores
+
+	# Returns the `num_results` best (docID, score) pairs among the `columns` of
+	# the dense score array `scores` (all of them if `num_results` is None),
+	# sorted by descending score and then by descending docID.
+	def top_documents(self, scores, columns, num_results=None):
+		columns = np.asarray(columns)
+		column_scores = scores[columns]
+		if num_results is not None and num_results < len(columns):
+			if num_results <= 0:
+				return []
+			# Keep everything tied with the k-th best score, so that ties are
+			# broken on docID below rather than by argpartition
+			best = np.argpartition(-column_scores, num_results - 1)[:num_results]
+			keep = column_scores >= column_scores[best].min()
+			columns, column_scores = columns[keep], column_scores[keep]
+		order = np.lexsort((-columns, -column_scores))
+		if num_results is not None:
+			order = order[:num_results]
+		return [(self.doc_ids[columns[i]], float(column_scores[i])) for i in order]
+
+# Prints ranked results in TREC format, one block of lines per query
+def print_trec_results(query_ids, ranked_results, run_name):
+	for query_id, docs in zip(query_ids, ranked_results):
+		lines = ["%s Q0 %s %s %s %s" % (query_id, doc_id, idx+1, score, run_name) for idx, (doc_id, score) in enumerate(docs)]
+		print("\n".join(lines))
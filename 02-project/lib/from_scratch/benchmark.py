@@ -0,0 +1,249 @@
+from .batch_scoring import read_query_file
+
+from glob import glob
+from importlib.util import find_spec
+from multiprocessing import get_context
+from os import makedirs
+from os.path import basename, getsize, join
+from time import perf_counter
+import numpy as np
+
+# Benchmarks of index building and of the retrieval models. Every measurement
+# runs in a freshly spawned process, so that startup includes importing the
+# modules and reading the index, and so that the module globals of the indexer
+# and the retrieval model start out empty.
+#
+# Startup is measured twice per model, in two processes one after the other:
+# "cold" is the first process after the index was built, "warm" the second,
+# which finds the modules compiled and the index files in the page cache.
+
+# Index files written by `build_index`, read by the model measurements
+INDEX_FILE = "index.p"
+TERM_COUNTS_FILE = "termcounts.p"
+NORMS_FILE = "norms.p"
+LUCENE_INDEX_DIRECTORY = "lucene_index"
+
+# Model name -> (retrieval model class name, whether the model needs the
+# document norms)
+MODELS = {
+	"bm25": ("BM25RetrievalModel", False),
+	"jm": ("JMQueryLikelihoodModel", False),
+	"dirichlet": ("DirichletQueryLikelihoodModel", False),
+	"vector": ("VectorSpaceRetrievalModel", True),
+}
+
+# Constructor arguments of the models, the defaults of the baseline scripts
+MODEL_ARGUMENTS = {
+	"BM25RetrievalModel": (),
+	"JMQueryLikelihoodModel": (0.1,),
+	"DirichletQueryLikelihoodModel": (2000,),
+	"VectorSpaceRetrievalModel": (),
+}
+
+# Latency percentiles reported for each model
+PERCENTILES = (50, 90, 95, 99)
+
+# Runs `function(*args)` in a new spawned process and returns its result
+# along with the wall time the process took, from starting it to returning
+def _run_in_process(function, *args):
+	start = perf_counter()
+	with get_context("spawn").Pool(1) as pool:
+		result = pool.apply(function, args)
+	return (result, perf_counter() - start)
+
+# Indexes the text files in `input_directory` with `workers` processes and
+# writes the index files to `output_dir`. Returns the build time, the number
+# of documents and the size of each index file.
+def build_index(input_directory, output_dir, workers=1):
+	result, _ = _run_in_process(_build_index, input_directory, output_dir, workers)
+	return result
+
+def _build_index(input_directory, output_dir, workers):
+	from . import indexer
+
+	makedirs(output_dir, exist_ok=True)
+	start = perf_counter()
+	indexer.index_documents(input_directory, workers)
+	index_s = perf_counter() - start
+	indexer.write_index(join(output_dir, INDEX_FILE))
+	indexer.write_term_counts(join(output_dir, TERM_COUNTS_FILE))
+	indexer.write_document_norms(join(output_dir, NORMS_FILE))
+	build_s = perf_counter() - start
+
+	sizes = {name: getsize(join(output_dir, name)) for name in (INDEX_FILE, TERM_COUNTS_FILE, NORMS_FILE)}
+	return {
+		"documents": len(indexer.term_counts),
+		"tokens": sum(indexer.term_counts.values()),
+		"terms": len(indexer.indexes[0]),
+		"workers": workers,
+		"index_s": index_s,
+		"build_s": build_s,
+		"files": sizes,
+		"size_bytes": sum(sizes.values()),
+	}
+
+# Measures the model `name` over the queries of `query_file_path`, with the
+# index files in `index_dir`: startup (cold and warm), per-query latency
+# percentiles over `repeats` passes over the queries, throughput, and the
+# throughput of batch scoring.
+def benchmark_model(name, index_dir, query_file_path, num_results=100, repeats=3):
+	cold, cold_process_s = _run_in_process(_measure_model, name, index_dir, query_file_path, num_results, repeats)
+	warm, warm_process_s = _run_in_process(_measure_model, name, index_dir, query_file_path, num_results, 0)
+	result = cold["queries"]
+	result["startup"] = {
+		"cold": dict(cold["startup"], process_s=cold_process_s),
+		"warm": dict(warm["startup"], process_s=warm_process_s),
+	}
+	return result
+
+# Returns the (ranked documents of `query_terms`) function of a model
+def _ranking_function(model, num_results):
+	if hasattr(model, "_ranked_results"):
+		return lambda query_terms: model._ranked_results(query_terms, num_results)
+	return lambda query_terms: model.ranked_documents(query_terms)[:num_results]
+
+def _measure_model(name, index_dir, query_file_path, num_results, repeats):
+	start = perf_counter()
+	from . import indexer
+	import_s = perf_counter() - start
+
+	load_start = perf_counter()
+	indexer.read_term_counts(join(index_dir, TERM_COUNTS_FILE))
+	indexer.read_index(join(index_dir, INDEX_FILE))
+	class_name, needs_norms = MODELS[name]
+	if needs_norms:
+		indexer.read_document_norms(join(index_dir, NORMS_FILE))
+	load_s = perf_counter() - load_start
+
+	# The retrieval model module reads the index when it is imported
+	model_start = perf_counter()
+	from . import retrieval_model
+	import_s += perf_counter() - model_start
+	model_start = perf_counter()
+	model = getattr(retrieval_model, class_name)(*MODEL_ARGUMENTS[class_name])
+	model_s = perf_counter() - model_start
+
+	queries = [retrieval_model._get_terms(query_string) for _, query_string in read_query_file(query_file_path)]
+	rank = _ranking_function(model, num_results)
+	query_start = perf_counter()
+	rank(queries[0])
+	first_query_s = perf_counter() - query_start
+	startup = {"load_s": load_s, "import_s": import_s, "model_s": model_s, "first_query_s": first_query_s, "total_s": perf_counter() - start}
+	if repeats == 0:
+		return {"startup": startup}
+
+	latencies = []
+	total_start = perf_counter()
+	for _ in range(repeats):
+		for query_terms in queries:
+			query_start = perf_counter()
+			rank(query_terms)
+			latencies.append(perf_counter() - query_start)
+	total_s = perf_counter() - total_start
+
+	result = {
+		"queries": len(queries),
+		"repeats": repeats,
+		"latency_ms": _latency_summary(latencies),
+		"throughput_qps": len(latencies) / total_s,
+	}
+	if hasattr(model, "batch_ranked_documents"):
+		batch_start = perf_counter()
+		model.batch_ranked_documents(queries, num_results)
+		result["batch_throughput_qps"] = len(queries) / (perf_counter() - batch_start)
+	return {"startup": startup, "queries": result}
+
+def _latency_summary(latencies):
+	milliseconds = np.array(latencies) * 1000
+	summary = {"mean": float(milliseconds.mean()), "max": float(milliseconds.max())}
+	for percentile in PERCENTILES:
+		summary["p%s" % percentile] = float(np.percentile(milliseconds, percentile))
+	return summary
+
+# Builds a Lucene index of the documents in `input_directory` in `output_dir`
+# and measures it like `benchmark_model`. Returns a "skipped" entry if
+# PyLucene is not installed.
+def benchmark_lucene(input_directory, output_dir, query_file_path, num_results=100, repeats=3):
+	if find_spec("lucene") is None:
+		return {"skipped": "PyLucene is not installed"}
+	index_path = join(output_dir, LUCENE_INDEX_DIRECTORY)
+	build, _ = _run_in_process(_build_lucene_index, input_directory, index_path)
+	cold, cold_process_s = _run_in_process(_measure_lucene, index_path, query_file_path, num_results, repeats)
+	warm, warm_process_s = _run_in_process(_measure_lucene, index_path, query_file_path, num_results, 0)
+	result = dict(build, **cold["queries"])
+	result["startup"] = {
+		"cold": dict(cold["startup"], process_s=cold_process_s),
+		"warm": dict(warm["startup"], process_s=warm_process_s),
+	}
+	return result
+
+def _build_lucene_index(input_directory, index_path):
+	from lib.lucene.basic_index_query import index_documents
+	start = perf_counter()
+	index_documents(input_directory, index_path)
+	build_s = perf_counter() - start
+	return {"build_s": build_s, "size_bytes": sum(getsize(path) for path in glob(join(index_path, "*")))}
+
+def _measure_lucene(index_path, query_file_path, num_results, repeats):
+	start = perf_counter()
+	from lib.lucene.basic_index_query import IndexSearcher, get_index_reader, initialize_lucene, perform_query
+	import_s = perf_counter() - start
+	initialize_lucene()
+	reader = get_index_reader(index_path)
+	searcher = IndexSearcher(reader)
+	load_s = perf_counter() - start - import_s
+
+	queries = [query_string for _, query_string in read_query_file(query_file_path)]
+	rank = lambda query_string: perform_query(reader, searcher, query_string, index_path, num_results, k=0)
+	query_start = perf_counter()
+	rank(queries[0])
+	first_query_s = perf_counter() - query_start
+	startup = {"load_s": load_s, "import_s": import_s, "first_query_s": first_query_s, "total_s": perf_counter() - start}
+	if repeats == 0:
+		return {"startup": startup}
+
+	latencies = []
+	total_start = perf_counter()
+	for _ in range(repeats):
+		for query_string in queries:
+			query_start = perf_counter()
+			rank(query_string)
+			latencies.append(perf_counter() - query_start)
+	total_s = perf_counter() - total_start
+	return {"startup": startup, "queries": {
+		"queries": len(queries),
+		"repeats": repeats,
+		"latency_ms": _latency_summary(latencies),
+		"throughput_qps": len(latencies) / total_s,
+	}}
+
+# Runs the whole suite on the text files in `input_directory`, writing the
+# indexes to `output_dir`, and returns the results as a dictionary
+def run_benchmarks(input_directory, output_dir, query_file_path, models=tuple(MODELS.keys()), include_lucene=True, workers=1, num_results=100, repeats=3):
+	results = {
+		"collection": basename(input_directory.rstrip("/")),
+		"query_file": basename(query_file_path),
+		"num_results": num_results,
+		"index": build_index(input_directory, output_dir, workers),
+		"models": dict(),
+	}
+	for name in models:
+		results["models"][name] = benchmark_model(name, output_dir, query_file_path, num_results, repeats)
+	if include_lucene:
+		results["models"]["lucene"] = benchmark_lucene(input_directory, output_dir, query_file_path, num_results, repeats)
+	return results
+
+# Returns rows of (metric path, old value, new value, relative change) for the
+# numeric values found in both benchmark results `old` and `new`
+def compare_results(old, new, path=""):
+	rows = []
+	for key, value in new.items():
+		if key not in old:
+			continue
+		key_path = "%s.%s" % (path, key) if path else key
+		if isinstance(value, dict) and isinstance(old[key], dict):
+			rows.extend(compare_results(old[key], value, key_path))
+		elif isinstance(value, (int, float)) and isinstance(old[key], (int, float)) and not isinstance(value, bool):
+			change = (value - old[key]) / old[key] if old[key] != 0 else None
+			rows.append((key_path, old[key], value, change))
+	return rows
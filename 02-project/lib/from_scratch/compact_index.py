@@ -0,0 +1,162 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from pickle import load as pickle_load, dump as pickle_dump
+
+# Returns an array holding the non-negative integers in `values`, using the
+# smallest unsigned item size that fits all of them
+def _smallest_array(values):
+	largest = max(values, default=0)
+	for typecode in ('B', 'H', 'I', 'Q'):
+		if largest < 2 ** (8 * array(typecode).itemsize):
+			return array(typecode, values)
+	raise OverflowError("posting value %s is too large" % largest)
+
+# An inverted index stored as contiguous posting buffers (CSR layout).
+#
+# DocIDs are interned as integers (their position in `doc_ids`) and each term
+# is mapped to a row in `terms`. The postings of row r are stored in
+# `posting_docs[offsets[r]:offsets[r+1]]` (sorted document numbers) and
+# `posting_counts[offsets[r]:offsets[r+1]]` (term frequencies).
+#
+# The class can be used in place of the nested defaultdict index (term ->
+# docID -> count) for reading: `index[term]` returns a `PostingList` mapping
+# docIDs to counts, and unknown terms and docIDs read as empty postings and
+# zero counts, without being inserted.
+class CompactIndex(Mapping):
+
+	def __init__(self, doc_ids, terms, offsets, posting_docs, posting_counts):
+		self.doc_ids = doc_ids
+		self.terms = terms
+		self.offsets = offsets
+		self.posting_docs = posting_docs
+		self.posting_counts = posting_counts
+		self.doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+	# Creates a compact index from an index in the nested dictionary format
+	# (term -> docID -> count). Postings with a count of zero are dropped.
+	@classmethod
+	def from_inverted_index(cls, inverted_index):
+		doc_ids = sorted(set(doc_id for postings in inverted_index.values() for doc_id in postings.keys()))
+		doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+		terms = dict()
+		offsets = array('q', [0])
+		posting_docs = []
+		posting_counts = []
+		for term in sorted(inverted_index.keys()):
+			postings = sorted((doc_numbers[doc_id], count) for doc_id, count in inverted_index[term].items() if count > 0)
+			terms[term] = len(terms)
+			posting_docs.extend(doc_number for doc_number, _ in postings)
+			posting_counts.extend(count for _, count in postings)
+			offsets.append(len(posting_docs))
+
+		return cls(doc_ids, terms, offsets, _smallest_array(posting_docs), _smallest_array(posting_counts))
+
+	# The docID lookup table is rebuilt on load rather than pickled
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state["doc_numbers"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.doc_numbers = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+	# Returns the (start, end) offsets of the postings for `term`
+	def _bounds(self, term):
+		row = self.terms.get(term)
+		if row is None:
+			return (0, 0)
+		return (self.offsets[row], self.offsets[row + 1])
+
+	# Returns a list of documents containing the term
+	def docs_containing(self, term):
+		start, end = self._bounds(term)
+		return [self.doc_ids[doc_number] for doc_number in self.posting_docs[start:end]]
+
+	# Returns the number of times `term` occurs in the document `doc_id`
+	def term_frequency(self, term, doc_id):
+		start, end = self._bounds(term)
+		doc_number = self.doc_numbers.get(doc_id)
+		if doc_number is None or start == end:
+			return 0
+		i = bisect_left(self.posting_docs, doc_number, start, end)
+		if i < end and self.posting_docs[i] == doc_number:
+			return self.posting_counts[i]
+		return 0
+
+	# Returns the number of documents containing `term`
+	def document_frequency(self, term):
+		start, end = self._bounds(term)
+		return end - start
+
+	# Returns the total number of occurrences of `term` in the collection
+	def collection_frequency(self, term):
+		start, end = self._bounds(term)
+		return sum(self.posting_counts[start:end])
+
+	def __getitem__(self, term):
+		return PostingList(self, term)
+
+	def __contains__(self, term):
+		return term in self.terms
+
+	def __iter__(self):
+		return iter(self.terms)
+
+	def __len__(self):
+		return len(self.terms)
+
+	def get(self, term, default=None):
+		return PostingList(self, term) if term in self.terms else default
+
+	# The index is read-only, so copies can share it
+	def __copy__(self):
+		return self
+
+	def __deepcopy__(self, memo):
+		return self
+
+# A read-only view of the postings of one term in a `CompactIndex`, mapping
+# docIDs to counts.
+class PostingList(Mapping):
+
+	def __init__(self, compact_index, term):
+		self.compact_index = compact_index
+		self.term = term
+		self.start, self.end = compact_index._bounds(term)
+
+	def __getitem__(self, doc_id):
+		return self.compact_index.term_frequency(self.term, doc_id)
+
+	def __contains__(self, doc_id):
+		return self.compact_index.term_frequency(self.term, doc_id) > 0
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return self.end - self.start
+
+	def keys(self):
+		doc_ids = self.compact_index.doc_ids
+		return [doc_ids[doc_number] for doc_number in self.compact_index.posting_docs[self.start:self.end]]
+
+	def values(self):
+		return list(self.compact_index.posting_counts[self.start:self.end])
+
+	def items(self):
+		return list(zip(self.keys(), self.compact_index.posting_counts[self.start:self.end]))
+
+	def copy(self):
+		return dict(self.items())
+
+# Converts the pickled index at `input_path` (e.g. `index.p` or `stem_index.p`)
+# to a compact index and writes it to `output_path`. The output can be read
+# with `read_index` like the original file.
+def convert_index_file(input_path, output_path):
+	with open(input_path, "rb") as input_file:
+		inverted_index = pickle_load(input_file)
+	with open(output_path, "wb") as output_file:
+		pickle_dump(CompactIndex.from_inverted_index(inverted_index), output_file)
@@ -0,0 +1,313 @@
+from .compact_index import _smallest_array
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+# A positional index (term -> docID -> positions) with compressed postings.
+#
+# Documents are numbered in the order they are added, and the postings of each
+# term are stored in one contiguous buffer of variable-byte encoded integers.
+# For every document containing the term, the buffer holds:
+#
+#   document number gap    (from the previous document containing the term)
+#   byte length            of the position gaps that follow
+#   position gaps          d-gaps of the term's positions in the document
+#
+# The byte length lets lookups skip over documents without decoding their
+# positions, and positions are only decoded when a posting is read. Looking up
+# a document in the postings of a term builds a table of the document numbers
+# and position offsets of the term the first time, so that later lookups are
+# binary searches; the table is dropped when postings are added to the term.
+#
+# Like the nested dictionary format, `index[term][docID]` returns the d-gaps of
+# the term's positions (an empty list for unknown terms and docIDs); use
+# `positions` for the absolute positions.
+class CompressedPositionalIndex(Mapping):
+
+	def __init__(self):
+		self.doc_ids = []
+		self.doc_numbers = dict()
+		# term -> buffer of encoded postings (a bytearray, or a read-only
+		# slice of the pickled buffer until postings are added)
+		self.buffers = dict()
+		# term -> number of the last document in its postings, filled in as
+		# postings are added
+		self.last_docs = dict()
+		# term -> (document numbers, start offsets, end offsets) of the
+		# encoded position gaps of its postings, filled in by `_doc_table`
+		self.doc_tables = dict()
+
+	# Pickles the buffers of all terms as a single buffer with offsets; the
+	# docID lookup table and the last documents are rebuilt when needed
+	def __getstate__(self):
+		offsets = [0]
+		for buffer in self.buffers.values():
+			offsets.append(offsets[-1] + len(buffer))
+		return {"doc_ids": self.doc_ids, "terms": list(self.buffers.keys()), "offsets": _smallest_array(offsets), "buffer": b"".join(self.buffers.values())}
+
+	def __setstate__(self, state):
+		self.doc_ids = state["doc_ids"]
+		self.doc_numbers = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+		view = memoryview(state["buffer"])
+		offsets = state["offsets"]
+		self.buffers = {term: view[offsets[i]:offsets[i + 1]] for i, term in enumerate(state["terms"])}
+		self.last_docs = dict()
+		self.doc_tables = dict()
+
+	# Returns the buffer of `term` as a bytearray that postings can be added to
+	def _writable_buffer(self, term):
+		buffer = self.buffers[term]
+		if not isinstance(buffer, bytearray):
+			self.last_docs[term] = self._last_doc(term)
+			buffer = self.buffers[term] = bytearray(buffer)
+		return buffer
+
+	def _last_doc(self, term):
+		if term not in self.last_docs:
+			for doc_number, _ in self._encoded_postings(term):
+				self.last_docs[term] = doc_number
+		return self.last_docs[term]
+
+	# Adds a document, given a dictionary of term -> increasing list of
+	# positions. The document must not already be in the index.
+	def add_document(self, doc_id, term_positions):
+		doc_number = len(self.doc_ids)
+		self.doc_ids.append(doc_id)
+		self.doc_numbers[doc_id] = doc_number
+		for term, positions in term_positions.items():
+			gaps = bytearray()
+			previous = 0
+			for position in positions:
+				_encode(position - previous, gaps)
+				previous = position
+			self._append_posting(term, doc_number, gaps)
+
+	def _append_posting(self, term, doc_number, encoded_gaps):
+		self.doc_tables.pop(term, None)
+		if term not in self.buffers:
+			buffer = self.buffers[term] = bytearray()
+			_encode(doc_number, buffer)
+		else:
+			buffer = self._writable_buffer(term)
+			_encode(doc_number - self.last_docs[term], buffer)
+		self.last_docs[term] = doc_number
+		_encode(len(encoded_gaps), buffer)
+		buffer += encoded_gaps
+
+	# Appends the documents of `other`, which must all be new to this index,
+	# after the documents already added. Encoded positions are copied as is;
+	# only the first document gap of each term is re-encoded.
+	def merge(self, other):
+		base = len(self.doc_ids)
+		for doc_id in other.doc_ids:
+			self.doc_numbers[doc_id] = len(self.doc_ids)
+			self.doc_ids.append(doc_id)
+		for term, other_buffer in other.buffers.items():
+			self.doc_tables.pop(term, None)
+			first_doc, offset = _decode(other_buffer, 0)
+			if term not in self.buffers:
+				buffer = self.buffers[term] = bytearray()
+				_encode(base + first_doc, buffer)
+			else:
+				buffer = self._writable_buffer(term)
+				_encode(base + first_doc - self.last_docs[term], buffer)
+			buffer += other_buffer[offset:]
+			self.last_docs[term] = base + other._last_doc(term)
+
+	# Returns a copy of the index without the documents in `doc_ids`
+	def without(self, doc_ids):
+		result = CompressedPositionalIndex()
+		for doc_id in self.doc_ids:
+			if doc_id not in doc_ids:
+				result.doc_numbers[doc_id] = len(result.doc_ids)
+				result.doc_ids.append(doc_id)
+		for term in self.buffers:
+			for doc_number, encoded_gaps in self._encoded_postings(term):
+				doc_id = self.doc_ids[doc_number]
+				if doc_id not in doc_ids:
+					result._append_posting(term, result.doc_numbers[doc_id], encoded_gaps)
+		return result
+
+	# Yields the (document number, encoded position gaps) of each posting of
+	# `term`, without decoding the positions
+	def _encoded_postings(self, term):
+		buffer = self.buffers.get(term, b"")
+		offset = 0
+		doc_number = 0
+		while offset < len(buffer):
+			gap, offset = _decode(buffer, offset)
+			doc_number += gap
+			length, offset = _decode(buffer, offset)
+			yield (doc_number, buffer[offset:offset + length])
+			offset += length
+
+	# Returns the (document numbers, start offsets, end offsets) of the encoded
+	# position gaps of the postings of `term`, decoding the postings the first
+	# time
+	def _doc_table(self, term):
+		table = self.doc_tables.get(term)
+		if table is None:
+			doc_numbers = array('q')
+			starts = array('q')
+			ends = array('q')
+			cursor = self.cursor(term)
+			while cursor.doc_number is not None:
+				doc_numbers.append(cursor.doc_number)
+				starts.append(cursor.start)
+				ends.append(cursor.end)
+				cursor.next()
+			table = self.doc_tables[term] = (doc_numbers, starts, ends)
+		return table
+
+	# Returns the index of the posting of the document numbered `doc_number` in
+	# the table of `term`, or None if the term does not occur in the document
+	def _posting_index(self, term, doc_number):
+		doc_numbers = self._doc_table(term)[0]
+		i = bisect_left(doc_numbers, doc_number)
+		return i if i < len(doc_numbers) and doc_numbers[i] == doc_number else None
+
+	# Returns a `PostingCursor` over the postings of `term`
+	def cursor(self, term):
+		return PostingCursor(self.buffers.get(term, b""))
+
+	# Returns the position d-gaps of `term` in the document `doc_id`
+	def position_gaps(self, term, doc_id):
+		doc_number = self.doc_numbers.get(doc_id)
+		if doc_number is None or term not in self.buffers:
+			return []
+		i = self._posting_index(term, doc_number)
+		if i is None:
+			return []
+		_, starts, ends = self._doc_table(term)
+		return _decode_all(self.buffers[term][starts[i]:ends[i]])
+
+	# Returns the positions of `term` in the document `doc_id`
+	def positions(self, term, doc_id):
+		return _running_sums(self.position_gaps(term, doc_id))
+
+	def __getitem__(self, term):
+		return PositionPostings(self, term)
+
+	def __contains__(self, term):
+		return term in self.buffers
+
+	def __iter__(self):
+		return iter(self.buffers)
+
+	def __len__(self):
+		return len(self.buffers)
+
+	def get(self, term, default=None):
+		return PositionPostings(self, term) if term in self.buffers else default
+
+# A read-only view of the postings of one term in a `CompressedPositionalIndex`,
+# mapping docIDs to position d-gaps. Iterating decodes one posting at a time.
+class PositionPostings(Mapping):
+
+	def __init__(self, positional_index, term):
+		self.positional_index = positional_index
+		self.term = term
+
+	def __getitem__(self, doc_id):
+		return self.positional_index.position_gaps(self.term, doc_id)
+
+	def __contains__(self, doc_id):
+		doc_number = self.positional_index.doc_numbers.get(doc_id)
+		return doc_number is not None and self.term in self.positional_index.buffers and self.positional_index._posting_index(self.term, doc_number) is not None
+
+	def __iter__(self):
+		doc_ids = self.positional_index.doc_ids
+		return (doc_ids[doc_number] for doc_number, _ in self.positional_index._encoded_postings(self.term))
+
+	def __len__(self):
+		if self.term not in self.positional_index.buffers:
+			return 0
+		return len(self.positional_index._doc_table(self.term)[0])
+
+	# Yields the (docID, position d-gaps) of each posting
+	def items(self):
+		doc_ids = self.positional_index.doc_ids
+		return ((doc_ids[doc_number], _decode_all(encoded_gaps)) for doc_number, encoded_gaps in self.positional_index._encoded_postings(self.term))
+
+	# Yields the (docID, positions) of each posting
+	def positions(self):
+		return ((doc_id, _running_sums(gaps)) for doc_id, gaps in self.items())
+
+# A forward-only cursor over the postings of one term, for merging postings
+# lists. `doc_number` is the current document (None once exhausted); moving to
+# a later document skips the encoded positions in between without decoding
+# them.
+class PostingCursor:
+
+	def __init__(self, buffer):
+		self.buffer = buffer
+		self.offset = 0
+		self.doc_number = -1
+		self.start = self.end = 0
+		self.next()
+
+	# Moves to the next posting
+	def next(self):
+		if self.end >= len(self.buffer):
+			self.doc_number = None
+			return
+		gap, offset = _decode(self.buffer, self.end)
+		length, self.start = _decode(self.buffer, offset)
+		self.end = self.start + length
+		self.doc_number = gap if self.doc_number < 0 else self.doc_number + gap
+
+	# Moves to the first posting with a document number of at least
+	# `doc_number`
+	def skip_to(self, doc_number):
+		while self.doc_number is not None and self.doc_number < doc_number:
+			self.next()
+
+	# Returns the positions of the term in the current document
+	def positions(self):
+		positions = []
+		position = 0
+		offset = self.start
+		while offset < self.end:
+			gap, offset = _decode(self.buffer, offset)
+			position += gap
+			positions.append(position)
+		return positions
+
+# Appends the variable-byte encoding of the non-negative integer `value` to
+# `buffer`: 7 bits per byte, least significant first, with the high bit set on
+# the last byte.
+def _encode(value, buffer):
+	while value >= 0x80:
+		buffer.append(value & 0x7F)
+		value >>= 7
+	buffer.append(value | 0x80)
+
+# Decodes the integer starting at `offset` in `buffer`, returning it and the
+# offset following it
+def _decode(buffer, offset):
+	value = 0
+	shift = 0
+	while True:
+		byte = buffer[offset]
+		offset += 1
+		if byte & 0x80:
+			return (value | ((byte & 0x7F) << shift), offset)
+		value |= byte << shift
+		shift += 7
+
+def _decode_all(buffer):
+	values = []
+	offset = 0
+	while offset < len(buffer):
+		value, offset = _decode(buffer, offset)
+		values.append(value)
+	return values
+
+def _running_sums(gaps):
+	result = []
+	current_sum = 0
+	for gap in gaps:
+		current_sum += gap
+		result.append(current_sum)
+	return result
@@ -0,0 +1,212 @@
+from .compact_index import CompactIndex, _smallest_array
+
+from array import array
+from collections.abc import Mapping, Sequence
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+# Binary index file format (version 1), little-endian:
+#
+#   header                 see `HEADER` below
+#   doc name offsets       uint64[num_docs + 1], into the doc name blob
+#   doc name blob          UTF-8 docIDs, sorted by their encoded bytes
+#   doc lengths            uint64[num_docs], the term count of each document
+#   term name offsets      uint64[num_terms + 1], into the term name blob
+#   term name blob         UTF-8 terms, sorted by their encoded bytes
+#   posting offsets        uint64[num_terms + 1], into the posting arrays
+#   posting docs           document numbers, sorted within each term
+#   posting counts         term frequencies
+#
+# Every section starts on an 8-byte boundary. The file holds both the unigram
+# index and the term counts, and is opened with mmap so that nothing but the
+# header is read up front; postings are read from the page cache when used.
+MAGIC = b"CACMIDX\0"
+VERSION = 1
+
+# magic, version, posting docs typecode, posting counts typecode, num_docs,
+# num_terms, num_postings, and the offsets of the eight sections
+HEADER = Struct("<8sIcc2xQQQ8Q")
+
+# Returns whether the file at `path` is a binary index file
+def is_index_file(path):
+	with open(path, "rb") as input_file:
+		return input_file.read(len(MAGIC)) == MAGIC
+
+# Writes the unigram index `index` (term -> docID -> count) and the term counts
+# `term_counts` (docID -> count) to `output_path` in the binary format.
+def write_index_file(output_path, index, term_counts):
+	doc_ids = sorted(set(term_counts.keys()).union(doc_id for postings in index.values() for doc_id in postings.keys()), key=lambda doc_id: doc_id.encode("utf-8"))
+	doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+	terms = sorted(index.keys(), key=lambda term: term.encode("utf-8"))
+
+	posting_offsets = array('Q', [0])
+	posting_docs = []
+	posting_counts = []
+	for term in terms:
+		postings = sorted((doc_numbers[doc_id], count) for doc_id, count in index[term].items() if count > 0)
+		posting_docs.extend(doc_number for doc_number, _ in postings)
+		posting_counts.extend(count for _, count in postings)
+		posting_offsets.append(len(posting_docs))
+	posting_docs = _smallest_array(posting_docs)
+	posting_counts = _smallest_array(posting_counts)
+
+	doc_name_offsets, doc_name_blob = _string_table_buffers(doc_ids)
+	term_name_offsets, term_name_blob = _string_table_buffers(terms)
+	sections = [
+		doc_name_offsets.tobytes(),
+		doc_name_blob,
+		array('Q', [term_counts.get(doc_id, 0) for doc_id in doc_ids]).tobytes(),
+		term_name_offsets.tobytes(),
+		term_name_blob,
+		posting_offsets.tobytes(),
+		posting_docs.tobytes(),
+		posting_counts.tobytes(),
+	]
+
+	with open(output_path, "wb") as output_file:
+		position = _aligned(HEADER.size)
+		section_offsets = []
+		for section in sections:
+			section_offsets.append(position)
+			position = _aligned(position + len(section))
+
+		output_file.write(HEADER.pack(MAGIC, VERSION, posting_docs.typecode.encode("ascii"), posting_counts.typecode.encode("ascii"), len(doc_ids), len(terms), len(posting_docs), *section_offsets))
+		for offset, section in zip(section_offsets, sections):
+			output_file.write(b"\0" * (offset - output_file.tell()))
+			output_file.write(section)
+
+def _aligned(position):
+	return (position + 7) // 8 * 8
+
+# Returns the (offsets, blob) buffers for a list of strings
+def _string_table_buffers(strings):
+	encoded = [string.encode("utf-8") for string in strings]
+	offsets = array('Q', [0])
+	for value in encoded:
+		offsets.append(offsets[-1] + len(value))
+	return (offsets, b"".join(encoded))
+
+# A sorted table of strings read from a memory-mapped buffer. It works as a
+# sequence (position -> string) and, through `get`, as a lookup table (string
+# -> position) using binary search, so it can stand in for both the `doc_ids`
+# list and the `terms`/`doc_numbers` dictionaries of a `CompactIndex`.
+class StringTable(Sequence):
+
+	def __init__(self, offsets, blob):
+		self.offsets = offsets
+		self.blob = blob
+		# Positions of strings that have already been looked up
+		self.positions = dict()
+
+	def _encoded(self, i):
+		return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError("string table index out of range")
+		return self._encoded(i).decode("utf-8")
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __iter__(self):
+		return (self[i] for i in range(len(self)))
+
+	def __contains__(self, string):
+		return self.get(string) is not None
+
+	# Returns the position of `string` in the table, or `default` if absent
+	def get(self, string, default=None):
+		position = self.positions.get(string)
+		if position is None:
+			position = self._search(string)
+			if position is None:
+				return default
+			self.positions[string] = position
+		return position
+
+	def _search(self, string):
+		if not isinstance(string, str):
+			return None
+		key = string.encode("utf-8")
+		low, high = 0, len(self)
+		while low < high:
+			middle = (low + high) // 2
+			if self._encoded(middle) < key:
+				low = middle + 1
+			else:
+				high = middle
+		if low < len(self) and self._encoded(low) == key:
+			return low
+		return None
+
+# A read-only view of the document lengths in a binary index file, mapping
+# docIDs to term counts. Like the term counts dictionary, unknown docIDs read as
+# zero.
+class DocLengths(Mapping):
+
+	def __init__(self, doc_ids, lengths):
+		self.doc_ids = doc_ids
+		self.lengths = lengths
+
+	def __getitem__(self, doc_id):
+		doc_number = self.doc_ids.get(doc_id)
+		return 0 if doc_number is None else self.lengths[doc_number]
+
+	def __contains__(self, doc_id):
+		return doc_id in self.doc_ids
+
+	def __iter__(self):
+		return iter(self.doc_ids)
+
+	def __len__(self):
+		return len(self.doc_ids)
+
+	def values(self):
+		return self.lengths.tolist()
+
+# A `CompactIndex` read directly from a memory-mapped binary index file.
+# Opening the file only parses its header; the term and docID tables are
+# searched in place and postings are read lazily, so several processes
+# opening the same file share one copy in the page cache.
+class MappedIndex(CompactIndex):
+
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as input_file:
+			self.buffer = mmap(input_file.fileno(), 0, access=ACCESS_READ)
+
+		header = HEADER.unpack_from(self.buffer, 0)
+		magic, version, docs_typecode, counts_typecode, num_docs, num_terms, num_postings = header[:7]
+		section_offsets = header[7:]
+		if magic != MAGIC:
+			raise ValueError("%s is not a binary index file" % path)
+		if version != VERSION:
+			raise ValueError("%s has index file version %s, expected %s" % (path, version, VERSION))
+
+		view = memoryview(self.buffer)
+		def section(i, typecode, length):
+			start = section_offsets[i]
+			return view[start:start + length * array(typecode).itemsize].cast(typecode)
+
+		doc_name_offsets = section(0, 'Q', num_docs + 1)
+		doc_name_blob = section(1, 'B', doc_name_offsets[-1])
+		term_name_offsets = section(3, 'Q', num_terms + 1)
+		term_name_blob = section(4, 'B', term_name_offsets[-1])
+
+		self.doc_ids = StringTable(doc_name_offsets, doc_name_blob)
+		self.doc_numbers = self.doc_ids
+		self.terms = StringTable(term_name_offsets, term_name_blob)
+		self.offsets = section(5, 'Q', num_terms + 1)
+		self.posting_docs = section(6, docs_typecode.decode("ascii"), num_postings)
+		self.posting_counts = section(7, counts_typecode.decode("ascii"), num_postings)
+		self.doc_lengths = DocLengths(self.doc_ids, section(2, 'Q', num_docs))
+
+	# Pickles by path, so other processes map the same file
+	def __reduce__(self):
+		return (MappedIndex, (self.path,))
+
+	def __iter__(self):
+		return iter(self.terms)
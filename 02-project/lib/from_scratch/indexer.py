@@ -1,31 +1,88 @@
+from .compact_index import _smallest_array
+from .compressed_positions import CompressedPositionalIndex
+from .index_file import MappedIndex, is_index_file, write_index_file
+from .ngram_index import MIN_FREQUENCY, NGramIndex
+from .proximity import UnorderedWindow
+from .spell_corrector import SpellingIndex
+
 from collections import defaultdict
 from csv import writer as csvwriter
 from functools import partial
 from glob import glob
+from math import log, sqrt
+from multiprocessing import Pool
 from nltk import ngrams
-from os.path import basename, join, splitext
+from os.path import basename, getsize, isdir, join, splitext
 from pickle import load as pickle_load, dump as pickle_dump
 
 INDEX_FILE_PATTERN = "*.txt"
 MAX_N = 3
 
+# Number of shards given to each worker process by `index_documents`, so that
+# workers finishing early can take more files
+SHARDS_PER_WORKER = 4
+
 # Index: maps term -> docID -> count
 indexes = [defaultdict(partial(defaultdict, int)) for i in range(MAX_N)]
 
 # TermCounts: maps docID to term count
 term_counts = defaultdict(int)
 
-# PositionalIndex: term -> docID -> positions
-positional_index = defaultdict(partial(defaultdict, list))
+# PositionalIndex: term -> docID -> position d-gaps, compressed (see
+# `CompressedPositionalIndex`)
+positional_index = CompressedPositionalIndex()
+
+# DocumentNorms: maps docID to the length of its tf-idf vector
+document_norms = dict()
+
+# NGramIndex: compact bigram and trigram index used for phrases, when read
+ngram_index = None
+
+# SpellingIndex: spelling suggestions and term frequencies, when read
+spelling_index = None
+
+# Generation of the data structures: incremented whenever they are read or
+# documents are indexed, so that results computed from earlier structures can
+# be told apart (see `ResultCache`)
+generation = 0
+
+# Returns the generation of the data structures
+def current_generation():
+	return generation
+
+def _next_generation():
+	global generation
+	generation += 1
 
 def read_tokenized_document(path):
 	with open(path, "r") as text_file:
 		return text_file.read().split()
 
+# Returns the docID of the document at `path`
+def document_id(path):
+	return splitext(basename(path))[0]
+
+# Returns a new, empty (indexes, term counts, positional index) triple, in the
+# format of the module's data structures
+def new_index_structures():
+	return ([defaultdict(partial(defaultdict, int)) for i in range(MAX_N)], defaultdict(int), CompressedPositionalIndex())
+
 def index_document(path):
-	docID = splitext(basename(path))[0]
-	doc = read_tokenized_document(path)
-	
+	_next_generation()
+	_index_document(path, indexes, term_counts, positional_index)
+
+def _index_document(path, indexes, term_counts, positional_index):
+	_index_tokens(document_id(path), read_tokenized_document(path), indexes, term_counts, positional_index)
+
+# Indexes the (docID, token list) pairs in `documents`, such as the documents
+# streamed from the preprocessor by `stream_documents`, without reading text
+# files
+def index_token_lists(documents):
+	_next_generation()
+	for docID, doc in documents:
+		_index_tokens(docID, doc, indexes, term_counts, positional_index)
+
+def _index_tokens(docID, doc, indexes, term_counts, positional_index):
 	# Update index for n-grams
 	for n in range(MAX_N):
 		terms = doc if n == 0 else ngrams(doc, n + 1)
@@ -36,14 +93,137 @@ def index_document(path):
 	#term_counts[docID] = len(set(doc)) # Update term counts, if unique
 		
 	# Update positional index
+	term_positions = defaultdict(list)
 	for (i, term) in enumerate(doc):
-		position_list = positional_index[term][docID]
-		position_list.append(i - sum(position_list))
-		positional_index[term][docID] = position_list
+		term_positions[term].append(i)
+	positional_index.add_document(docID, term_positions)
+
+# Indexes the text files in `directory`. With more than one worker, disjoint
+# shards of the files are indexed in separate processes and merged; the
+# resulting data structures (and the files written from them) are identical
+# to those of a serial build.
+def index_documents(directory, workers=1):
+	file_paths = glob(join(directory, INDEX_FILE_PATTERN))
+	if workers <= 1:
+		for file_path in file_paths:
+			index_document(file_path)
+		return
+	_next_generation()
+	index_files(file_paths, workers, (indexes, term_counts, positional_index))
+
+# Indexes the files in `file_paths` into new data structures, returned as an
+# (indexes, term counts, positional index) triple, using `workers` processes.
+# If `structures` is given, the documents are added to it instead.
+#
+# Workers send their shards back in the compact form of `_compact_shard`,
+# which pickles several times faster than nested dictionaries. Rebuilding the
+# dictionaries from it still happens in this process, so this part of the
+# work does not shrink with more workers.
+def index_files(file_paths, workers=1, structures=None):
+	if workers <= 1:
+		shard = _index_shard(file_paths)
+		if structures is None:
+			return shard
+		merge_index_structures(structures, shard)
+		return structures
+
+	if structures is None:
+		structures = new_index_structures()
+	with Pool(workers) as pool:
+		# Shards are merged in file order as they complete
+		for shard in pool.imap(_index_compact_shard, _shards(file_paths, workers * SHARDS_PER_WORKER)):
+			_merge_compact_shard(structures, shard)
+	return structures
+
+# Splits `file_paths` into at most `num_shards` contiguous runs of files of
+# roughly equal total size. Shards must be contiguous so that merging them in
+# order inserts terms and docIDs in the same order as a serial build.
+def _shards(file_paths, num_shards):
+	sizes = [getsize(file_path) for file_path in file_paths]
+	shard_size = sum(sizes) / num_shards
+	shards = []
+	shard = []
+	size = 0
+	for file_path, file_size in zip(file_paths, sizes):
+		shard.append(file_path)
+		size += file_size
+		if size >= shard_size * (len(shards) + 1):
+			shards.append(shard)
+			shard = []
+	if len(shard) > 0:
+		shards.append(shard)
+	return shards
+
+# Indexes the files in `file_paths` into new data structures, returning the
+# partial (indexes, term counts, positional index) for the shard. Runs in a
+# worker process when indexing in parallel.
+def _index_shard(file_paths):
+	structures = new_index_structures()
+	for file_path in file_paths:
+		_index_document(file_path, *structures)
+	return structures
+
+def _index_compact_shard(file_paths):
+	return _compact_shard(_index_shard(file_paths))
+
+# Returns the (indexes, term counts, positional index) triple of a shard as
+# (docIDs, term counts, postings, positional index), where the docIDs and the
+# term counts are in indexing order, and the postings of each n-gram index are
+# (terms, offsets, document numbers, counts): the postings of `terms[i]` are
+# the documents numbered `document_numbers[offsets[i]:offsets[i+1]]` (indexes
+# into the docIDs) with the same slice of `counts`.
+def _compact_shard(structures):
+	shard_indexes, shard_term_counts, shard_positional_index = structures
+	doc_ids = list(shard_term_counts.keys())
+	doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+	postings = []
+	for index in shard_indexes:
+		offsets = [0]
+		numbers = []
+		counts = []
+		for term_postings in index.values():
+			numbers.extend(map(doc_numbers.__getitem__, term_postings.keys()))
+			counts.extend(term_postings.values())
+			offsets.append(len(numbers))
+		postings.append((list(index.keys()), _smallest_array(offsets), _smallest_array(numbers), _smallest_array(counts)))
+	return (doc_ids, _smallest_array(list(shard_term_counts.values())), postings, shard_positional_index)
+
+# Merges a shard in the form of `_compact_shard` into `target`, like
+# `merge_index_structures`
+def _merge_compact_shard(target, shard):
+	target_indexes, target_term_counts, target_positional_index = target
+	doc_ids, shard_term_counts, postings, shard_positional_index = shard
+	for index, (terms, offsets, numbers, counts) in zip(target_indexes, postings):
+		doc_id_list = list(map(doc_ids.__getitem__, numbers))
+		counts = counts.tolist()
+		for i, term in enumerate(terms):
+			start, end = offsets[i], offsets[i + 1]
+			term_postings = zip(doc_id_list[start:end], counts[start:end])
+			if term in index:
+				index[term].update(term_postings)
+			else:
+				index[term] = defaultdict(int, term_postings)
+	target_term_counts.update(zip(doc_ids, shard_term_counts))
+	target_positional_index.merge(shard_positional_index)
+
+# Merges the (indexes, term counts, positional index) triple `source` into
+# `target`. The documents of `source` must not be in `target`, and are added
+# after all of its documents. Posting dictionaries of new terms are shared
+# rather than copied.
+def merge_index_structures(target, source):
+	target_indexes, target_term_counts, target_positional_index = target
+	source_indexes, source_term_counts, source_positional_index = source
+	for index, source_index in zip(target_indexes, source_indexes):
+		_merge_postings(index, source_index)
+	target_term_counts.update(source_term_counts)
+	target_positional_index.merge(source_positional_index)
 
-def index_documents(directory):
-	for file_path in glob(join(directory, INDEX_FILE_PATTERN)):
-		index_document(file_path)
+def _merge_postings(index, source_index):
+	for term, postings in source_index.items():
+		if term in index:
+			index[term].update(postings)
+		else:
+			index[term] = postings
 
 # Writes the index for the specified `n`-gram value to `output_path`.
 def write_index(output_path, n=1):
@@ -51,11 +231,45 @@ def write_index(output_path, n=1):
 		pickle_dump(indexes[n-1], output_file)
 
 # Reads the index for the specified `n`-gram value from `input_path`.
+# Binary index files (see `write_binary_index`) are memory-mapped instead of
+# unpickled, and segmented index directories (see `segments.py`) are read from
+# their current snapshot.
 def read_index(input_path, n=1):
 	global indexes
+	_next_generation()
+	if isdir(input_path):
+		indexes[n-1] = _segment_snapshot(input_path).index(n)
+		return
+	if is_index_file(input_path):
+		indexes[n-1] = MappedIndex(input_path)
+		return
 	with open(input_path, "rb") as input_file:
 		indexes[n-1] = pickle_load(input_file)
 
+# Returns the current snapshot of the segmented index in `directory`. The
+# directory is opened once, and its segments are only read again when another
+# process has updated it since.
+def _segment_snapshot(directory):
+	# Imported here, as the segments module builds on this one
+	from .segments import open_segments
+	return open_segments(directory).snapshot()
+
+# Reads every data structure (all n-gram indexes, the term counts and the
+# positional index) from the snapshot of the segmented index in `directory`
+def read_segments(directory):
+	global indexes, term_counts, positional_index
+	_next_generation()
+	snapshot = _segment_snapshot(directory)
+	indexes = [snapshot.index(n + 1) for n in range(MAX_N)]
+	term_counts = snapshot.term_counts()
+	positional_index = snapshot.positional_index()
+
+# Writes the unigram index and the term counts to `output_path` as a single
+# binary index file, which can be memory-mapped by `read_index` and
+# `read_term_counts`.
+def write_binary_index(output_path):
+	write_index_file(output_path, indexes[0], term_counts)
+
 # Writes the term counts data structure to `output_path`.
 # Writes in a format that can be read in later by the application, unless the 
 # `human_readable` option is specified.
@@ -71,20 +285,83 @@ def write_term_counts(output_path, human_readable=False):
 			pickle_dump(term_counts, output_file)
 
 # Reads the term counts file, when in the non-human readable format, from 
-# `input_path`.
+# `input_path`. A binary index file can also be given, in which case the term 
+# counts are read from it, as is a segmented index directory.
 def read_term_counts(input_path):
 	global term_counts
+	_next_generation()
+	if isdir(input_path):
+		term_counts = _segment_snapshot(input_path).term_counts()
+		return
+	if is_index_file(input_path):
+		term_counts = MappedIndex(input_path).doc_lengths
+		return
 	with open(input_path, "rb") as input_file:
 		term_counts = pickle_load(input_file)
 
+# Returns the Euclidean norm of the (1 + log tf) * idf weight vector of every
+# document in the unigram index `index`, for a collection of `num_docs`
+# documents. Weights are summed in index order.
+def compute_document_norms(index, num_docs):
+	squared_sums = defaultdict(int)
+	for term, postings in index.items():
+		idf = log(num_docs / len(postings)) if len(postings) != 0 else 0
+		for docID, count in postings.items():
+			if count > 0:
+				squared_sums[docID] += (((log(count) + 1) * idf) ** 2)
+	return {docID: sqrt(squared_sum) for docID, squared_sum in squared_sums.items()}
+
+# Writes the tf-idf document vector norms of the unigram index to `output_path`.
+def write_document_norms(output_path):
+	with open(output_path, "wb") as output_file:
+		pickle_dump(compute_document_norms(indexes[0], len(term_counts)), output_file)
+
+# Reads a document vector norms file from `input_path`.
+def read_document_norms(input_path):
+	global document_norms
+	_next_generation()
+	with open(input_path, "rb") as input_file:
+		document_norms = pickle_load(input_file)
+
+# Writes the bigram and trigram indexes to `output_path` as a single compact
+# `NGramIndex`, leaving out n-grams occurring fewer than `min_frequency` times.
+def write_ngram_index(output_path, min_frequency=MIN_FREQUENCY):
+	with open(output_path, "wb") as output_file:
+		pickle_dump(NGramIndex.from_inverted_indexes(indexes[1:], min_frequency), output_file)
+
+# Reads an n-gram index file from `input_path`.
+def read_ngram_index(input_path):
+	global ngram_index
+	_next_generation()
+	with open(input_path, "rb") as input_file:
+		ngram_index = pickle_load(input_file)
+
+# Writes the spelling index of the unigram index's vocabulary to
+# `output_path`.
+def write_spelling_index(output_path):
+	with open(output_path, "wb") as output_file:
+		pickle_dump(SpellingIndex.from_index(indexes[0]), output_file)
+
+# Reads a spelling index file from `input_path`.
+def read_spelling_index(input_path):
+	global spelling_index
+	_next_generation()
+	with open(input_path, "rb") as input_file:
+		spelling_index = pickle_load(input_file)
+
 # Writes the positional index to `output_path`.
 def write_positional_index(output_path):
 	with open(output_path, "wb") as output_file:
 		pickle_dump(positional_index, output_file)
 
-# Reads a positional index file from `input_path`.
+# Reads a positional index file, or a segmented index directory, from
+# `input_path`.
 def read_positional_index(input_path):
 	global positional_index
+	_next_generation()
+	if isdir(input_path):
+		positional_index = _segment_snapshot(input_path).positional_index()
+		return
 	with open(input_path, "rb") as input_file:
 		positional_index = pickle_load(input_file)
 
@@ -99,27 +376,8 @@ def list_from_d_gaps(d_gaps):
 # Performs a conjunctive proximity query based on the loaded index, based on 
 # the terms `t1` and `t2`, and the proximity window `k`.
 def perform_conjunctive_proximity_query(t1, t2, k):
-	t1_posting = positional_index[t1.lower()]
-	t2_posting = positional_index[t2.lower()]
-	
-	docIDs = set(t1_posting.keys()).intersection(set(t2_posting.keys()))
-	
-	def within_k(t1_positions, t2_positions, k):
-		t1_i = 0
-		t2_i = 0
-		
-		while t1_i < len(t1_positions) and t2_i < len(t2_positions):
-			if abs(t1_positions[t1_i] - t2_positions[t2_i]) <= k:
-				return True
-			else:
-				if t1_positions[t1_i] < t2_positions[t2_i]:
-					t1_i += 1
-				else:
-					t2_i += 1
-					
-		return False
-	
-	docIDs = set(filter(lambda docID: within_k(list_from_d_gaps(t1_posting[docID]), list_from_d_gaps(t2_posting[docID]), k), docIDs))
+	# Terms at most k positions apart lie within a span of k + 1 positions
+	docIDs = UnorderedWindow([t1.lower(), t2.lower()], k + 1).matches(positional_index)
 	
 	print("\n".join(docIDs))
 	print("===============\n%s Documents Found" % (len(docIDs),))
@@ -0,0 +1,93 @@
+from .compact_index import CompactIndex
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from hashlib import blake2b
+
+# N-grams occurring fewer times than this in the collection are left out of an
+# `NGramIndex` by default
+MIN_FREQUENCY = 2
+
+# A compact index of word n-grams of one or more sizes, for answering short
+# phrase queries without the positional index.
+#
+# N-grams are keyed by a 64-bit hash of their words rather than by the words
+# themselves, and the postings are stored in a `CompactIndex` whose rows are in
+# hash order. N-grams whose collection frequency is below `min_frequency` are
+# dropped; `covers` tells whether a phrase can be answered from the index (a
+# phrase that is not in the index may still occur in the collection if it was
+# dropped).
+class NGramIndex(Mapping):
+
+	def __init__(self, compact_index, sizes, min_frequency):
+		self.compact_index = compact_index
+		self.sizes = tuple(sizes)
+		self.min_frequency = min_frequency
+
+	# Creates an n-gram index from n-gram indexes in the nested dictionary
+	# format (n-gram tuple -> docID -> count), such as `indexes[1]` and
+	# `indexes[2]` of the indexer
+	@classmethod
+	def from_inverted_indexes(cls, inverted_indexes, min_frequency=MIN_FREQUENCY):
+		sizes = set()
+		ngrams = dict()
+		for inverted_index in inverted_indexes:
+			for ngram, postings in inverted_index.items():
+				sizes.add(len(ngram))
+				if sum(postings.values()) >= min_frequency:
+					key = ngram_key(ngram)
+					if key in ngrams:
+						raise ValueError("n-gram hash collision for %r" % (ngram,))
+					ngrams[key] = postings
+		compact_index = CompactIndex.from_inverted_index(ngrams)
+		compact_index.terms = HashedKeys(array('Q', sorted(ngrams.keys())))
+		return cls(compact_index, sorted(sizes), min_frequency)
+
+	# Returns whether the postings of the phrase `terms` can be read from the
+	# index: either the n-gram is indexed, or no n-gram of its size was dropped
+	def covers(self, terms):
+		return len(terms) in self.sizes and (self.min_frequency <= 1 or terms in self)
+
+	# Returns the postings (docID -> count) of the phrase `terms`
+	def postings(self, terms):
+		return self.compact_index[ngram_key(terms)]
+
+	def __getitem__(self, ngram):
+		return self.compact_index[ngram_key(ngram)]
+
+	def __contains__(self, ngram):
+		return ngram_key(ngram) in self.compact_index
+
+	# Iterates over the n-gram hashes
+	def __iter__(self):
+		return iter(self.compact_index)
+
+	def __len__(self):
+		return len(self.compact_index)
+
+# Returns the 64-bit key of an n-gram, given as a sequence of words
+def ngram_key(ngram):
+	return int.from_bytes(blake2b(" ".join(ngram).encode("utf-8"), digest_size=8).digest(), "little")
+
+# The sorted n-gram hashes of an `NGramIndex`, used as the term table of its
+# `CompactIndex`: the row of a hash is its position.
+class HashedKeys:
+
+	def __init__(self, hashes):
+		self.hashes = hashes
+
+	def get(self, key, default=None):
+		i = bisect_left(self.hashes, key)
+		if i < len(self.hashes) and self.hashes[i] == key:
+			return i
+		return default
+
+	def __contains__(self, key):
+		return self.get(key) is not None
+
+	def __iter__(self):
+		return iter(self.hashes)
+
+	def __len__(self):
+		return len(self.hashes)
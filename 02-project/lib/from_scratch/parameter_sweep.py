@@ -0,0 +1,167 @@
+from .batch_scoring import read_query_file
+from .retrieval_model import BM25RetrievalModel, DirichletQueryLikelihoodModel, JMQueryLikelihoodModel, _get_terms, _query_key
+from lib.shared_utils.evaluation import DEFAULT_K_VALUES, evaluate_runs, mean_scores
+
+from itertools import product
+from math import pi, sqrt
+from multiprocessing import get_context
+from scipy.special import ndtr
+import numpy as np
+
+# Evaluates retrieval model parameters in memory. The index is read once by
+# the calling script before this module is imported; worker processes are
+# forked afterwards and share it (copy-on-write) without reading it again.
+# Each configuration is ranked with `batch_ranked_documents` and evaluated
+# against the relevance judgements without writing a run file.
+
+# Model name -> (model class, parameter names, default values of each
+# parameter). For random and Bayesian search, the values give the range of a
+# parameter.
+MODELS = {
+	"bm25": (BM25RetrievalModel, ("k1", "b", "k2"), ([0.6, 0.9, 1.2, 1.5, 1.8, 2.1], [0.25, 0.5, 0.75, 1.0], [0, 100, 1000])),
+	"jm": (JMQueryLikelihoodModel, ("λ",), ([0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9],)),
+	"dirichlet": (DirichletQueryLikelihoodModel, ("μ",), ([250, 500, 1000, 1500, 2000, 2500, 3000],)),
+}
+
+# Number of random configurations evaluated before Bayesian search starts
+# modelling the metric
+BAYESIAN_INITIAL_TRIALS = 5
+
+# Number of random candidates scored by the acquisition function in each round
+# of Bayesian search
+BAYESIAN_CANDIDATES = 1000
+
+# State of the sweep, set by `sweep` before the worker processes are forked
+_queries = None
+_relevance_data = None
+_num_results = None
+_k_values = None
+
+# Models of each worker process by name, built once and reused with new
+# parameters, as building a query likelihood model reads the whole index
+_models = dict()
+
+def _model(name, params):
+	model_class, param_names, _ = MODELS[name]
+	if name not in _models:
+		_models[name] = model_class(*[float(params[param_name]) for param_name in param_names])
+	model = _models[name]
+	for param_name in param_names:
+		setattr(model, param_name, float(params[param_name]))
+	return model
+
+# Ranks the queries with the model `name` and the parameters `params`, and
+# returns the mean of each metric. Runs in a worker process.
+def evaluate_configuration(configuration):
+	name, params = configuration
+	query_ids, query_terms = _queries
+	ranked_results = _model(name, params).batch_ranked_documents(query_terms, _num_results)
+	results = {query_id: [doc_id for doc_id, _ in docs] for query_id, docs in zip(query_ids, ranked_results)}
+	_, scores = evaluate_runs(_relevance_data, [results], _k_values)
+	return {metric: float(values[0]) for metric, values in mean_scores(scores).items()}
+
+# Returns the configurations of the grid of `param_values`, a dictionary of
+# parameter name -> list of values
+def grid_configurations(param_values):
+	names = list(param_values.keys())
+	return [dict(zip(names, values)) for values in product(*(param_values[name] for name in names))]
+
+# Returns `count` configurations drawn uniformly between the smallest and
+# largest values of each parameter
+def random_configurations(param_values, count, rng):
+	return [_from_unit(param_values, point) for point in rng.random((count, len(param_values)))]
+
+def _from_unit(param_values, point):
+	params = dict()
+	for (name, values), x in zip(param_values.items(), point):
+		low, high = min(values), max(values)
+		params[name] = low + x * (high - low)
+	return params
+
+def _to_unit(param_values, params):
+	point = []
+	for name, values in param_values.items():
+		low, high = min(values), max(values)
+		point.append((params[name] - low) / (high - low) if high > low else 0.0)
+	return point
+
+# Returns the next `count` configurations of a Bayesian search, given the
+# evaluated configurations and their metric values. The metric is modelled
+# with a Gaussian process over the parameters scaled to [0, 1], and the
+# random candidates with the highest expected improvement are returned.
+def bayesian_configurations(param_values, evaluated, values, count, rng, length_scale=0.25, noise=1e-6):
+	X = np.array([_to_unit(param_values, params) for params in evaluated])
+	y = np.array(values)
+	mean, std = y.mean(), y.std() or 1.0
+	y = (y - mean) / std
+
+	def kernel(A, B):
+		distances = ((A[:, None, :] - B[None, :, :]) ** 2).sum(axis=2)
+		return np.exp(-distances / (2 * length_scale ** 2))
+
+	K_inv = np.linalg.inv(kernel(X, X) + noise * np.eye(len(X)))
+	candidates = rng.random((BAYESIAN_CANDIDATES, len(param_values)))
+	K_s = kernel(candidates, X)
+	mu = K_s @ K_inv @ y
+	sigma = np.sqrt(np.maximum(1.0 - np.einsum('ij,jk,ik->i', K_s, K_inv, K_s), 1e-12))
+
+	# Expected improvement over the best value so far
+	z = (mu - y.max()) / sigma
+	cdf = ndtr(z)
+	pdf = np.exp(-z ** 2 / 2) / sqrt(2 * pi)
+	improvement = (mu - y.max()) * cdf + sigma * pdf
+	best = np.argsort(-improvement)[:count]
+	return [_from_unit(param_values, candidates[i]) for i in best]
+
+# Evaluates the models in `model_params` (model name -> parameter name -> list
+# of values) on the queries of `query_file_path`, returning a list of (model
+# name, parameters, metric means) sorted by `sort_metric`, best first.
+#
+# `search` is "grid" (every combination of the values), "random" (`trials`
+# configurations drawn between the smallest and largest values) or "bayes"
+# (`trials` configurations chosen by Bayesian optimization of `sort_metric`,
+# in rounds of `workers` configurations).
+def sweep(model_params, query_file_path, relevance_data, search="grid", trials=20, workers=1, num_results=100, k_values=DEFAULT_K_VALUES, sort_metric="map", seed=0):
+	global _queries, _relevance_data, _num_results, _k_values
+	queries = read_query_file(query_file_path)
+	_queries = ([_query_key(query_id) for query_id, _ in queries], [_get_terms(query_string) for _, query_string in queries])
+	_relevance_data = relevance_data
+	_num_results = num_results
+	_k_values = tuple(k_values)
+	rng = np.random.default_rng(seed)
+
+	pool = get_context("fork").Pool(workers) if workers > 1 else None
+	evaluate = pool.map if pool is not None else lambda function, items: list(map(function, items))
+	leaderboard = []
+	try:
+		for name, param_values in model_params.items():
+			if search == "grid":
+				configurations = grid_configurations(param_values)
+				metrics = evaluate(evaluate_configuration, [(name, params) for params in configurations])
+			elif search == "random":
+				configurations = random_configurations(param_values, trials, rng)
+				metrics = evaluate(evaluate_configuration, [(name, params) for params in configurations])
+			elif search == "bayes":
+				configurations = random_configurations(param_values, min(trials, BAYESIAN_INITIAL_TRIALS), rng)
+				metrics = evaluate(evaluate_configuration, [(name, params) for params in configurations])
+				while len(configurations) < trials:
+					batch = bayesian_configurations(param_values, configurations, [metric[sort_metric] for metric in metrics], min(max(workers, 1), trials - len(configurations)), rng)
+					configurations += batch
+					metrics += evaluate(evaluate_configuration, [(name, params) for params in batch])
+			else:
+				raise ValueError("unknown search %r" % (search,))
+			leaderboard.extend((name, params, metric) for params, metric in zip(configurations, metrics))
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	return sorted(leaderboard, key=lambda entry: entry[2][sort_metric], reverse=True)
+
+# Prints the leaderboard returned by `sweep` as a table of the metrics in
+# `metrics`
+def print_leaderboard(leaderboard, metrics):
+	print("\t".join(["rank", "model", "parameters"] + metrics))
+	for rank, (name, params, metric) in enumerate(leaderboard):
+		parameters = " ".join("%s=%.4g" % (param_name, value) for param_name, value in params.items())
+		print("\t".join([str(rank + 1), name, parameters] + ["%.4f" % metric[m] for m in metrics]))
@@ -0,0 +1,142 @@
+from bisect import bisect_right
+from re import compile as re_compile
+
+# Query operators over a positional index (see `CompressedPositionalIndex`):
+#
+#   "a b c"        exact phrase: the terms at consecutive positions
+#   #odN(a b c)    ordered window: the terms in order, each within N positions
+#                  of the previous one ("a b c" is #od1(a b c))
+#   #uwN(a b c)    unordered window: the terms in any order, within a span of
+#                  N positions
+#
+# Operators take any number of terms. Matching first intersects the postings
+# of the terms by document, skipping over the encoded positions of documents
+# that lack any of the terms, and only decodes positions for the documents in
+# the intersection.
+
+# Matches the operators in a query string
+OPERATOR_PATTERN = re_compile(r'"([^"]*)"|#(od|uw)(\d+)\(([^)]*)\)')
+
+class ProximityOperator:
+
+	def __init__(self, terms, width):
+		self.terms = list(terms)
+		self.width = width
+
+	def __eq__(self, other):
+		return type(self) == type(other) and (self.terms, self.width) == (other.terms, other.width)
+
+	def __hash__(self):
+		return hash((type(self).__name__, tuple(self.terms), self.width))
+
+	def __repr__(self):
+		return "%s(%r, %r)" % (type(self).__name__, self.terms, self.width)
+
+	# Returns a dictionary of docID -> number of matches of the operator in
+	# the documents of `positional_index` where it matches
+	def matches(self, positional_index):
+		doc_ids = positional_index.doc_ids
+		result = dict()
+		for doc_number, positions in conjunction(positional_index, self.terms):
+			count = self.count(positions)
+			if count > 0:
+				result[doc_ids[doc_number]] = count
+		return result
+
+	# Returns the number of matches, given the sorted positions of each term.
+	# The subclasses define what a match is: the base operator matches nothing.
+	def count(self, positions):
+		return 0
+
+# The terms in order, each at most `width` positions after the previous one.
+# Matches are counted by the position of the first term.
+class OrderedWindow(ProximityOperator):
+
+	def count(self, positions):
+		count = 0
+		for position in positions[0]:
+			for term_positions in positions[1:]:
+				i = bisect_right(term_positions, position)
+				if i == len(term_positions) or term_positions[i] - position > self.width:
+					break
+				position = term_positions[i]
+			else:
+				count += 1
+		return count
+
+# The terms at consecutive positions
+class Phrase(OrderedWindow):
+
+	def __init__(self, terms):
+		super().__init__(terms, 1)
+
+	def __repr__(self):
+		return "Phrase(%r)" % (self.terms,)
+
+# Every (distinct) term within a span of `width` positions, in any order.
+# Matches are counted by the position ending the window.
+class UnorderedWindow(ProximityOperator):
+
+	def __init__(self, terms, width):
+		super().__init__(list(dict.fromkeys(terms)), width)
+
+	def count(self, positions):
+		merged = sorted((position, i) for i, term_positions in enumerate(positions) for position in term_positions)
+		last_seen = [None] * len(positions)
+		unseen = len(positions)
+		count = 0
+		for position, i in merged:
+			if last_seen[i] is None:
+				unseen -= 1
+			last_seen[i] = position
+			if unseen == 0 and position - min(last_seen) < self.width:
+				count += 1
+		return count
+
+# Yields (document number, [positions of each term]) for the documents of
+# `positional_index` containing every term in `terms`. Postings are merged
+# starting from the shortest list; positions are decoded only for documents
+# containing all the terms.
+def conjunction(positional_index, terms):
+	if len(terms) == 0:
+		return
+	distinct = list(dict.fromkeys(terms))
+	cursors = {term: positional_index.cursor(term) for term in distinct}
+	# Lead with the term with the fewest encoded bytes
+	order = sorted(distinct, key=lambda term: len(cursors[term].buffer))
+	lead = cursors[order[0]]
+	others = [cursors[term] for term in order[1:]]
+
+	while lead.doc_number is not None:
+		doc_number = lead.doc_number
+		for cursor in others:
+			cursor.skip_to(doc_number)
+			if cursor.doc_number is None:
+				return
+			if cursor.doc_number > doc_number:
+				doc_number = cursor.doc_number
+				break
+		else:
+			positions = {term: cursor.positions() for term, cursor in cursors.items()}
+			yield (doc_number, [positions[term] for term in terms])
+			lead.next()
+			continue
+		lead.skip_to(doc_number)
+
+# Splits a query string into the query text, with the operator syntax removed
+# but the operator terms kept, and the list of operators it contains. Operator
+# terms are tokenized with `get_terms`.
+def parse_query(query_string, get_terms):
+	operators = []
+	def replace(match):
+		if match.group(1) is not None:
+			terms = get_terms(match.group(1))
+			if len(terms) > 1:
+				operators.append(Phrase(terms))
+			return " %s " % match.group(1)
+		terms = get_terms(match.group(4))
+		if len(terms) > 1:
+			window = OrderedWindow if match.group(2) == "od" else UnorderedWindow
+			operators.append(window(terms, int(match.group(3))))
+		return " %s " % match.group(4)
+	return (OPERATOR_PATTERN.sub(replace, query_string), operators)
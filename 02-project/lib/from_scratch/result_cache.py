@@ -0,0 +1,121 @@
+from .indexer import current_generation
+from lib.shared_utils import tracing
+
+from collections import OrderedDict
+from sys import getsizeof
+
+# Caches ranked result lists of queries, keyed on the retrieval model, its
+# parameters and the analyzed query (see `cache_key`), with least recently
+# used eviction. A hit returns the cached list without reading any postings.
+#
+# Every cached list belongs to the generation of the index it was computed
+# from (see `current_generation` in the indexer). When the index is read again
+# or documents are indexed, the whole cache is dropped on the next lookup.
+# Models keep ranking the index they were built from until they are built
+# again (see `refresh_index` in the retrieval models), so the generation of the
+# model is also part of the key: results of a model built before the change
+# are never returned for a model built after it.
+#
+# The size of the cache can be limited by number of entries and by an estimate
+# of the memory held by the result lists, whichever is reached first.
+
+DEFAULT_MAX_ENTRIES = 1024
+
+# Estimated size of one (docID, score) result, not counting the docID string
+# shared with the index
+_RESULT_SIZE = getsizeof((None, None)) + getsizeof(0.0)
+
+# Returns the key of the results of `query_terms` (with the proximity
+# `operators`) ranked by `model`, limited to `num_results`. Models describe
+# the parameters their rankings depend on with `cache_params`, and the index
+# they rank with `generation`.
+def cache_key(model, query_terms, num_results=None, operators=()):
+	return (type(model).__name__, model.generation, model.cache_params(), tuple(query_terms), tuple(operators), num_results)
+
+class ResultCache:
+
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=None):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.size_bytes = 0
+		self.generation = current_generation()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	# Returns the cached results for `key`, or None
+	def get(self, key):
+		self._check_generation()
+		results = self.entries.get(key)
+		if results is None:
+			self.misses += 1
+			tracing.count("result_cache_misses")
+			return None
+		self.entries.move_to_end(key)
+		self.hits += 1
+		tracing.count("result_cache_hits")
+		return list(results)
+
+	# Caches `results` for `key`, evicting the least recently used entries
+	# past the limits. Results larger than the whole memory limit are not
+	# cached.
+	def put(self, key, results):
+		self._check_generation()
+		if key in self.entries:
+			self.size_bytes -= _size(self.entries.pop(key))
+		results = tuple(results)
+		size = _size(results)
+		if self.max_bytes is not None and size > self.max_bytes:
+			return
+		self.entries[key] = results
+		self.size_bytes += size
+		while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size_bytes > self.max_bytes and len(self.entries) > 0):
+			_, evicted = self.entries.popitem(last=False)
+			self.size_bytes -= _size(evicted)
+			self.evictions += 1
+
+	# Returns the cached results for `key`, computing them with `rank()` and
+	# caching them if needed
+	def get_or_rank(self, key, rank):
+		results = self.get(key)
+		if results is None:
+			results = rank()
+			self.put(key, results)
+		return results
+
+	# Drops every entry
+	def clear(self):
+		self.entries.clear()
+		self.size_bytes = 0
+
+	def _check_generation(self):
+		generation = current_generation()
+		if generation != self.generation:
+			if len(self.entries) > 0:
+				self.invalidations += 1
+			self.clear()
+			self.generation = generation
+
+	def __len__(self):
+		return len(self.entries)
+
+	# Returns the hit and miss counts and the size of the cache
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			"entries": len(self.entries),
+			"size_bytes": self.size_bytes,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+			"evictions": self.evictions,
+			"invalidations": self.invalidations,
+			"generation": self.generation,
+		}
+
+# Returns the estimated size in bytes of a cached result list
+def _size(results):
+	return getsizeof(results) + len(results) * _RESULT_SIZE
@@ -1,54 +1,183 @@
-from .indexer import indexes, term_counts as doc_lengths
+from .batch_scoring import TermDocumentMatrix, print_trec_results, read_query_file
+from .compact_index import CompactIndex
+from . import indexer
+from .indexer import compute_document_norms, current_generation, document_norms, indexes, ngram_index, positional_index, spelling_index, term_counts as doc_lengths
+from .proximity import Phrase, UnorderedWindow, parse_query
+from .result_cache import cache_key
 from .spell_corrector import SpellCorrector
-from lib.shared_utils.summarizer import get_text_from_file, summarize
+from lib.shared_utils.analyzer import Analyzer
+from lib.shared_utils.summarizer import summarize_document
+from lib.shared_utils import tracing
 
 from collections import Counter, defaultdict
 from csv import reader as csv_reader
-from functools import partial, reduce
-from math import log, sqrt
-from os.path import join
-from re import sub
+from heapq import heappop, heappush, heapreplace
+from math import inf, log, sqrt
 from statistics import mean
-from itertools import chain
-import copy
-import re
+from sys import stderr
 import numpy as np
-import numba as nm
 
 index = indexes[0]
 mean_doc_length = mean(doc_lengths.values())
 
+# Generation of the index the module globals above were bound to (see
+# `current_generation` in the indexer)
+index_generation = current_generation()
+
+# Binds the module globals again to the index structures last read or built by
+# the indexer, if the index has changed since. Returns whether it did.
+#
+# Models precompute their tables from the module globals when they are built,
+# and keep ranking the index of their `generation` after it changes: models
+# built before must be built again after this is called.
+def refresh_index():
+	global index, indexes, doc_lengths, terms, mean_doc_length, document_norms, ngram_index, positional_index, spelling_index, index_generation, _term_document_matrix
+	if index_generation == current_generation():
+		return False
+	indexes = indexer.indexes
+	index = indexes[0]
+	doc_lengths = terms = indexer.term_counts
+	mean_doc_length = mean(doc_lengths.values())
+	document_norms = indexer.document_norms
+	ngram_index = indexer.ngram_index
+	positional_index = indexer.positional_index
+	spelling_index = indexer.spelling_index
+	_term_document_matrix = None
+	index_generation = current_generation()
+	return True
+
+# Relative slack used when comparing score upper bounds against the top-k
+# threshold, so that rounding differences never prune a document that the
+# exhaustive ranking would keep
+PRUNING_EPSILON = 1e-9
+
 # Returns a list of documents containing the term
 def docs_containing(term):
-	return [doc for doc, count in index.copy()[term].items() if count > 0]
+	return [doc for doc, count in index.get(term, {}).items() if count > 0]
 
-def _get_terms(query_string):
-	clean_string = query_string
+# The index as a sparse term-document matrix for batch scoring, built on first
+# use and shared by all models
+_term_document_matrix = None
 
-	# Perform case folding
-	clean_string = clean_string.lower()
+def term_document_matrix():
+	global _term_document_matrix
+	if _term_document_matrix is None:
+		_term_document_matrix = TermDocumentMatrix(index, doc_lengths)
+	return _term_document_matrix
 
-	# Perform punctuation handling, retain only alphanumeric characters
-	clean_string = sub('[^0-9a-zA-Z-]+', ' ', clean_string)
+# The analyzer turning query strings into terms, the same way documents are
+# preprocessed before indexing
+analyzer = Analyzer()
 
-	# Tokenize
-	return clean_string.split()
+def _get_terms(query_string):
+	return analyzer.tokens(query_string)
 
 # A simple class representing a BM25 retrieval model
 class BM25RetrievalModel:
 
 	# Instance variables for model parameters k1, b, and k2
-	def __init__(self):
-		self.k1 = float(1.2)
-		self.b = float(0.75)
-		self.k2 = float(100)
-		self.spell_corrector = SpellCorrector(index)
+	def __init__(self, k1=1.2, b=0.75, k2=100):
+		self.k1 = float(k1)
+		self.b = float(b)
+		self.k2 = float(k2)
+
+		# Generation of the index the model ranks (see `refresh_index`)
+		self.generation = index_generation
+		# Bigram statistics for whole-query spelling correction come from the
+		# n-gram index or the bigram index, if either was read
+		bigram_index = ngram_index if ngram_index is not None else (indexes[1] if len(indexes[1]) > 0 else None)
+		self.spell_corrector = SpellCorrector(index, spelling_index, bigram_index)
+
+		# The idf of the terms queried so far (see `term_idf`) and the
+		# length-normalization factor K of every document for the accumulator
+		# scorer. Idfs are computed on first use, so that building a model does
+		# not read the whole vocabulary.
+		self._idfs = dict()
+		self._K_params = None
+		self._K_values = None
+		self.K_values()
+
+		# Postings in docID order (term -> sorted docIDs, filled in by
+		# `sorted_doc_ids` for the terms of top-k queries only) and per-term
+		# score upper bounds for top-k (MaxScore) queries, also filled in as
+		# terms are queried
+		self._sorted_doc_ids = dict()
+		self._bounds_params = None
+		self._upper_bounds = dict()
+		self.last_query_stats = None
+
+		# When set, queries limited to a number of results use
+		# `top_k_documents` instead of sorting the exhaustive ranking
+		self.top_k_pruning = False
+
+		# Proximity-boosted scoring (requires the positional index, or the
+		# n-gram index for short phrases only): when the weight is positive, the
+		# phrase and window operators of a query, and an unordered window of
+		# `proximity_window` positions over each pair of adjacent query terms,
+		# add to the scores of the documents they match
+		self.proximity_weight = 0.0
+		self.proximity_window = 8
+
+		self._batch_params = None
+		self._batch_weights = None
+
+		# When set to a `ResultCache`, the results of `_ranked_results` are
+		# cached
+		self.result_cache = None
+
+	# Returns the parameters the rankings depend on, for `cache_key`
+	def cache_params(self):
+		return (self.k1, self.b, self.k2, self.proximity_weight, self.proximity_window)
+
+	# Returns the K value of every document (docID -> K). The table is rebuilt
+	# only when k1 or b have been changed since it was last computed.
+	def K_values(self):
+		if self._K_params != (self.k1, self.b):
+			self._K_values = {doc_id: self.K(doc_id) for doc_id in doc_lengths}
+			self._K_params = (self.k1, self.b)
+		return self._K_values
+
+	# Returns the idf of `term`, or None if the term is not indexed. Computed
+	# the first time the term is queried.
+	def term_idf(self, term):
+		idf_value = self._idfs.get(term)
+		if idf_value is None and term in index:
+			idf_value = self._idfs[term] = self.idf(term)
+		return idf_value
+
+	# Returns the largest value of idf * document component that `term`
+	# reaches over its postings, or None if it has no postings. Multiplied by
+	# the query component, this bounds the term's contribution to any document
+	# score. Computed the first time the term is queried, and again after k1 or
+	# b have been changed.
+	def upper_bound(self, term):
+		K_values = self.K_values()
+		if self._bounds_params != self._K_params:
+			self._upper_bounds = dict()
+			self._bounds_params = self._K_params
+		bound = self._upper_bounds.get(term)
+		if bound is None:
+			postings = index.get(term)
+			idf_value = self.term_idf(term)
+			if idf_value is None or not postings:
+				return None
+			k1 = self.k1
+			bound = self._upper_bounds[term] = max((idf_value * (((k1 + 1) * fi) / (K_values[doc_id] + fi)) for doc_id, fi in postings.items() if fi > 0), default=0.0)
+		return bound
+
+	# Returns the docIDs of the postings of `term` in docID order, sorted the
+	# first time the term is queried
+	def sorted_doc_ids(self, term):
+		doc_ids = self._sorted_doc_ids.get(term)
+		if doc_ids is None:
+			doc_ids = self._sorted_doc_ids[term] = sorted(docs_containing(term))
+		return doc_ids
 
 	def K(self, doc_id):
 		return self.k1 * ((1 - self.b) + self.b * (doc_lengths[doc_id] / mean_doc_length))
 
 	def idf(self, query_term):
-		ni = len(index[query_term])
+		ni = len(index.get(query_term, ()))
 		N = len(doc_lengths)
 		return log(1.0 / ((ni + 0.5) / (N - ni + 0.5)))
 
@@ -56,8 +185,9 @@ class BM25RetrievalModel:
 	# id (`doc_id`)
 	def term_ranked_value(self, query_term, doc_id, query_term_count=1):
 		idf_value = self.idf(query_term)
-		# Perform copy here to prevent updating value
-		fi = index[query_term].copy()[doc_id] # frequency of term i in the document
+		# Read with `get`, so that unknown terms and documents are not added to
+		# the index
+		fi = index.get(query_term, {}).get(doc_id, 0) # frequency of term i in the document
 		doc_value = ((self.k1 + 1) * fi) / (self.K(doc_id) + fi)
 		qfi = query_term_count # frequency of term in in the query
 		query_value = ((self.k2 + 1) * qfi) / (self.k2 + qfi)
@@ -68,8 +198,258 @@ class BM25RetrievalModel:
 		# Return the actual value, handling duplciate terms with a counter
 		return sum([self.term_ranked_value(term, doc_id, query_term_count=count) for term, count in Counter(query_terms).items()])
 
-	# Returns a sorted list of ranked documents based on a list of query terms
-	def ranked_documents(self, query_terms):
+	# Returns the proximity operators used to boost the scores of a query: the
+	# query's own `operators`, followed by the windows over adjacent terms
+	def proximity_operators(self, query_terms, operators=()):
+		operators = list(operators)
+		if self.proximity_window > 0:
+			for pair in zip(query_terms, query_terms[1:]):
+				window = UnorderedWindow(pair, self.proximity_window)
+				if len(window.terms) == 2 and window not in operators:
+					operators.append(window)
+		return operators
+
+	# Returns the matches of a proximity operator (docID -> count). Phrases
+	# covered by the n-gram index, if read, are answered from its postings
+	# instead of the positional index.
+	def operator_matches(self, operator):
+		if type(operator) == Phrase and ngram_index is not None and ngram_index.covers(operator.terms):
+			return {doc_id: count for doc_id, count in ngram_index.postings(operator.terms).items() if count > 0}
+		return operator.matches(positional_index)
+
+	# Returns the proximity score of each document matching a proximity
+	# operator (docID -> score). Each operator is scored like a term whose
+	# frequency is its number of matches and whose idf is the lowest idf of
+	# its terms, times `proximity_weight`.
+	def proximity_scores(self, query_terms, operators=()):
+		K_values = self.K_values()
+		k1 = self.k1
+		scores = dict()
+		for operator in self.proximity_operators(query_terms, operators):
+			idf_value = min(self.term_idf(term) or 0 for term in operator.terms)
+			for doc_id, fi in self.operator_matches(operator).items():
+				doc_value = ((k1 + 1) * fi) / (K_values[doc_id] + fi)
+				scores[doc_id] = scores.get(doc_id, 0) + self.proximity_weight * idf_value * doc_value
+		return scores
+
+	# Returns a sorted list of ranked documents based on a list of query terms.
+	# Scores are accumulated term-at-a-time: the postings of each distinct query
+	# term are walked exactly once, using the precomputed idf and K values.
+	# With proximity-boosted scoring, the proximity scores of the documents are
+	# added (see `proximity_scores`).
+	def ranked_documents(self, query_terms, operators=()):
+		K_values = self.K_values()
+		k1 = self.k1
+		k2 = self.k2
+
+		scores = dict()
+		postings_touched = 0
+		with tracing.stage("scoring"):
+			for term, qfi in Counter(query_terms).items():
+				postings = index.get(term)
+				idf_value = self.term_idf(term)
+				if not postings or idf_value is None:
+					continue
+				postings_touched += len(postings)
+				query_value = ((k2 + 1) * qfi) / (k2 + qfi)
+				for doc_id, fi in postings.items():
+					if fi > 0:
+						doc_value = ((k1 + 1) * fi) / (K_values[doc_id] + fi)
+						scores[doc_id] = scores.get(doc_id, 0) + idf_value * doc_value * query_value
+
+		if self.proximity_weight > 0:
+			with tracing.stage("proximity"):
+				for doc_id, proximity_score in self.proximity_scores(query_terms, operators).items():
+					scores[doc_id] = scores.get(doc_id, 0) + proximity_score
+
+		tracing.count("postings_touched", postings_touched)
+		tracing.count("candidates_scored", len(scores))
+
+		# Return sorted list, breaking ties by descending docID
+		with tracing.stage("sorting"):
+			return sorted(scores.items(), key=lambda x: (x[1], x[0]), reverse=True)
+
+	# Returns the `k` highest ranked documents for a list of query terms, using
+	# MaxScore dynamic pruning. Documents are visited in docID order over the
+	# postings of the "essential" terms only; the remaining terms, whose upper
+	# bounds add up to less than the current k-th score, are only looked up for
+	# documents that can still enter the top `k`. The result is identical to
+	# `ranked_documents(query_terms)[:k]`. Posting counts for the query are
+	# left in `last_query_stats`.
+	def top_k_documents(self, query_terms, k):
+		K_values = self.K_values()
+		k1 = self.k1
+		k2 = self.k2
+
+		# (idf, query component, postings, sorted docIDs, upper bound) for each
+		# distinct query term, in query order
+		terms = []
+		for term, qfi in Counter(query_terms).items():
+			# Terms without postings have no bound
+			bound = self.upper_bound(term)
+			if bound is None:
+				continue
+			doc_ids = self.sorted_doc_ids(term)
+			if doc_ids:
+				query_value = ((k2 + 1) * qfi) / (k2 + qfi)
+				terms.append((self.term_idf(term), query_value, index[term], doc_ids, max(0.0, bound * query_value)))
+
+		total_postings = sum(len(term[3]) for term in terms)
+		scored_postings = 0
+		top = []
+
+		if k > 0 and len(terms) > 0:
+			# Term indexes in increasing order of upper bound, and the cumulative
+			# bound of the first i + 1 of them
+			order = sorted(range(len(terms)), key=lambda i: terms[i][4])
+			rank_of = {i: r for r, i in enumerate(order)}
+			cumulative_bounds = []
+			bound_sum = 0.0
+			for i in order:
+				bound_sum += terms[i][4]
+				cumulative_bounds.append(bound_sum)
+
+			# Terms order[:non_essential] are non-essential
+			non_essential = 0
+			threshold = -inf
+
+			def contribution(i, fi, K):
+				idf_value, query_value = terms[i][0], terms[i][1]
+				return idf_value * (((k1 + 1) * fi) / (K + fi)) * query_value
+
+			cursors = [0] * len(terms)
+			doc_heap = [(terms[i][3][0], i) for i in range(len(terms))]
+			doc_heap.sort()
+
+			while doc_heap:
+				doc_id = doc_heap[0][0]
+				K = K_values[doc_id]
+
+				# Score the current document for the essential terms, advancing
+				# their cursors. Terms that have become non-essential are dropped.
+				contributions = dict()
+				while doc_heap and doc_heap[0][0] == doc_id:
+					_, i = heappop(doc_heap)
+					if rank_of[i] >= non_essential:
+						contributions[i] = contribution(i, terms[i][2][doc_id], K)
+						scored_postings += 1
+						cursors[i] += 1
+						if cursors[i] < len(terms[i][3]):
+							heappush(doc_heap, (terms[i][3][cursors[i]], i))
+				if not contributions:
+					continue
+
+				# Add the non-essential terms, highest bound first, while the
+				# document can still beat the threshold
+				partial_score = sum(contributions.values())
+				remaining = cumulative_bounds[non_essential - 1] if non_essential > 0 else 0.0
+				pruned = False
+				for r in range(non_essential - 1, -1, -1):
+					if partial_score + remaining < threshold:
+						pruned = True
+						break
+					i = order[r]
+					remaining -= terms[i][4]
+					fi = terms[i][2].get(doc_id, 0)
+					if fi > 0:
+						contributions[i] = contribution(i, fi, K)
+						partial_score += contributions[i]
+						scored_postings += 1
+				if pruned or partial_score + remaining < threshold:
+					continue
+
+				# Sum the contributions in query order, as `ranked_documents` does
+				score = 0
+				for i in range(len(terms)):
+					if i in contributions:
+						score = score + contributions[i]
+
+				if len(top) < k:
+					heappush(top, (score, doc_id))
+				elif (score, doc_id) > top[0]:
+					heapreplace(top, (score, doc_id))
+				else:
+					continue
+
+				if len(top) == k:
+					threshold = top[0][0] - PRUNING_EPSILON * max(1.0, abs(top[0][0]))
+					while non_essential < len(order) and cumulative_bounds[non_essential] < threshold:
+						non_essential += 1
+
+		self.last_query_stats = {
+			"postings": total_postings,
+			"postings_scored": scored_postings,
+			"postings_skipped": total_postings - scored_postings,
+		}
+		tracing.count("postings_touched", scored_postings)
+		tracing.count("postings_skipped", total_postings - scored_postings)
+
+		return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+	# Returns the ranked documents for the query terms, limited to the top
+	# `num_results` if given. Top-k pruning does not apply to
+	# proximity-boosted scoring.
+	# Results served from the result cache leave {"cached": True} in
+	# `last_query_stats`.
+	def _ranked_results(self, query_terms, num_results=None, operators=()):
+		if self.result_cache is None:
+			return self._rank(query_terms, num_results, operators)
+		key = cache_key(self, query_terms, num_results, operators)
+		results = self.result_cache.get(key)
+		if results is not None:
+			self.last_query_stats = {"cached": True}
+			return results
+		results = self._rank(query_terms, num_results, operators)
+		self.result_cache.put(key, results)
+		return results
+
+	def _rank(self, query_terms, num_results=None, operators=()):
+		self.last_query_stats = None
+		if num_results is None:
+			return self.ranked_documents(query_terms, operators)
+		if self.top_k_pruning and self.proximity_weight <= 0:
+			with tracing.stage("scoring"):
+				return self.top_k_documents(query_terms, num_results)
+		return self.ranked_documents(query_terms, operators)[:num_results]
+
+	# Returns the BM25 weight (idf * document component) of every posting as a
+	# sparse term-document matrix, rebuilt when k1 or b change
+	def batch_weights(self):
+		K_values = self.K_values()
+		if self._batch_params != self._K_params:
+			matrix = term_document_matrix()
+			k1 = self.k1
+			K = np.array([K_values[doc_id] for doc_id in matrix.doc_ids])[matrix.counts.indices]
+			idfs = np.repeat([self.term_idf(term) for term in matrix.term_rows], np.diff(matrix.counts.indptr))
+			fi = matrix.counts.data
+			self._batch_weights = matrix.with_values(idfs * (((k1 + 1) * fi) / (K + fi)))
+			self._batch_params = self._K_params
+		return self._batch_weights
+
+	# Ranks a list of queries (each a list of query terms) at once, by
+	# multiplying a sparse query-term matrix holding the query components with
+	# the document weight matrix. Returns one ranked list per query, identical
+	# to `ranked_documents` (limited to `num_results` if given).
+	def batch_ranked_documents(self, queries, num_results=None):
+		matrix = term_document_matrix()
+		k2 = self.k2
+		query_weights = [[(term, ((k2 + 1) * qfi) / (k2 + qfi)) for term, qfi in Counter(query_terms).items()] for query_terms in queries]
+		query_matrix = matrix.query_matrix(query_weights)
+		scores = query_matrix @ self.batch_weights()
+		candidates = matrix.candidates(query_matrix)
+		return [matrix.top_documents(matrix.dense_row(scores, i), matrix.row_columns(candidates, i), num_results) for i in range(len(queries))]
+
+	# Processes the query file at the given path, scoring all queries at once
+	def process_query_file_batch(self, query_file_path, num_results=None):
+		queries = read_query_file(query_file_path)
+		ranked_results = self.batch_ranked_documents([_get_terms(query_string) for _, query_string in queries], num_results)
+		print_trec_results([query_id for query_id, _ in queries], ranked_results, "BM25")
+
+	# Returns a sorted list of ranked documents by scoring every matching
+	# document separately with `overall_ranked_value`. This is the original
+	# document-at-a-time implementation, kept as a reference for checking that
+	# `ranked_documents` produces the same ranking.
+	def reference_ranked_documents(self, query_terms):
 		# Find matching documents
 		matches = set()
 		for term in query_terms:
@@ -85,66 +465,160 @@ class BM25RetrievalModel:
 
 	# Displays the results for the documents based on the query terms
 	def display_documents(self, query_string, docs_path, docs_ext, num_results=None):
-		# Get terms
-		query_terms = _get_terms(query_string)
+		tracing.begin_query(query_string, "BM25")
+
+		# Get terms and proximity operators
+		with tracing.stage("tokenize"):
+			query_text, operators = parse_query(query_string, _get_terms)
+			query_terms = _get_terms(query_text)
 
 		# Get documents
-		docs = self.ranked_documents(query_terms)
-		if num_results is not None:
-			docs = docs[:num_results]
+		docs = self._ranked_results(query_terms, num_results, operators)
 
 		# Print suggestions
-		self.spell_corrector.print_suggestions(query_terms)
+		with tracing.stage("spelling"):
+			self.spell_corrector.print_suggestions(query_terms)
 
 		# Print documents and summaries
-		for doc, score in docs:
-			print("\n" + doc)
-			print(summarize(get_text_from_file(join(docs_path, doc + docs_ext)), query_terms, limit=2))
+		with tracing.stage("snippets"):
+			for doc, score in docs:
+				print("\n" + doc)
+				print(summarize_document(docs_path, doc, docs_ext, query_terms, limit=2))
 
 		print('-' * 80)
+		tracing.end_query()
 
-	# Processes the query file at the given path
-	def process_query_file(self, query_file_path, num_results=None):
+	# Processes the query file at the given path. If `print_stats` is set, the
+	# number of postings skipped by top-k pruning, or whether the results came
+	# from the result cache, is printed to stderr for each query.
+	def process_query_file(self, query_file_path, num_results=None, print_stats=False):
 		with open(query_file_path) as query_file:
 			reader = csv_reader(query_file, delimiter='\t')
 			for query_row in reader:
 				query_id = query_row[0]
-				query_terms = _get_terms(query_row[1])
-				docs = self.ranked_documents(query_terms)
-				if num_results is not None:
-					docs = docs[:num_results]
+				tracing.begin_query(query_id.strip(), "BM25")
+				with tracing.stage("tokenize"):
+					query_text, operators = parse_query(query_row[1], _get_terms)
+					query_terms = _get_terms(query_text)
+				docs = self._ranked_results(query_terms, num_results, operators)
 				lines = ["%s Q0 %s %s %s BM25" % (query_id, doc_id, idx+1, score) for idx, (doc_id, score) in enumerate(docs)]
 				print("\n".join(lines))
+				tracing.end_query()
+				stats = self.last_query_stats
+				if print_stats and stats is not None:
+					if stats.get("cached"):
+						print("Query %s: cached results" % (query_id.strip(),), file=stderr)
+					else:
+						print("Query %s: skipped %s of %s postings" % (query_id.strip(), stats["postings_skipped"], stats["postings"]), file=stderr)
 
 # A simple class representing a query liklihood retrieval model w/ JM (Laplace)
 # smoothing.
 class QueryLikelihoodModel:
 	def __init__(self):
-		# Create unigram models for each element in the index
-		self.models = defaultdict(partial(defaultdict, int))
-		self.collection_lang_model = defaultdict(int)
+		# Document lengths and collection term counts, computed from the index.
+		# As in the original per-document language models, |D| is the number of
+		# distinct terms in the document.
+		self.doc_lengths = dict()
+		self.collection_lang_model = dict()
 		self.collection_len = 0
 		self.load_language_models_from_index()
 
+		# Generation of the index the model ranks (see `refresh_index`)
+		self.generation = index_generation
+
+		# When set to a `ResultCache`, the results of `_ranked_results` are
+		# cached
+		self.result_cache = None
+
 	def load_language_models_from_index(self):
-		self.collection_lang_model = defaultdict(int)
+		self.doc_lengths = dict()
+		self.collection_lang_model = dict()
 		self.collection_len = 0
 		for term, inner in index.items():
+			term_count = 0
 			for doc_id, count in inner.items():
-				self.models[doc_id][term] = count
-				self.collection_lang_model[term] += count
-				self.collection_len += count
+				self.doc_lengths[doc_id] = self.doc_lengths.get(doc_id, 0) + 1
+				term_count += count
+			self.collection_lang_model[term] = term_count
+			self.collection_len += term_count
+
+	# Returns the collection probability of a term
+	def collection_probability(self, query_term):
+		return self.collection_lang_model.get(query_term, 0) / self.collection_len
+
+	# Returns the number of times a term occurs in a document
+	def term_frequency(self, query_term, doc_id):
+		postings = index.get(query_term)
+		return postings.get(doc_id, 0) if postings else 0
 
 	def term_ranked_value(self, query_term, doc_id):
 		return 0
 
+	# Returns how much a term that occurs `count` times in a document adds to
+	# the document's score, over the value the term has when it is absent
+	def posting_value(self, query_term, count, doc_id):
+		return 0
+
+	# Returns the document-independent part of the score that all query terms
+	# would add to a document containing none of them, given the query term
+	# counts
+	def query_background(self, query_term_counts):
+		return 0
+
+	# Returns the score of a document containing none of the query terms, from
+	# the value of `query_background`
+	def document_background(self, background, doc_id):
+		return background
+
 	# Returns the overall ranked value, summed over a set of query terms
 	def overall_ranked_value(self, query_terms, doc_id):
 		# Return the actual value, handling duplciate terms with a counter
 		return sum([self.term_ranked_value(term, doc_id) for term in query_terms])
 
-	# Returns a sorted list of ranked documents based on a list of query terms
+	# Returns a sorted list of ranked documents based on a list of query terms.
+	# Only the postings of the query terms are scored; the value of the terms a
+	# document does not contain is added in closed form by
+	# `document_background`.
 	def ranked_documents(self, query_terms):
+		query_term_counts = Counter(query_terms)
+
+		scores = dict()
+		postings_touched = 0
+		with tracing.stage("scoring"):
+			for term, count in query_term_counts.items():
+				postings = index.get(term)
+				if not postings:
+					continue
+				postings_touched += len(postings)
+				for doc_id, fi in postings.items():
+					if fi > 0:
+						scores[doc_id] = scores.get(doc_id, 0) + count * self.posting_value(term, fi, doc_id)
+
+			background = self.query_background(query_term_counts)
+			for doc_id in scores:
+				scores[doc_id] = scores[doc_id] + self.document_background(background, doc_id)
+
+		tracing.count("postings_touched", postings_touched)
+		tracing.count("candidates_scored", len(scores))
+
+		# Return sorted list, breaking ties by descending docID
+		with tracing.stage("sorting"):
+			return sorted(scores.items(), key=lambda x: (x[1], x[0]), reverse=True)
+
+	# Returns the ranked documents for the query terms, limited to the top
+	# `num_results` if given
+	def _ranked_results(self, query_terms, num_results=None):
+		if self.result_cache is not None:
+			return self.result_cache.get_or_rank(cache_key(self, query_terms, num_results), lambda: self.ranked_documents(query_terms)[:num_results])
+		return self.ranked_documents(query_terms)[:num_results]
+
+	# Returns a sorted list of ranked documents by summing `term_ranked_value`
+	# over the query terms for every matching document. This is the original
+	# document-at-a-time implementation, kept as a reference for checking
+	# `ranked_documents`. The scores of both agree to within 1e-12, but as
+	# they are summed in a different order, documents whose scores differ only
+	# in the last bits can be ranked in a different order.
+	def reference_ranked_documents(self, query_terms):
 		# Find matching documents
 		matches = set()
 		for term in query_terms:
@@ -152,11 +626,44 @@ class QueryLikelihoodModel:
 
 		# Get the ranks of all documents
 		ranks = dict()
-		for doc_id in sorted(list(matches), reverse=True):
+		for doc_id in matches:
 			ranks[doc_id] = self.overall_ranked_value(query_terms, doc_id)
 
-		# Return sorted list
-		return sorted(ranks.items(), key=lambda x: x[1], reverse=True)
+		# Return sorted list, breaking ties by descending docID as
+		# `ranked_documents` does
+		return sorted(ranks.items(), key=lambda x: (x[1], x[0]), reverse=True)
+
+	# Returns `posting_value` for every posting as a sparse term-document matrix
+	def batch_posting_values(self, matrix):
+		return matrix.with_values(np.zeros(matrix.counts.nnz))
+
+	# Returns `document_background` for every document of the term-document
+	# matrix as a dense array
+	def batch_document_background(self, background, matrix):
+		return np.full(len(matrix.doc_ids), background)
+
+	# Ranks a list of queries (each a list of query terms) at once, by
+	# multiplying a sparse matrix of query term counts with the posting value
+	# matrix and adding the document backgrounds. Returns one ranked list per
+	# query, identical to `ranked_documents` (limited to `num_results` if
+	# given).
+	def batch_ranked_documents(self, queries, num_results=None):
+		matrix = term_document_matrix()
+		query_term_counts = [Counter(query_terms) for query_terms in queries]
+		query_matrix = matrix.query_matrix([list(counts.items()) for counts in query_term_counts])
+		scores = query_matrix @ self.batch_posting_values(matrix)
+		candidates = matrix.candidates(query_matrix)
+		results = []
+		for i, counts in enumerate(query_term_counts):
+			row_scores = matrix.dense_row(scores, i) + self.batch_document_background(self.query_background(counts), matrix)
+			results.append(matrix.top_documents(row_scores, matrix.row_columns(candidates, i), num_results))
+		return results
+
+	# Processes the query file at the given path, scoring all queries at once
+	def process_query_file_batch(self, query_file_path, num_results=None):
+		queries = read_query_file(query_file_path)
+		ranked_results = self.batch_ranked_documents([_get_terms(query_string) for _, query_string in queries], num_results)
+		print_trec_results([query_id for query_id, _ in queries], ranked_results, "QLM")
 
 	# Processes the query file at the given path
 	def process_query_file(self, query_file_path, num_results=None):
@@ -164,144 +671,322 @@ class QueryLikelihoodModel:
 			reader = csv_reader(query_file, delimiter='\t')
 			for query_row in reader:
 				query_id = query_row[0]
-				query_terms = _get_terms(query_row[1])
-				docs = self.ranked_documents(query_terms)
-				if num_results is not None:
-					docs = docs[:num_results]
+				tracing.begin_query(query_id.strip(), "QLM")
+				with tracing.stage("tokenize"):
+					query_terms = _get_terms(query_row[1])
+				docs = self._ranked_results(query_terms, num_results)
 				lines = ["%s Q0 %s %s %s QLM" % (query_id, doc_id, idx+1, score) for idx, (doc_id, score) in enumerate(docs)]
 				print("\n".join(lines))
+				tracing.end_query()
 
 class JMQueryLikelihoodModel(QueryLikelihoodModel):
 
 	def __init__(self, λ):
 		super().__init__()
 		self.λ = λ
+		self._batch_λ = None
+		self._batch_values = None
+
+	def cache_params(self):
+		return (self.λ,)
 
 	def term_ranked_value(self, query_term, doc_id):
-		p_qi_D = self.models[doc_id][query_term] / len(self.models[doc_id])
-		pi_qi_collection = self.collection_lang_model[query_term] / self.collection_len
+		p_qi_D = self.term_frequency(query_term, doc_id) / self.doc_lengths[doc_id]
+		pi_qi_collection = self.collection_probability(query_term)
 		return log((1 - self.λ) * p_qi_D + self.λ * pi_qi_collection) if pi_qi_collection > 0 else 0.0
 
+	# log((1 - λ) * f / |D| + λ * P(t|C)) - log(λ * P(t|C))
+	def posting_value(self, query_term, count, doc_id):
+		pi_qi_collection = self.collection_probability(query_term)
+		return log((1 - self.λ) * (count / self.doc_lengths[doc_id]) + self.λ * pi_qi_collection) - log(self.λ * pi_qi_collection)
+
+	# The sum of log(λ * P(t|C)) over the query terms, the same for every
+	# document
+	def query_background(self, query_term_counts):
+		background = 0
+		for term, count in query_term_counts.items():
+			pi_qi_collection = self.collection_probability(term)
+			if pi_qi_collection > 0:
+				background = background + count * log(self.λ * pi_qi_collection)
+		return background
+
+	# The arguments of the logarithms are computed for all postings at once.
+	# The logarithms themselves are taken with `log` rather than `np.log`,
+	# whose vectorized implementation can differ in the last bit, so that the
+	# values are the same as those of `posting_value`.
+	def batch_posting_values(self, matrix):
+		# Computed once per λ
+		if self._batch_λ != self.λ:
+			row_probabilities = [self.collection_probability(term) for term in matrix.term_rows]
+			row_backgrounds = np.array([log(self.λ * pi_qi_collection) for pi_qi_collection in row_probabilities])
+			posting_rows = np.repeat(np.arange(len(row_probabilities)), np.diff(matrix.counts.indptr))
+			p_qi_D = matrix.counts.data / matrix.unique_terms[matrix.counts.indices]
+			smoothed = (1 - self.λ) * p_qi_D + self.λ * np.array(row_probabilities)[posting_rows]
+			self._batch_values = matrix.with_values(np.fromiter(map(log, smoothed.tolist()), np.float64, len(smoothed)) - row_backgrounds[posting_rows])
+			self._batch_λ = self.λ
+		return self._batch_values
+
 class DirichletQueryLikelihoodModel(QueryLikelihoodModel):
 
 	def __init__(self, μ):
 			super().__init__()
 			self.μ = μ
 
+	def cache_params(self):
+		return (self.μ,)
+
 	def term_ranked_value(self, query_term, doc_id):
-		f_qi_D = self.models[doc_id][query_term]
-		pi_qi_collection = self.collection_lang_model[query_term] / self.collection_len
+		f_qi_D = self.term_frequency(query_term, doc_id)
+		pi_qi_collection = self.collection_probability(query_term)
 		numerator = f_qi_D + self.μ * (pi_qi_collection)
-		denominator = len(self.models[doc_id]) + self.μ
+		denominator = self.doc_lengths[doc_id] + self.μ
 		return float(numerator) / float(denominator)
 
+	# f / (|D| + μ)
+	def posting_value(self, query_term, count, doc_id):
+		return count / (self.doc_lengths[doc_id] + self.μ)
+
+	# μ times the sum of P(t|C) over the query terms
+	def query_background(self, query_term_counts):
+		return self.μ * sum(count * self.collection_probability(term) for term, count in query_term_counts.items())
+
+	# μ * sum(P(t|C)) / (|D| + μ)
+	def document_background(self, background, doc_id):
+		return background / (self.doc_lengths[doc_id] + self.μ)
+
+	def batch_posting_values(self, matrix):
+		return matrix.with_values(matrix.counts.data / (matrix.unique_terms[matrix.counts.indices] + self.μ))
+
+	def batch_document_background(self, background, matrix):
+		return background / (matrix.unique_terms + self.μ)
+
 
 
 terms = doc_lengths
 
+# Reads a TREC relevance file (query ID, Q0, docID, relevance per line) into a
+# dictionary of query ID -> set of relevant docIDs. Query IDs are normalized
+# with `_query_key`.
+def read_relevance_judgements(rel_file_path):
+	judgements = defaultdict(set)
+	with open(rel_file_path, "r", encoding='utf-8') as rel_file:
+		for line in rel_file:
+			content = line.split()
+			if len(content) >= 3:
+				judgements[_query_key(content[0])].add(content[2])
+	return judgements
+
+# Returns the key used for a query ID in relevance judgements (e.g. " 01 " ->
+# "1")
+def _query_key(query_id):
+	query_id = query_id.strip()
+	return str(int(query_id)) if query_id.isdigit() else query_id
+
 class VectorSpaceRetrievalModel:
 
-	def __init__(self):
-		self.temp = copy.deepcopy(index)
+	# Rocchio's Algorithm weights the original query by `alpha`, the centroid
+	# of the relevant documents by `beta` and the centroid of the non-relevant
+	# documents by `gamma`, and keeps the `feedback_terms` highest weighted
+	# terms of the result
+	def __init__(self, alpha=8, beta=16, gamma=4, feedback_terms=100):
 		self.N = len(terms)
+		self.alpha = alpha
+		self.beta = beta
+		self.gamma = gamma
+		self.feedback_terms = feedback_terms
+		self._batch_weights = None
+
+		# Relevance judgements by file path, and document vectors (docID ->
+		# list of (term, weight)), loaded the first time feedback is used
+		self._relevance_judgements = dict()
+		self._document_vectors = None
+
+		# Norms of the (1 + log tf) * idf document vectors, read with the index
+		# (see `read_document_norms`) or computed here if they were not
+		self.document_norms = document_norms if len(document_norms) > 0 else compute_document_norms(index, self.N)
+
+		# Position of each term in the index (see `term_position`), numbered
+		# the first time a query needs it
+		self._term_order = None
+
+		# Generation of the index the model ranks (see `refresh_index`)
+		self.generation = index_generation
+
+		# When set to a `ResultCache`, the results of `_ranked_results` are
+		# cached
+		self.result_cache = None
+
+	# Returns the parameters the rankings depend on, for `cache_key`. Rankings
+	# with relevance feedback are not cached.
+	def cache_params(self):
+		return ()
 
-	# @nm.jit(nopython=True)
 	def computeIDF(self, term):
-		if len(index[term].keys()) != 0:
-			return log(self.N / len(index[term].keys()))
+		if len(index.get(term, {})) != 0:
+			return log(self.N / len(index[term]))
 		else:
 			return 0
 
-	def createWMatrix(self, query):
-		tf_matrix = defaultdict(dict)
-		matches = set()
-		for term in query:
-			matches.update(set(docs_containing(term)))
-		for doc in matches:
-			for term in self.temp.keys():
-				tf_matrix[doc][term] = self.temp[term][doc]
-		return self.computeCosineWeight(tf_matrix)
-
-
-	def computeCosineWeight(self, fmatrix):
-		for doc in fmatrix.keys():
-			tsum = 0
-			term_dict = {}
-			for term, f in fmatrix[doc].items():
-				if f == 0:
-					tf = 0
-				else:
-					tf = (log(f) + 1)
+	# Returns the position of `term` in the index, used to sum query terms in a
+	# fixed order, or None if the term is not indexed. Compact and
+	# memory-mapped indexes number their terms already; the terms of other
+	# indexes are numbered the first time this is called.
+	def term_position(self, term):
+		if isinstance(index, CompactIndex):
+			return index.terms.get(term)
+		if self._term_order is None:
+			self._term_order = {term: i for i, term in enumerate(index.keys())}
+		return self._term_order.get(term)
+
+	# Returns the normalized query vector as a list of (term, weight) pairs in
+	# index order. Query terms are weighted as binary tf times idf, and terms
+	# missing from the index are dropped. The vector is empty if every query
+	# term occurs in every document (idf 0), as no document can score then.
+	def query_vector(self, query_terms):
+		positions = {term: self.term_position(term) for term in set(query_terms)}
+		query_terms = sorted((term for term, position in positions.items() if position is not None), key=positions.get)
+		weights = [(log(1) + 1) * self.computeIDF(term) for term in query_terms]
+		sqsum = sqrt(sum(weight ** 2 for weight in weights))
+		if sqsum == 0:
+			return []
+		return [(term, weight / sqsum) for term, weight in zip(query_terms, weights)]
+
+	# Returns a sorted list of ranked documents based on a list of query terms,
+	# scored by the cosine of the query and document vectors. Only the postings
+	# of the query terms are read.
+	def ranked_documents(self, query_terms):
+		return self.ranked_documents_for_vector(self.query_vector(query_terms))
+
+	# Returns the ranked documents for the query terms, limited to the top
+	# `num_results` if given
+	def _ranked_results(self, query_terms, num_results=None):
+		if self.result_cache is not None:
+			return self.result_cache.get_or_rank(cache_key(self, query_terms, num_results), lambda: self.ranked_documents(query_terms)[:num_results])
+		return self.ranked_documents(query_terms)[:num_results]
+
+	# Returns a sorted list of ranked documents for a query vector given as a
+	# list of (term, weight) pairs
+	def ranked_documents_for_vector(self, query_vector):
+		scores = dict()
+		postings_touched = 0
+		with tracing.stage("scoring"):
+			for term, query_weight in query_vector:
 				idf = self.computeIDF(term)
-				term_dict[term] = tf * idf
-				tsum += ((tf * idf) ** 2)
-			sqsum = sqrt(tsum)
-
-			for (t, k) in term_dict.items():
-				term_dict[t] = k / sqsum
-			fmatrix[doc] = term_dict
-		return fmatrix
-	# Given that the cosine measure normalization is incorporated into the weights, the score for a document is computed
-	# using simply the dot product of the document and query vectors
-	def createQVec(self, query):
-		q_vec = defaultdict(dict)
-		q_vec["Query"] = defaultdict(float)
-		for k in index.keys():
-			for w in query:
-				if w == k:
-					q_vec["Query"][k] = 1
-					break
-				else:
-					q_vec["Query"][k] = 0
-		return self.computeCosineWeight(q_vec)
-
-	def rocchioVec(self, rel_file_path, query_vec, query_id, dvec):
-		with open(rel_file_path, "r", encoding='utf-8') as rel_file:
-			data = [line.strip() for line in rel_file]
-		rel_id = list(chain(*[re.findall("^\d*", s) for s in data]))
-		rel_docids = list(chain(*[re.findall("\w+-\w+", s) for s in data]))
-		rel_list = list(zip(rel_id, rel_docids))  # zipping them into tuples of (id, docid) for rel reference.
-		r_vec = defaultdict(partial(defaultdict, int))
-		reldocs = [f for i, f in rel_list if i == str(int(query_id))]
-		nonreldocs = list(set(dvec.keys()) - set(reldocs))
-		if len(reldocs) != 0 and len(nonreldocs) != 0:
-			for k, qw in query_vec["Query"].items():
-				rel_sum = 0
-				nonrel_sum = 0
-				for doc in reldocs:
-					rel_sum += dvec[doc][k]
-				for doc in nonreldocs:
-					nonrel_sum += dvec[doc][k]
-				alphaval = 8
-				betaval = 16
-				gammaval = 4
-				r_vec["Query"][k] = alphaval * qw + betaval * (rel_sum / len(reldocs)) + gammaval * (
-							nonrel_sum / len(nonreldocs))
-		return (r_vec)
-
-
+				postings_touched += len(index[term])
+				for doc_id, f in index[term].items():
+					if f > 0:
+						scores[doc_id] = scores.get(doc_id, 0) + query_weight * (((log(f) + 1) * idf) / self.document_norms[doc_id])
+
+		tracing.count("postings_touched", postings_touched)
+		tracing.count("candidates_scored", len(scores))
+
+		# Return sorted list, breaking ties by descending docID
+		with tracing.stage("sorting"):
+			return sorted(scores.items(), key=lambda x: (x[1], x[0]), reverse=True)
+
+	# Returns the relevance judgements in the file at `rel_file_path`, reading
+	# the file only once
+	def relevance_judgements(self, rel_file_path):
+		if rel_file_path not in self._relevance_judgements:
+			self._relevance_judgements[rel_file_path] = read_relevance_judgements(rel_file_path)
+		return self._relevance_judgements[rel_file_path]
+
+	# Returns the normalized tf-idf vector of every document, as a dictionary
+	# of docID -> list of (term, weight) pairs
+	def document_vectors(self):
+		if self._document_vectors is None:
+			self._document_vectors = defaultdict(list)
+			for term, postings in index.items():
+				idf = self.computeIDF(term)
+				for doc_id, f in postings.items():
+					if f > 0:
+						self._document_vectors[doc_id].append((term, ((log(f) + 1) * idf) / self.document_norms[doc_id]))
+		return self._document_vectors
+
+	# Returns the centroid of the vectors of the given documents as a
+	# dictionary of term -> weight
+	def centroid(self, doc_ids):
+		document_vectors = self.document_vectors()
+		centroid = defaultdict(float)
+		for doc_id in doc_ids:
+			for term, weight in document_vectors.get(doc_id, []):
+				centroid[term] += weight
+		for term in centroid:
+			centroid[term] /= len(doc_ids)
+		return centroid
+
+	# Returns the query vector modified with Rocchio's Algorithm, from a query
+	# vector and the relevant and non-relevant docIDs, truncated to its
+	# `feedback_terms` highest (positive) weighted terms
+	def rocchio_query_vector(self, query_vector, relevant_docs, non_relevant_docs):
+		modified = defaultdict(float)
+		for term, weight in query_vector:
+			modified[term] += self.alpha * weight
+		if len(relevant_docs) > 0:
+			for term, weight in self.centroid(relevant_docs).items():
+				modified[term] += self.beta * weight
+		if len(non_relevant_docs) > 0:
+			for term, weight in self.centroid(non_relevant_docs).items():
+				modified[term] -= self.gamma * weight
+
+		weighted_terms = sorted(((term, weight) for term, weight in modified.items() if weight > 0), key=lambda x: (x[1], x[0]), reverse=True)
+		return weighted_terms[:self.feedback_terms]
+
+	# Returns a sorted list of ranked documents for the query terms, after
+	# modifying the query with Rocchio's Algorithm. The documents matching the
+	# original query that are not judged relevant form the non-relevant set.
+	def feedback_ranked_documents(self, query_terms, relevant_docs):
+		query_vector = self.query_vector(query_terms)
+		non_relevant_docs = [doc_id for doc_id, _ in self.ranked_documents_for_vector(query_vector) if doc_id not in relevant_docs]
+		return self.ranked_documents_for_vector(self.rocchio_query_vector(query_vector, relevant_docs, non_relevant_docs))
+
+	# Returns the cosine-normalized tf-idf weight of every posting as a sparse
+	# term-document matrix
+	def batch_weights(self):
+		if self._batch_weights is None:
+			matrix = term_document_matrix()
+			counts = matrix.counts.data.tolist()
+			columns = matrix.counts.indices.tolist()
+			weights = []
+			for term, row in matrix.term_rows.items():
+				idf = self.computeIDF(term)
+				for j in range(matrix.counts.indptr[row], matrix.counts.indptr[row + 1]):
+					weights.append(((log(counts[j]) + 1) * idf) / self.document_norms[matrix.doc_ids[columns[j]]])
+			self._batch_weights = matrix.with_values(weights)
+		return self._batch_weights
+
+	# Ranks a list of queries (each a list of query terms) at once, by
+	# multiplying a sparse matrix of normalized query vectors with the
+	# normalized document weight matrix. Returns one ranked list per query
+	# (limited to `num_results` if given).
+	def batch_ranked_documents(self, queries, num_results=None):
+		matrix = term_document_matrix()
+		query_matrix = matrix.query_matrix([self.query_vector(query_terms) for query_terms in queries])
+		scores = query_matrix @ self.batch_weights()
+		candidates = matrix.candidates(query_matrix)
+		return [matrix.top_documents(matrix.dense_row(scores, i), matrix.row_columns(candidates, i), num_results) for i in range(len(queries))]
+
+	# Processes the query file at the given path, scoring all queries at once
+	def process_query_file_batch(self, query_file_path, num_results=None):
+		queries = read_query_file(query_file_path)
+		ranked_results = self.batch_ranked_documents([_get_terms(query_string) for _, query_string in queries], num_results)
+		print_trec_results([query_id for query_id, _ in queries], ranked_results, "VectorSpace")
+
+	# Processes the query file at the given path. If a relevance file is given,
+	# each query is modified with Rocchio's Algorithm using its judgements.
 	def process_query_file(self, query_file_path, rel_file_path=None, num_results=None):
 		with open(query_file_path) as query_file:
 			reader = csv_reader(query_file, delimiter='\t')
 			for query_row in reader:
 				query_id = query_row[0]
-				input_query = query_row[1]
-				query_vec = self.createQVec(input_query)
-				print("Created Query vector")
-				dvec_matrix = self.createWMatrix(input_query)
-				print("Created Doc Vector")
-
-				# Compute Rocchio Vector if a relevance file is provided
-				if rel_file_path is not None:
-					query_vec = self.rocchioVec(rel_file_path, query_vec, query_id,
-												dvec_matrix)  # computing modified optimal query vector
-				# using Rocchio's Algorithm.
-				for doc in dvec_matrix:
-					rank = [(dvec_matrix[doc][key]) * (query_vec["Query"].get(key)) for key in dvec_matrix[doc]]
-					dvec_matrix[doc] = sum(rank)
-				if num_results is not None:
-					docs = Counter(dvec_matrix)  # using collections.Counter for efficient sorting and using most_common()
-					lines = ["%s Q0 %s %s %s VectorSpace" % (query_id, doc_id, idx + 1, score) for idx, (doc_id, score)
-							 in
-							 enumerate(docs.most_common(num_results))]
-					print("\n".join(lines))
+				tracing.begin_query(query_id.strip(), "VectorSpace")
+				with tracing.stage("tokenize"):
+					query_terms = _get_terms(query_row[1])
+				if rel_file_path is None:
+					docs = self._ranked_results(query_terms, num_results)
+				else:
+					relevant_docs = self.relevance_judgements(rel_file_path).get(_query_key(query_id), set())
+					docs = self.feedback_ranked_documents(query_terms, relevant_docs)[:num_results]
+				lines = ["%s Q0 %s %s %s VectorSpace" % (query_id, doc_id, idx + 1, score) for idx, (doc_id, score) in enumerate(docs)]
+				print("\n".join(lines))
+				tracing.end_query()
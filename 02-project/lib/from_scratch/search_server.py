@@ -0,0 +1,373 @@
+from . import retrieval_model
+from .benchmark import MODEL_ARGUMENTS, MODELS
+from .indexer import current_generation
+from .proximity import parse_query
+from .result_cache import DEFAULT_MAX_ENTRIES, ResultCache, cache_key
+from .spell_corrector import SpellCorrector
+from lib.shared_utils import summarizer
+
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from json import dumps
+from multiprocessing import get_context
+from os.path import basename, splitext
+from sys import stderr
+from time import perf_counter, time
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import numpy as np
+
+# A long-running search server answering ranked, snippet and spelling requests
+# over HTTP, on a TCP port or a Unix socket, with the index read once.
+#
+# The event loop only parses requests, looks up the result cache and writes
+# responses. Scoring, snippets and spelling run in a pool of worker processes
+# forked after the index has been read and the models built, so that they
+# share them (copy-on-write) and requests are answered in parallel. With no
+# worker processes, they run in threads of the event loop's default executor.
+# Lucene searches run in a pool of threads attached to the JVM, as the JVM
+# does not survive a fork.
+#
+# Endpoints (GET, with URL query parameters):
+#
+#   /search?q=...&model=bm25&r=10    ranked documents
+#   /snippets?q=...&model=bm25&r=10  ranked documents with their snippets
+#   /spelling?q=...                  suggestions for the unknown terms and a
+#                                    correction of the whole query
+#   /health                          status, index generation, models
+#   /metrics                         request counts, errors and latency
+#                                    percentiles per endpoint, result cache
+#                                    statistics
+#
+# Responses are JSON. Bad requests get status 400 with an "error" message.
+#
+# The models and the spell corrector are built again when the index
+# generation of the process holding them changes. The worker processes are
+# forked copies, though, so an index read again by the server process after
+# they started is not seen by them: restart the server to serve a new index.
+
+# Number of latencies kept per endpoint for the percentiles of /metrics
+LATENCY_WINDOW = 1024
+
+# Latency percentiles reported by /metrics
+PERCENTILES = (50, 90, 99)
+
+# Number of threads running Lucene searches
+LUCENE_THREADS = 4
+
+# Number of results returned when `r` is not given
+DEFAULT_NUM_RESULTS = 10
+
+# Number of suggestions returned for each unknown term
+SUGGESTION_LIMIT = 6
+
+# State of the worker processes, set by `SearchServer` before they are forked:
+# the retrieval models by name, the spell corrector, and the (path, extension)
+# of the documents for snippets
+_models = dict()
+_spell_corrector = None
+_documents = (None, None)
+
+# Builds the retrieval models named `model_names` and the spell corrector from
+# the index bound in the retrieval models
+def _build_models(model_names):
+	global _spell_corrector
+	_models.clear()
+	for name in model_names:
+		class_name, _ = MODELS[name]
+		_models[name] = getattr(retrieval_model, class_name)(*MODEL_ARGUMENTS[class_name])
+	indexes = retrieval_model.indexes
+	bigram_index = retrieval_model.ngram_index if retrieval_model.ngram_index is not None else (indexes[1] if len(indexes[1]) > 0 else None)
+	_spell_corrector = SpellCorrector(indexes[0], retrieval_model.spelling_index, bigram_index)
+	# Built once here rather than in every worker
+	_spell_corrector.spelling_index()
+
+# Builds the models again if the index has changed since they were built
+def _refresh_models():
+	if retrieval_model.refresh_index():
+		_build_models(list(_models.keys()))
+
+# Returns the ranked (docID, score) list of a query. Runs in a worker.
+def _rank(name, query_terms, operators, num_results):
+	_refresh_models()
+	model = _models[name]
+	if operators:
+		return model._ranked_results(query_terms, num_results, operators)
+	return model._ranked_results(query_terms, num_results)
+
+# Returns the snippets of the documents for the query terms. Runs in a worker.
+def _snippets(doc_ids, query_terms):
+	docs_path, docs_ext = _documents
+	return [summarizer.summarize_document(docs_path, doc_id, docs_ext, query_terms, limit=2) for doc_id in doc_ids]
+
+# Returns the suggestions for the unknown query terms, and the correction of
+# the whole query. Runs in a worker.
+def _spelling(query_terms):
+	_refresh_models()
+	vocabulary = _spell_corrector.spelling_index()
+	suggestions = {term: _spell_corrector.suggestions(term)[:SUGGESTION_LIMIT] for term in query_terms if term not in vocabulary}
+	return {"suggestions": suggestions, "correction": _spell_corrector.correct_query(query_terms)}
+
+def _ready(_):
+	return True
+
+# Searches a Lucene index from threads attached to the JVM
+class LuceneSearcher:
+
+	def __init__(self, index_path):
+		from lib.lucene.basic_index_query import FILENAME_FIELD_NAME, IndexSearcher, get_index_reader, initialize_lucene, perform_query
+		initialize_lucene()
+		self.index_path = index_path
+		self.reader = get_index_reader(index_path)
+		self.searcher = IndexSearcher(self.reader)
+		self.filename_field = FILENAME_FIELD_NAME
+		self.perform_query = perform_query
+
+		# Lucene indexes are not versioned by the indexer
+		self.generation = 0
+
+	def cache_params(self):
+		return ()
+
+	# Returns the ranked (docID, score) list of `query_string`
+	def ranked_documents(self, query_string, num_results):
+		results = self.perform_query(self.reader, self.searcher, query_string, self.index_path, num_results, k=0)
+		return [(splitext(basename(self.searcher.doc(result.doc).get(self.filename_field)))[0], float(result.score)) for result in results]
+
+def _attach_lucene_thread():
+	import lucene
+	lucene.getVMEnv().attachCurrentThread()
+
+# Request counts, errors and recent latencies of an endpoint
+class EndpointMetrics:
+
+	def __init__(self):
+		self.requests = 0
+		self.errors = 0
+		self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+	def record(self, seconds, status):
+		self.requests += 1
+		if status >= 400:
+			self.errors += 1
+		self.latencies.append(seconds)
+
+	def summary(self):
+		summary = {"requests": self.requests, "errors": self.errors}
+		if len(self.latencies) > 0:
+			milliseconds = np.array(self.latencies) * 1000
+			summary["latency_ms"] = {"mean": float(milliseconds.mean()), "max": float(milliseconds.max())}
+			for percentile in PERCENTILES:
+				summary["latency_ms"]["p%s" % percentile] = float(np.percentile(milliseconds, percentile))
+		return summary
+
+class SearchServer:
+
+	# Builds the retrieval models `models` (names of `MODELS`) from the index
+	# read by the calling script. Snippets are read from `docs_path` (files
+	# named `<docID><docs_ext>`), unless a sentence or document store was read
+	# into the summarizer. The `lucene_index_path` adds the "lucene" model.
+	def __init__(self, models=("bm25",), workers=1, cache_size=DEFAULT_MAX_ENTRIES, docs_path=None, docs_ext=".html", lucene_index_path=None):
+		global _documents
+		retrieval_model.refresh_index()
+		_build_models(models)
+		_documents = (docs_path, docs_ext)
+
+		self.model_names = list(models)
+		self.lucene = LuceneSearcher(lucene_index_path) if lucene_index_path is not None else None
+		if self.lucene is not None:
+			self.model_names.append("lucene")
+		self.workers = workers
+		self.result_cache = ResultCache(cache_size) if cache_size > 0 else None
+		self.has_documents = docs_path is not None or summarizer.sentence_store is not None or summarizer.document_store is not None
+
+		self.pool = None
+		self.lucene_pool = None
+		self.endpoint_metrics = defaultdict(EndpointMetrics)
+		self.in_flight = 0
+		self.started = time()
+		self.routes = {
+			"/search": self.search,
+			"/snippets": self.snippets,
+			"/spelling": self.spelling,
+			"/health": self.health,
+			"/metrics": self.metrics,
+		}
+
+	# Starts the worker processes and threads. The worker processes are forked
+	# at once, before any event loop thread exists.
+	def start_workers(self):
+		if self.workers > 0:
+			self.pool = ProcessPoolExecutor(self.workers, mp_context=get_context("fork"))
+			list(self.pool.map(_ready, range(self.workers)))
+		if self.lucene is not None:
+			self.lucene_pool = ThreadPoolExecutor(LUCENE_THREADS, initializer=_attach_lucene_thread)
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.shutdown()
+		if self.lucene_pool is not None:
+			self.lucene_pool.shutdown()
+
+	async def _offload(self, function, *args, pool=None):
+		return await asyncio.get_running_loop().run_in_executor(pool or self.pool, function, *args)
+
+	# Returns the (query string, analyzed terms, operators, model name, number
+	# of results) of the parameters of a query request
+	def _query(self, params):
+		query_string = params.get("q", "").strip()
+		if not query_string:
+			raise ValueError("missing query (q)")
+		name = params.get("model", self.model_names[0] if len(self.model_names) > 0 else None)
+		if name not in self.model_names:
+			raise ValueError("unknown model %r (serving %s)" % (name, ", ".join(self.model_names)))
+		try:
+			num_results = int(params.get("r", DEFAULT_NUM_RESULTS))
+		except ValueError:
+			raise ValueError("the number of results (r) must be an integer")
+		if num_results < 1:
+			raise ValueError("the number of results (r) must be positive")
+		query_text, operators = parse_query(query_string, retrieval_model._get_terms) if name == "bm25" else (query_string, ())
+		return (query_string, retrieval_model._get_terms(query_text), tuple(operators), name, num_results)
+
+	# Returns the ranked documents of a query, and whether they were cached
+	async def _ranked_documents(self, query_string, query_terms, operators, name, num_results):
+		if name == "lucene":
+			model, key_terms = self.lucene, (query_string,)
+		else:
+			_refresh_models()
+			model, key_terms = _models[name], query_terms
+		key = cache_key(model, key_terms, num_results, operators)
+		if self.result_cache is not None:
+			results = self.result_cache.get(key)
+			if results is not None:
+				return (results, True)
+		if name == "lucene":
+			results = await self._offload(self.lucene.ranked_documents, query_string, num_results, pool=self.lucene_pool)
+		else:
+			results = await self._offload(_rank, name, query_terms, operators, num_results)
+		if self.result_cache is not None:
+			self.result_cache.put(key, results)
+		return (results, False)
+
+	async def search(self, params):
+		query_string, query_terms, operators, name, num_results = self._query(params)
+		results, cached = await self._ranked_documents(query_string, query_terms, operators, name, num_results)
+		return {"query": query_string, "model": name, "cached": cached, "results": [{"doc_id": doc_id, "score": score} for doc_id, score in results]}
+
+	async def snippets(self, params):
+		if not self.has_documents:
+			raise ValueError("snippets need the documents, or a sentence or document store")
+		query_string, query_terms, operators, name, num_results = self._query(params)
+		results, cached = await self._ranked_documents(query_string, query_terms, operators, name, num_results)
+		snippets = await self._offload(_snippets, [doc_id for doc_id, _ in results], query_terms)
+		return {"query": query_string, "model": name, "cached": cached, "results": [{"doc_id": doc_id, "score": score, "snippet": snippet} for (doc_id, score), snippet in zip(results, snippets)]}
+
+	async def spelling(self, params):
+		query_string = params.get("q", "").strip()
+		if not query_string:
+			raise ValueError("missing query (q)")
+		query_terms = retrieval_model._get_terms(query_string)
+		result = await self._offload(_spelling, query_terms)
+		return dict(result, query=query_string)
+
+	def health(self, params):
+		return {
+			"status": "ok",
+			"uptime_s": time() - self.started,
+			"generation": current_generation(),
+			"documents": len(retrieval_model.doc_lengths),
+			"models": self.model_names,
+			"workers": self.workers,
+			"in_flight": self.in_flight,
+		}
+
+	def metrics(self, params):
+		return {
+			"endpoints": {path: metrics.summary() for path, metrics in sorted(self.endpoint_metrics.items())},
+			"in_flight": self.in_flight,
+			"result_cache": self.result_cache.stats() if self.result_cache is not None else None,
+		}
+
+	# Returns the (status, response dictionary) of a request
+	async def dispatch(self, method, target):
+		url = urlsplit(target)
+		handler = self.routes.get(url.path)
+		if handler is None:
+			return (404, {"error": "unknown path %s" % url.path})
+		if method != "GET":
+			return (405, {"error": "only GET is supported"})
+
+		params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+		start = perf_counter()
+		self.in_flight += 1
+		try:
+			response = handler(params)
+			if asyncio.iscoroutine(response):
+				response = await response
+			status = 200
+		except ValueError as error:
+			status, response = 400, {"error": str(error)}
+		except Exception as error:
+			status, response = 500, {"error": "%s: %s" % (type(error).__name__, error)}
+		finally:
+			self.in_flight -= 1
+		self.endpoint_metrics[url.path].record(perf_counter() - start, status)
+		return (status, response)
+
+	# Answers the HTTP/1.1 requests of a connection, keeping it open unless the
+	# client asks to close it
+	async def handle_connection(self, reader, writer):
+		try:
+			while True:
+				request_line = await reader.readline()
+				if not request_line.strip():
+					break
+				headers = dict()
+				while True:
+					line = await reader.readline()
+					if not line.strip():
+						break
+					name, _, value = line.decode("latin-1").partition(":")
+					headers[name.strip().lower()] = value.strip()
+				parts = request_line.decode("latin-1").split()
+				if len(parts) != 3:
+					status, response, version = 400, {"error": "malformed request line"}, "HTTP/1.0"
+				else:
+					method, target, version = parts
+					if int(headers.get("content-length", 0) or 0) > 0:
+						await reader.readexactly(int(headers["content-length"]))
+					status, response = await self.dispatch(method, target)
+				keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+				body = dumps(response).encode("utf-8")
+				writer.write(("HTTP/1.1 %s %s\r\nContent-Type: application/json\r\nContent-Length: %s\r\nConnection: %s\r\n\r\n" % (status, HTTPStatus(status).phrase, len(body), "keep-alive" if keep_alive else "close")).encode("latin-1") + body)
+				await writer.drain()
+				if not keep_alive:
+					break
+		except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+	# Serves requests on `host`:`port`, or on the Unix socket at `unix_socket`
+	# if given, until cancelled
+	async def serve(self, host="127.0.0.1", port=8080, unix_socket=None):
+		if unix_socket is not None:
+			server = await asyncio.start_unix_server(self.handle_connection, unix_socket)
+			print("Serving on %s" % unix_socket, file=stderr)
+		else:
+			server = await asyncio.start_server(self.handle_connection, host, port)
+			print("Serving on http://%s:%s" % (host, port), file=stderr)
+		async with server:
+			await server.serve_forever()
+
+	# Starts the workers and serves requests until interrupted
+	def run(self, host="127.0.0.1", port=8080, unix_socket=None):
+		self.start_workers()
+		try:
+			asyncio.run(self.serve(host, port, unix_socket))
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self.close()
@@ -0,0 +1,311 @@
+from .indexer import INDEX_FILE_PATTERN, document_id, index_files, merge_index_structures, new_index_structures
+
+from collections import defaultdict
+from glob import glob
+from os import makedirs, remove, replace, stat
+from os.path import exists, join
+from pickle import load as pickle_load, dump as pickle_dump
+from threading import Lock, Thread
+
+# A segmented index directory holds an index that can be updated without
+# being rebuilt:
+#
+#   manifest.p       the list of live segments, their tombstones and the
+#                    signature (size, mtime) of every indexed document
+#   segment-<g>.p    the (indexes, term counts, positional index) of the
+#                    documents added in generation g, or of a merge
+#
+# Added or changed documents are indexed into a new (delta) segment, and their
+# older copies are marked deleted with a tombstone in the segment holding them.
+# Segment files are never modified; the manifest is replaced atomically after
+# each update, so a crash leaves the previous generation intact. Only one
+# process should update a directory at a time.
+#
+# Segments replaced by a merge are not removed at once, since other processes
+# may have read the previous manifest and still be reading them: they are
+# listed as retired in the manifest and removed by the first commit after the
+# merge. A process that still finds a segment gone (having read a manifest
+# more than one commit old) reads the manifest again.
+#
+# Each `snapshot` checks whether the manifest has been replaced since it was
+# read (by another process updating the directory), and reads the manifest and
+# its segments again if the generation has changed.
+MANIFEST_FILE = "manifest.p"
+SEGMENT_FILE = "segment-%s.p"
+
+# Segments are merged when there are more than `MAX_SEGMENTS` of them, or when
+# more than `MAX_DELETED_RATIO` of the documents they hold are deleted
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.25
+
+# Number of times the manifest is read again when one of its segments was
+# removed while opening the index
+OPEN_RETRIES = 3
+
+# Opened segmented indexes by directory, so that segments are read once per
+# process and generation
+_opened = dict()
+
+# Returns the `SegmentedIndex` for `directory`, opening it once per process.
+# Its snapshots follow the updates made to the directory by other processes.
+def open_segments(directory):
+	if directory not in _opened:
+		_opened[directory] = SegmentedIndex(directory)
+	return _opened[directory]
+
+# Returns whether `directory` holds a segmented index
+def is_segment_directory(directory):
+	return exists(join(directory, MANIFEST_FILE))
+
+# Returns the signature used to detect changes to the file at `path`
+def file_signature(path):
+	file_stat = stat(path)
+	return (file_stat.st_size, file_stat.st_mtime_ns)
+
+# An immutable view of a segmented index at one generation. The merged index
+# structures are built the first time they are used, and are unaffected by
+# later updates and merges.
+class Snapshot:
+
+	def __init__(self, generation, segments):
+		self.generation = generation
+		# Tuple of (segment structures, frozenset of deleted docIDs)
+		self.segments = segments
+		self._structures = None
+
+	# Returns the (indexes, term counts, positional index) of the live
+	# documents. Do not modify them: a segment's structures may be returned
+	# as is.
+	def structures(self):
+		if self._structures is None:
+			if len(self.segments) == 1 and len(self.segments[0][1]) == 0:
+				self._structures = self.segments[0][0]
+			else:
+				self._structures = _merged_structures(self.segments)
+		return self._structures
+
+	# Returns the index for the specified `n`-gram value
+	def index(self, n=1):
+		return self.structures()[0][n-1]
+
+	def term_counts(self):
+		return self.structures()[1]
+
+	def positional_index(self):
+		return self.structures()[2]
+
+# An index stored as a list of segments in `directory`, which is created if it
+# does not exist. Documents are added, replaced and deleted with `update`,
+# `add_documents`, `delete_documents` and `update_directory`; readers take a
+# consistent `snapshot`. Segments are merged in a background thread when the
+# thresholds are reached (call `wait` before exiting).
+class SegmentedIndex:
+
+	def __init__(self, directory, max_segments=MAX_SEGMENTS, max_deleted_ratio=MAX_DELETED_RATIO):
+		self.directory = directory
+		self.max_segments = max_segments
+		self.max_deleted_ratio = max_deleted_ratio
+		self.lock = Lock()
+		# Held for the whole of a merge, so that merges run one at a time
+		self.merge_lock = Lock()
+		self.merge_thread = None
+		self._snapshot = None
+		self.generation = None
+
+		makedirs(directory, exist_ok=True)
+		self._open()
+
+	# Reads the manifest and its segments, reading the manifest again if one of
+	# its segments is gone
+	def _open(self):
+		for retry in range(OPEN_RETRIES + 1):
+			try:
+				self._load()
+				return
+			except FileNotFoundError:
+				# A merge by another process removed a segment
+				if retry == OPEN_RETRIES:
+					raise
+
+	# Returns the signature of the manifest file, which changes whenever it is
+	# replaced, or None if there is none yet
+	def _manifest_signature(self):
+		manifest_path = join(self.directory, MANIFEST_FILE)
+		if not exists(manifest_path):
+			return None
+		file_stat = stat(manifest_path)
+		return (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+	# Reads the manifest, and its segments unless they are those of the
+	# generation already read
+	def _load(self):
+		signature = self._manifest_signature()
+		if signature is not None:
+			with open(join(self.directory, MANIFEST_FILE), "rb") as manifest_file:
+				manifest = pickle_load(manifest_file)
+		else:
+			manifest = {"generation": 0, "segments": [], "documents": dict()}
+		self.manifest_signature = signature
+		if manifest["generation"] == self.generation:
+			return
+
+		# List of [segment name, segment structures, set of deleted docIDs]
+		segments = []
+		for name, deleted in manifest["segments"]:
+			with open(join(self.directory, name), "rb") as segment_file:
+				segments.append([name, pickle_load(segment_file), set(deleted)])
+		self.segments = segments
+		self.generation = manifest["generation"]
+		# docID -> file signature of every live document
+		self.documents = manifest["documents"]
+		# List of (segment name, generation) of the segments replaced by a
+		# merge at that generation, whose files are not removed yet
+		self.retired = list(manifest.get("retired", []))
+		self._snapshot = None
+
+	# Returns a consistent snapshot of the live documents, at the latest
+	# generation of the manifest
+	def snapshot(self):
+		with self.lock:
+			if self._manifest_signature() != self.manifest_signature:
+				self._open()
+			if self._snapshot is None:
+				self._snapshot = Snapshot(self.generation, tuple((structures, frozenset(deleted)) for _, structures, deleted in self.segments))
+			return self._snapshot
+
+	# Indexes the files in `file_paths` into a new segment, replacing any
+	# indexed documents with the same docIDs, and deletes the documents in
+	# `deleted_doc_ids`, as a single update. Files are indexed with `workers`
+	# processes.
+	def update(self, file_paths=(), deleted_doc_ids=(), workers=1):
+		file_paths = list(file_paths)
+		signatures = {document_id(path): file_signature(path) for path in file_paths}
+		structures = index_files(file_paths, workers) if len(file_paths) > 0 else None
+
+		with self.lock:
+			removed = set(deleted_doc_ids).union(signatures.keys())
+			self._add_tombstones(self.segments, removed)
+			for doc_id in removed:
+				self.documents.pop(doc_id, None)
+			self.generation += 1
+			if structures is not None:
+				name = SEGMENT_FILE % self.generation
+				self._write_segment(name, structures)
+				self.segments.append([name, structures, set()])
+				self.documents.update(signatures)
+			self._commit()
+		self.maybe_merge()
+
+	def add_documents(self, file_paths, workers=1):
+		self.update(file_paths=file_paths, workers=workers)
+
+	def delete_documents(self, doc_ids):
+		self.update(deleted_doc_ids=doc_ids)
+
+	# Brings the index up to date with the text files in `directory`: new and
+	# changed files (by size and modification time) are indexed, and indexed
+	# documents whose file is gone are deleted.
+	def update_directory(self, directory, workers=1):
+		file_paths = glob(join(directory, INDEX_FILE_PATTERN))
+		with self.lock:
+			changed = [path for path in file_paths if self.documents.get(document_id(path)) != file_signature(path)]
+			deleted = set(self.documents.keys()).difference(document_id(path) for path in file_paths)
+		if len(changed) > 0 or len(deleted) > 0:
+			self.update(changed, deleted, workers)
+
+	# Starts a background merge if the segment thresholds are reached and no
+	# merge is running
+	def maybe_merge(self):
+		with self.lock:
+			if self.merge_thread is not None and self.merge_thread.is_alive():
+				return
+			num_docs = sum(len(structures[1]) for _, structures, _ in self.segments)
+			num_deleted = sum(len(deleted) for _, _, deleted in self.segments)
+			if len(self.segments) > self.max_segments or (num_docs > 0 and num_deleted / num_docs > self.max_deleted_ratio):
+				self.merge_thread = Thread(target=self.merge)
+				self.merge_thread.start()
+
+	# Waits for a running background merge to finish
+	def wait(self):
+		if self.merge_thread is not None:
+			self.merge_thread.join()
+
+	# Merges all current segments into one, dropping deleted documents. Updates
+	# made while merging are kept: segments added meanwhile follow the merged
+	# segment, and documents deleted meanwhile are tombstoned in it.
+	def merge(self):
+		with self.merge_lock:
+			self._merge()
+
+	def _merge(self):
+		with self.lock:
+			merging = [(name, structures, frozenset(deleted)) for name, structures, deleted in self.segments]
+		if len(merging) == 0:
+			return
+
+		structures = _merged_structures([(structures, deleted) for _, structures, deleted in merging])
+		with self.lock:
+			self.generation += 1
+			name = SEGMENT_FILE % self.generation
+			self._write_segment(name, structures)
+			# Documents deleted from the merged segments while merging
+			deleted = set()
+			for (_, _, merged_deleted), (_, _, current_deleted) in zip(merging, self.segments):
+				deleted.update(current_deleted.difference(merged_deleted))
+			self.segments = [[name, structures, deleted]] + self.segments[len(merging):]
+			self.retired.extend((merged_name, self.generation) for merged_name, _, _ in merging)
+			self._commit()
+
+	# Marks the documents in `doc_ids` deleted in the segments holding them
+	@staticmethod
+	def _add_tombstones(segments, doc_ids):
+		for _, structures, deleted in segments:
+			deleted.update(doc_id for doc_id in doc_ids if doc_id in structures[1])
+
+	def _write_segment(self, name, structures):
+		with open(join(self.directory, name), "wb") as segment_file:
+			pickle_dump(structures, segment_file)
+
+	# Atomically replaces the manifest with the current state, and invalidates
+	# the cached snapshot. Segments retired by an earlier commit are removed
+	# once the new manifest is written. Must be called with the lock held.
+	def _commit(self):
+		expired = [name for name, generation in self.retired if generation < self.generation]
+		self.retired = [(name, generation) for name, generation in self.retired if generation == self.generation]
+		manifest = {"generation": self.generation, "segments": [(name, sorted(deleted)) for name, _, deleted in self.segments], "documents": self.documents, "retired": self.retired}
+		manifest_path = join(self.directory, MANIFEST_FILE)
+		with open(manifest_path + ".tmp", "wb") as manifest_file:
+			pickle_dump(manifest, manifest_file)
+		replace(manifest_path + ".tmp", manifest_path)
+		self.manifest_signature = self._manifest_signature()
+		self._snapshot = None
+		for name in expired:
+			if exists(join(self.directory, name)):
+				remove(join(self.directory, name))
+
+# Returns the merged (indexes, term counts, positional index) of the live
+# documents in `segments`, a list of (segment structures, deleted docIDs).
+# Terms and documents keep their segment order; postings are copied, so the
+# segments are not modified.
+def _merged_structures(segments):
+	merged = new_index_structures()
+	for (indexes, term_counts, positional_index), deleted in segments:
+		live = (
+			[_live_postings(index, deleted) for index in indexes],
+			{doc_id: count for doc_id, count in term_counts.items() if doc_id not in deleted},
+			positional_index.without(deleted),
+		)
+		merge_index_structures(merged, live)
+	return merged
+
+# Returns a copy of `index` without the postings of the `deleted` docIDs
+def _live_postings(index, deleted):
+	live = dict()
+	for term, postings in index.items():
+		live_postings = defaultdict(postings.default_factory)
+		for doc_id, value in postings.items():
+			if doc_id not in deleted:
+				live_postings[doc_id] = value
+		if len(live_postings) > 0:
+			live[term] = live_postings
+	return live
@@ -1,23 +1,182 @@
-from collections import defaultdict
-from copy import deepcopy
+from .compact_index import _smallest_array
+from lib.shared_utils import tracing
+
+from array import array
+from bisect import bisect_left
+from math import log
 from re import sub
+from time import perf_counter
+from zlib import crc32
+
+# The largest edit distance of the suggestions
+MAX_EDIT_DISTANCE = 2
+
+# Whole-query correction: the log-probability of each edit between a query
+# term and its correction, the weight of the bigram model interpolated with the
+# unigram model, and the number of candidates kept for each term and of
+# partial corrections kept at each position of the beam search
+EDIT_LOG_PROBABILITY = log(1e-3)
+BIGRAM_WEIGHT = 0.7
+MAX_CANDIDATES = 8
+BEAM_WIDTH = 16
+
+# A symmetric-delete (SymSpell) spelling index over the vocabulary of an index.
+#
+# Every string obtained by deleting up to `max_distance` characters from a
+# vocabulary term maps to the terms it was obtained from. The terms within
+# `max_distance` edits of a word are then among the terms listed under the
+# word's own deletions, so a lookup only generates deletions of the query word
+# (tens of strings rather than tens of thousands of edits), and checks the
+# listed terms with an exact edit distance. The index also holds the
+# collection frequency of every term.
+#
+# Deletions are stored as sorted CRC-32 hashes, with the numbers of their terms
+# in CSR layout (see `CompactIndex`). A hash collision can only add candidates,
+# which the edit distance check then rejects.
+class SpellingIndex:
+
+    def __init__(self, terms, frequencies, delete_hashes, offsets, delete_terms, max_distance):
+        # Vocabulary, and term -> collection frequency
+        self.terms = terms
+        self.frequencies = frequencies
+        # The term numbers for the deletion with hash `delete_hashes[i]` are
+        # `delete_terms[offsets[i]:offsets[i+1]]`; each term is also listed
+        # under itself
+        self.delete_hashes = delete_hashes
+        self.offsets = offsets
+        self.delete_terms = delete_terms
+        self.max_distance = max_distance
+        self.term_count = sum(frequencies.values())
+
+    # Creates the spelling index of the terms of a unigram index (term ->
+    # docID -> count)
+    @classmethod
+    def from_index(cls, unigram_index, max_distance=MAX_EDIT_DISTANCE):
+        frequencies = dict()
+        for term, postings in unigram_index.items():
+            frequency = sum(postings.values())
+            if frequency > 0:
+                frequencies[term] = frequency
+        terms = sorted(frequencies.keys())
+
+        pairs = sorted(set((_hash(delete), term_number) for term_number, term in enumerate(terms) for delete in _deletes(term, max_distance)))
+        delete_hashes = array('I')
+        offsets = [0]
+        for i, (delete_hash, _) in enumerate(pairs):
+            if len(delete_hashes) == 0 or delete_hashes[-1] != delete_hash:
+                if len(delete_hashes) > 0:
+                    offsets.append(i)
+                delete_hashes.append(delete_hash)
+        offsets.append(len(pairs))
+        delete_terms = _smallest_array([term_number for _, term_number in pairs])
+        return cls(terms, frequencies, delete_hashes, _smallest_array(offsets), delete_terms, max_distance)
+
+    # Returns the terms listed under the deletion `delete`
+    def delete_candidates(self, delete):
+        delete_hash = _hash(delete)
+        i = bisect_left(self.delete_hashes, delete_hash)
+        if i == len(self.delete_hashes) or self.delete_hashes[i] != delete_hash:
+            return []
+        return [self.terms[term_number] for term_number in self.delete_terms[self.offsets[i]:self.offsets[i+1]]]
+
+    # Returns the (term, edit distance) of every term within `max_distance`
+    # edits (insertions, deletions, replacements and adjacent swaps) of `word`,
+    # or None if the `deadline` (a `perf_counter` time) passes first
+    def lookup(self, word, max_distance=None, deadline=None):
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = set()
+        for delete in _deletes(word, max_distance):
+            if _expired(deadline):
+                return None
+            candidates.update(self.delete_candidates(delete))
+        results = []
+        for term in candidates:
+            if _expired(deadline):
+                return None
+            distance = edit_distance(word, term, max_distance)
+            if distance <= max_distance:
+                results.append((term, distance))
+        return results
+
+    def __contains__(self, term):
+        return term in self.frequencies
+
+# Returns whether the `perf_counter` time `deadline`, if any, has passed
+def _expired(deadline):
+    return deadline is not None and perf_counter() > deadline
+
+def _hash(string):
+    return crc32(string.encode("utf-8"))
+
+# Returns the set of strings obtained by deleting up to `distance` characters
+# from `word`, including `word` itself
+def _deletes(word, distance):
+    result = {word}
+    current = {word}
+    for _ in range(distance):
+        current = {string[:i] + string[i+1:] for string in current for i in range(len(string))}
+        result.update(current)
+    return result
+
+# Returns the optimal string alignment distance (insertions, deletions,
+# replacements and adjacent swaps) between `a` and `b`, or `max_distance` + 1
+# if it is larger than `max_distance`
+def edit_distance(a, b, max_distance):
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        previous_row, row = row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            row[j] = min(previous_row[j] + 1, row[j-1] + 1, previous_row[j-1] + cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                row[j] = min(row[j], before_previous_row[j-2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+        before_previous_row = previous_row
+    return row[-1]
 
 class SpellCorrector:
     
     # These are the 'in-game' characters for spelling correction
     change_chars = 'abcdefghijklmnopqrstuvwxyz123456789'
 
-    def __init__(self, unigram_index):
-        # Language model: term (str) -> count (int)
-        self.unigram_index = deepcopy(unigram_index)
-        self.term_count = sum([sum(inner_dict.values()) for inner_dict in self.unigram_index.values()])
-    
+    # The spelling index is built from `unigram_index` when it is first needed,
+    # unless one is given (see `write_spelling_index` in the indexer). The
+    # index is not copied. `bigram_index` (n-gram tuple -> docID -> count, or
+    # an `NGramIndex`) provides the bigram statistics for whole-query
+    # correction.
+    def __init__(self, unigram_index, spelling_index=None, bigram_index=None):
+        self.unigram_index = unigram_index
+        self._spelling_index = spelling_index
+        self.bigram_index = bigram_index
+
+        # When set, `print_suggestions` prints a correction of the whole query
+        # (see `correct_query`) found within `time_budget` seconds, if given
+        self.whole_query = False
+        self.time_budget = None
+
+        # Candidates by term and bigram frequencies, kept across queries
+        self._candidates = dict()
+        self._bigram_frequencies = dict()
+
+    def spelling_index(self):
+        if self._spelling_index is None:
+            self._spelling_index = SpellingIndex.from_index(self.unigram_index)
+        return self._spelling_index
+
     # Returns the base probability of a given term
     def p(self, word):
-        return float(sum(self.unigram_index[word].values())) / float(self.term_count)
+        spelling_index = self.spelling_index()
+        return float(spelling_index.frequencies.get(word, 0)) / float(spelling_index.term_count)
     
     # Prints the suggestions for the provided terms.
     def print_suggestions(self, terms):
+        if self.whole_query:
+            self.print_correction(terms)
+            return
         for term in terms:
             sug_text = self._suggestion_text(term)
             if sug_text is not None:
@@ -26,16 +185,20 @@ class SpellCorrector:
     # Returns all possible corrections based on an edit-distance of two. Ranked 
     # by unigram probability of occurance.
     def suggestions(self, word):
-        # Because we used the set `or` operator, usimg the sorted function here 
-        # will automatically list words within 1 edit distance away if 
-        # possible. Otherwise, it will backoff to an edit distance of 2.
-        # It will stop after an edit distance of two for efficiency.
-        return sorted(self.dict_edits(word, distance=1) or self.dict_edits(word, distance=2), key=self.p, reverse=True)
+        # List words within 1 edit distance away if possible. Otherwise, back
+        # off to an edit distance of 2. It will stop after an edit distance of
+        # two for efficiency. Ties are broken alphabetically.
+        candidates = self.spelling_index().lookup(word.lower())
+        tracing.count("spelling_lookups")
+        tracing.count("spelling_candidates", len(candidates))
+        closest = [term for term, distance in candidates if distance <= 1] or [term for term, distance in candidates]
+        frequencies = self.spelling_index().frequencies
+        return sorted(closest, key=lambda term: (-frequencies[term], term))
     
     # Provides the suggestion text based on a given query, or None if no 
     # suggestion should be given.
     def _suggestion_text(self, word, limit=6):
-        if word.lower() not in self.unigram_index.keys():
+        if word.lower() not in self.spelling_index():
             sugs = self.suggestions(word.lower())[:limit]
             if len(sugs) > 0:
                 return "The term '%s' was not found. Did you mean?:\n%s" % (word, "\n".join(sugs))
@@ -44,6 +207,88 @@ class SpellCorrector:
             #print(self.unigram_index[word])
         return None
     
+    # Prints the correction of the whole query, if it differs from the query.
+    def print_correction(self, terms):
+        correction = self.correct_query(terms, self.time_budget)
+        if correction != [term.lower() for term in terms]:
+            print("\nDid you mean: %s" % " ".join(correction))
+
+    # Returns the (candidate, edit distance) pairs for a query term: the term
+    # itself if it is in the vocabulary, or else its `MAX_CANDIDATES` most
+    # likely corrections (the term itself if there are none). Memoized. If the
+    # `deadline` passes before the corrections are found, the term itself is
+    # returned, and is not memoized.
+    def candidates(self, term, deadline=None):
+        if term in self._candidates:
+            tracing.count("spelling_cache_hits")
+        else:
+            tracing.count("spelling_cache_misses")
+            spelling_index = self.spelling_index()
+            if term in spelling_index:
+                self._candidates[term] = [(term, 0)]
+            else:
+                candidates = spelling_index.lookup(term, deadline=deadline)
+                if candidates is None:
+                    return [(term, 0)]
+                tracing.count("spelling_lookups")
+                tracing.count("spelling_candidates", len(candidates))
+                candidates = sorted(candidates, key=lambda candidate: (candidate[1], -spelling_index.frequencies[candidate[0]], candidate[0]))
+                self._candidates[term] = candidates[:MAX_CANDIDATES] or [(term, 0)]
+        return self._candidates[term]
+
+    # Returns the collection frequency of the bigram (`first`, `second`).
+    # Memoized.
+    def bigram_frequency(self, first, second):
+        key = (first, second)
+        if key not in self._bigram_frequencies:
+            postings = None if self.bigram_index is None else self.bigram_index.get(key)
+            self._bigram_frequencies[key] = 0 if postings is None else sum(postings.values())
+        return self._bigram_frequencies[key]
+
+    # Returns the log-probability of `term` following `previous` (None at the
+    # start of the query), interpolating the bigram and unigram models
+    def log_probability(self, term, previous=None):
+        spelling_index = self.spelling_index()
+        # Unknown terms count as half an occurrence
+        frequency = spelling_index.frequencies.get(term, 0.5)
+        probability = frequency / spelling_index.term_count
+        if previous is not None and self.bigram_index is not None:
+            previous_frequency = spelling_index.frequencies.get(previous, 0)
+            bigram_probability = self.bigram_frequency(previous, term) / previous_frequency if previous_frequency > 0 else 0
+            probability = BIGRAM_WEIGHT * bigram_probability + (1 - BIGRAM_WEIGHT) * probability
+        return log(probability)
+
+    # Returns the most likely correction of the whole query `terms`, choosing
+    # among the candidates of every term jointly with a beam search over the
+    # candidate lattice, scored by the bigram language model and an edit
+    # penalty. If `time_budget` (seconds) runs out, the best correction of the
+    # terms searched so far is returned, followed by the remaining terms as
+    # they are. The budget is checked while looking up candidates and for
+    # every partial correction extended, so it is exceeded by at most the time
+    # of one lookup step or of scoring the candidates of one term.
+    def correct_query(self, terms, time_budget=None):
+        deadline = None if time_budget is None else perf_counter() + time_budget
+        terms = [term.lower() for term in terms]
+        # (score, corrected terms) of the best partial corrections
+        beam = [(0.0, [])]
+        for i, term in enumerate(terms):
+            candidates = self.candidates(term, deadline)
+            extended = []
+            for score, corrected in beam:
+                if _expired(deadline):
+                    return beam[0][1] + terms[i:]
+                previous = corrected[-1] if len(corrected) > 0 else None
+                for candidate, distance in candidates:
+                    extended.append((score + self.log_probability(candidate, previous) + distance * EDIT_LOG_PROBABILITY, corrected + [candidate]))
+            # Keep the best partial correction ending in each candidate (the
+            # model only looks one term back), then the best of those
+            best = dict()
+            for score, corrected in extended:
+                if corrected[-1] not in best or score > best[corrected[-1]][0]:
+                    best[corrected[-1]] = (score, corrected)
+            beam = sorted(best.values(), key=lambda x: (-x[0], x[1]))[:BEAM_WIDTH]
+        return beam[0][1]
+
     # Returns a set of all edits within the given edit distance. 
     # Note that this is a recursive function and the list will quickly grow
     # as edit distance increases.
@@ -63,7 +308,7 @@ class SpellCorrector:
     # Returns the exits currently in the vocabulary
     def dict_edits(self, word, distance=1):
         all_edits = self.edits(word, distance=distance)
-        return set(edit for edit in all_edits if edit in self.unigram_index)
+        return set(edit for edit in all_edits if edit in self.spelling_index())
     
     # Return all possible deletions
     def _del_edits(self, word):
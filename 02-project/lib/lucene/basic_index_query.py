@@ -1,3 +1,6 @@
+from ..shared_utils.document_store import DocumentStore
+from ..shared_utils import tracing
+
 import lucene
 from collections import defaultdict
 from csv import reader as csv_reader
@@ -49,26 +52,36 @@ def get_index_reader(path):
 
 # Indexes the document at `file_name` w/ `index_writer`
 def index_file(file_name, index_writer):
-    # Create the document
-    doc = Document()
     file = File(file_name)
     with open(file_name, "r") as input_file:
-        ft = FieldType(TextField.TYPE_NOT_STORED)
-        ft.setStoreTermVectors(True)
-        doc.add(Field(CONTENTS_FIELD_NAME, input_file.read(), ft))
-    doc.add(StringField(PATH_FIELD_NAME, file.getPath(), Field.Store.YES))
-    doc.add(StringField(FILENAME_FIELD_NAME, file.getName(), Field.Store.YES))
+        index_text(input_file.read(), file.getPath(), file.getName(), index_writer)
+
+# Indexes the document `text` w/ `index_writer`, storing its path and file name
+def index_text(text, path, file_name, index_writer):
+    # Create the document
+    doc = Document()
+    ft = FieldType(TextField.TYPE_NOT_STORED)
+    ft.setStoreTermVectors(True)
+    doc.add(Field(CONTENTS_FIELD_NAME, text, ft))
+    doc.add(StringField(PATH_FIELD_NAME, path, Field.Store.YES))
+    doc.add(StringField(FILENAME_FIELD_NAME, file_name, Field.Store.YES))
     
     # Write the document
     index_writer.addDocument(doc)
 
-# Indexes the documents in the given directory to index_path
-def index_documents(directory, index_path):
+# Indexes the documents in the given directory to index_path. If the path of a 
+# document store is given, the documents are read from it instead, by docID.
+def index_documents(directory, index_path, document_store_path=None):
     initialize_lucene()
     index_writer = get_index_writer(index_path)
-    for pattern in DOCUMENT_FILE_PATTERNS:
-        for file_path in glob(join(directory, pattern)):
-            index_file(file_path, index_writer)
+    if document_store_path is not None:
+        document_store = DocumentStore(document_store_path)
+        for doc_id in document_store:
+            index_text(document_store.get_text(doc_id), join(document_store_path, doc_id), doc_id, index_writer)
+    else:
+        for pattern in DOCUMENT_FILE_PATTERNS:
+            for file_path in glob(join(directory, pattern)):
+                index_file(file_path, index_writer)
     
     # Close the index writer
     print("Wrote %d docs to the index." % index_writer.numDocs())
@@ -172,19 +185,23 @@ def perform_query(reader, searcher, query_string, index_path, result_count=100,
     analyzer = StandardAnalyzer()
     
     # Create the initial query based on the provided `query_string`.
-    query = SimpleQueryParser(analyzer, CONTENTS_FIELD_NAME).parse(query_string)
+    with tracing.stage("parse"):
+        query = SimpleQueryParser(analyzer, CONTENTS_FIELD_NAME).parse(query_string)
     
     # If k (number of ranked documents to use for query expansion) is greater than zero,
     # update the query based on psuedo-relevance feedback
     
-    if word_vectors_path is not None:
-        query = get_word2vec_expanded_query(query, reader)
-    else:
-        if k > 0:
-            query = get_expanded_query(query, k, n, reader, searcher)
+    with tracing.stage("expansion"):
+        if word_vectors_path is not None:
+            query = get_word2vec_expanded_query(query, reader)
+        else:
+            if k > 0:
+                query = get_expanded_query(query, k, n, reader, searcher)
     
     # Generate Results
-    results = get_query_results(query, result_count, searcher)
+    with tracing.stage("search"):
+        results = get_query_results(query, result_count, searcher)
+    tracing.count("candidates_scored", results.totalHits.value if hasattr(results.totalHits, "value") else results.totalHits)
     
     # Print and return results
     # print("Found %s Results. Printing Top %s" % (results.totalHits, result_count))
@@ -204,6 +221,9 @@ def process_query_file(index_path, query_file_path, num_results=100, k=10, n=8,
             query_string = query_row[1]
             
             # Get and print 
+            tracing.begin_query(query_id.strip(), "Lucene")
             results = perform_query(reader, searcher, query_string, index_path, num_results, k, n, word_vectors_path)
-            lines = ["%s Q0 %s %s %s Lucene" % (query_id, splitext(basename(searcher.doc(result.doc).get(FILENAME_FIELD_NAME)))[0], idx+1, result.score) for idx, result in enumerate(results)]
+            with tracing.stage("documents"):
+                lines = ["%s Q0 %s %s %s Lucene" % (query_id, splitext(basename(searcher.doc(result.doc).get(FILENAME_FIELD_NAME)))[0], idx+1, result.score) for idx, result in enumerate(results)]
             print("\n".join(lines))
+            tracing.end_query()
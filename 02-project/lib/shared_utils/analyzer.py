@@ -0,0 +1,74 @@
+from re import compile
+
+# Tokens left after punctuation handling: runs of alphanumeric characters and
+# hyphens
+TOKEN_PATTERN = compile('[0-9a-zA-Z-]+')
+
+# Characters removed by punctuation handling
+PUNCTUATION_PATTERN = compile('[^0-9a-zA-Z-]+')
+
+# Words that stopping applies to when punctuation is kept: whole words that are
+# not part of a hyphenated word
+WORD_PATTERN = compile(r'(?<![\w-])\w+(?![\w-])')
+
+# Reads a stop word list with one stop word per line
+def read_stop_words(path):
+    with open(path, "r") as stop_words_file:
+        return [line.rstrip('\n') for line in stop_words_file]
+
+# Turns text into terms the same way for documents and queries: case folding,
+# punctuation handling (keeping only alphanumeric characters and hyphens),
+# tokenizing on whitespace and stopping, all in one pass over the tokens.
+#
+# Stop words are matched case-insensitively against whole tokens, in a set;
+# words in hyphenated tokens are never stopped.
+class Analyzer:
+
+    def __init__(self, stop_words=(), foldcase=True, handlePunctuation=True):
+        self.stop_words = frozenset(stop_word.lower() for stop_word in stop_words if len(stop_word) > 0)
+        self.foldcase = foldcase
+        self.handlePunctuation = handlePunctuation
+
+    # Returns an analyzer stopping the words of the stop word list at `path`
+    @classmethod
+    def from_stop_words_file(cls, path, foldcase=True, handlePunctuation=True):
+        return cls(read_stop_words(path), foldcase, handlePunctuation)
+
+    # Returns the list of terms of `text`
+    def tokens(self, text):
+        if not self.handlePunctuation:
+            return self.normalize(text).split()
+
+        if self.foldcase:
+            text = text.lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        if self.stop_words:
+            if self.foldcase:
+                tokens = [token for token in tokens if token not in self.stop_words]
+            else:
+                tokens = [token for token in tokens if token.lower() not in self.stop_words]
+        return tokens
+
+    # Returns `text` with its terms tokenized and separated by single spaces
+    def analyze(self, text):
+        return ' '.join(self.tokens(text))
+
+    # Returns `text` stopped, case folded and with punctuation replaced by
+    # spaces, but with its whitespace otherwise kept
+    def normalize(self, text):
+        text = self.remove_stop_words(text)
+        if self.foldcase:
+            text = text.lower()
+        if self.handlePunctuation:
+            text = PUNCTUATION_PATTERN.sub(' ', text)
+        return text
+
+    # Returns `text` without its stop words, keeping everything else
+    def remove_stop_words(self, text):
+        if not self.stop_words:
+            return text
+        return WORD_PATTERN.sub(self._stop, text)
+
+    def _stop(self, match):
+        word = match.group()
+        return '' if word.lower() in self.stop_words else word
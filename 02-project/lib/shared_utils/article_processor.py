@@ -1,16 +1,116 @@
+from .analyzer import Analyzer
+from .document_store import write_document_store
+
 from bs4 import BeautifulSoup
-from os import listdir, makedirs
+from hashlib import sha256
+from multiprocessing import Pool
+from os import listdir, makedirs, remove, replace, stat
 from os.path import basename, exists, isfile, join, splitext
-from re import sub
+from pickle import load as pickle_load, dump as pickle_dump
 from warnings import warn
 
-def process_directory(input_dir, output_dir, tokenize=True, foldcase=True, handlePunctuation=True, removeFinalInts=True):
-    for file_or_dir in listdir(input_dir):
-        # Note: This will list files and directories. `process_document` will 
-        # handle ignoring non-text files.
-        if not exists(output_dir):
-            makedirs(output_dir)
-        process_document(join(input_dir, file_or_dir), output_dir, tokenize=tokenize, foldcase=foldcase, handlePunctuation=handlePunctuation)
+# The manifest `process_directory` keeps in the output directory: the options
+# the outputs were produced with, and the signature (size, mtime and content
+# hash) of every processed input file
+MANIFEST_FILE = ".manifest.p"
+
+# Number of files handed to a worker process at a time
+CHUNK_SIZE = 16
+
+# Preprocesses the documents in `input_dir` into text files in `output_dir`,
+# using `workers` processes. Only input files that are new or changed since the
+# last run (by content hash, checked when the size or mtime differs) are
+# processed, and the outputs of removed input files are deleted. Changing the
+# options reprocesses every file.
+def process_directory(input_dir, output_dir, tokenize=True, foldcase=True, handlePunctuation=True, removeFinalInts=True, workers=1):
+    options = (tokenize, foldcase, handlePunctuation, removeFinalInts)
+    makedirs(output_dir, exist_ok=True)
+    manifest_path = join(output_dir, MANIFEST_FILE)
+    files = dict()
+    if exists(manifest_path):
+        with open(manifest_path, "rb") as manifest_file:
+            manifest = pickle_load(manifest_file)
+        if manifest["options"] == options:
+            files = manifest["files"]
+
+    # Input files whose size or mtime changed, or whose output is missing
+    input_names = [name for name in listdir(input_dir) if splitext(name)[0] and isfile(join(input_dir, name))]
+    candidates = []
+    for name in input_names:
+        input_path = join(input_dir, name)
+        output_path = _output_path(output_dir, name)
+        entry = files.get(name)
+        file_stat = stat(input_path)
+        if entry is None or entry[:2] != (file_stat.st_size, file_stat.st_mtime_ns) or not exists(output_path):
+            candidates.append((input_path, output_path, entry if exists(output_path) else None, options))
+
+    if workers > 1 and len(candidates) > 1:
+        with Pool(workers) as pool:
+            results = list(pool.imap_unordered(_process_file, candidates, CHUNK_SIZE))
+    else:
+        results = [_process_file(candidate) for candidate in candidates]
+    for name, entry in results:
+        files[name] = entry
+
+    # Delete the outputs of removed input files
+    for name in set(files.keys()).difference(input_names):
+        output_path = _output_path(output_dir, name)
+        if exists(output_path):
+            remove(output_path)
+        del files[name]
+
+    with open(manifest_path + ".tmp", "wb") as manifest_file:
+        pickle_dump({"options": options, "files": files}, manifest_file)
+    replace(manifest_path + ".tmp", manifest_path)
+
+def _output_path(output_dir, input_name):
+    return join(output_dir, "%s.txt" % (splitext(input_name)[0],))
+
+# Processes one input file for `process_directory`, unless its content hash is
+# the same as in its previous manifest `entry`. Returns the input file name and
+# its new manifest entry. Runs in a worker process when processing in parallel.
+def _process_file(candidate):
+    input_path, output_path, entry, options = candidate
+    file_stat = stat(input_path)
+    with open(input_path, "rb") as input_file:
+        data = input_file.read()
+    content_hash = sha256(data).hexdigest()
+    if entry is None or entry[2] != content_hash:
+        with open(output_path, "w") as text_file:
+            text_file.write(clean_article(data.decode("utf-8"), *options))
+    return (basename(input_path), (file_stat.st_size, file_stat.st_mtime_ns, content_hash))
+
+# Yields the (docID, token list) of the preprocessed HTML documents in
+# `input_dir`, sorted by docID, for indexing them without writing text files.
+# Documents are preprocessed by `workers` processes.
+def stream_documents(input_dir, workers=1, tokenize=True, foldcase=True, handlePunctuation=True, removeFinalInts=True):
+    options = (tokenize, foldcase, handlePunctuation, removeFinalInts)
+    paths = [join(input_dir, name) for name in sorted(listdir(input_dir)) if splitext(name)[0] and splitext(name)[1].lower() in (".htm", ".html") and isfile(join(input_dir, name))]
+    tasks = [(path, options) for path in paths]
+    if workers > 1:
+        with Pool(workers) as pool:
+            yield from pool.imap(_tokenize_file, tasks, CHUNK_SIZE)
+    else:
+        yield from map(_tokenize_file, tasks)
+
+def _tokenize_file(task):
+    input_path, options = task
+    with open(input_path, "r") as input_file:
+        return (splitext(basename(input_path))[0], clean_article(input_file.read(), *options).split())
+
+# Writes the clean text of the HTML documents in `input_dir` to a document store
+# at `output_path`, keyed by docID, for reading documents without parsing them.
+def build_document_store(input_dir, output_path):
+    write_document_store(output_path, document_texts(input_dir))
+
+# Yields the (docID, clean text) of the HTML documents in `input_dir`, sorted by
+# docID.
+def document_texts(input_dir):
+    for file_name in sorted(listdir(input_dir)):
+        base, ext = splitext(file_name)
+        if base and ext.lower() in (".htm", ".html") and isfile(join(input_dir, file_name)):
+            with open(join(input_dir, file_name), "r") as input_file:
+                yield (base, BeautifulSoup(input_file.read(), 'html.parser').text)
 
 def process_document(input_path, output_dir, tokenize=True, foldcase=True, handlePunctuation=True, removeFinalInts=True):
     base = splitext(basename(input_path))[0]
@@ -20,29 +120,26 @@ def process_document(input_path, output_dir, tokenize=True, foldcase=True, handl
             warn("%s already exists" % filename)
         else:
             with open(input_path, "r") as input_file:
-                text = input_file.read()
-                
-                soup = BeautifulSoup(text, 'html.parser')
-                article = soup.text
-                
-                # Perform case folding
-                if foldcase:
-                    article = article.lower()
-                
-                # Perform punctuation handling, retain only alphanumeric characters
-                if handlePunctuation:
-                    article = sub('[^0-9a-zA-Z-]+', ' ', article)
-                
-                # Tokenize
-                if tokenize:
-                    article = ' '.join(article.split())
-                
-                # Remove integers at end of file
-                if removeFinalInts:
-                    split_article = article.split()
-                    while split_article[-1] is not None and split_article[-1].isdigit():
-                        del split_article[-1]
-                    article = ' '.join(split_article)
-                
+                article = clean_article(input_file.read(), tokenize, foldcase, handlePunctuation, removeFinalInts)
                 with open(filename, "w") as text_file:
-                    text_file.write(article)
\ No newline at end of file
+                    text_file.write(article)
+
+# Returns the preprocessed text of the HTML document `text`
+def clean_article(text, tokenize=True, foldcase=True, handlePunctuation=True, removeFinalInts=True):
+    soup = BeautifulSoup(text, 'html.parser')
+    analyzer = Analyzer(foldcase=foldcase, handlePunctuation=handlePunctuation)
+
+    # Perform case folding and punctuation handling, retaining only
+    # alphanumeric characters
+    if not tokenize and not removeFinalInts:
+        return analyzer.normalize(soup.text)
+
+    # Tokenize
+    split_article = analyzer.tokens(soup.text)
+
+    # Remove integers at end of file
+    if removeFinalInts:
+        while len(split_article) > 0 and split_article[-1].isdigit():
+            del split_article[-1]
+
+    return ' '.join(split_article)
\ No newline at end of file
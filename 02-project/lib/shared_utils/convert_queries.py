@@ -1,9 +1,11 @@
-from lib.shared_utils.stopping import remove_stop_words
+from lib.shared_utils.analyzer import Analyzer, read_stop_words
 
-from re import sub
 from xml.dom import minidom
 
 def convert_query_file(input_path, output_path, stopwords_path, tokenize=True, foldcase=True, handlePunctuation=True):
+    # Perform stopping, case folding and punctuation handling
+    stopwords = read_stop_words(stopwords_path) if stopwords_path is not None else ()
+    analyzer = Analyzer(stopwords, foldcase=foldcase, handlePunctuation=handlePunctuation)
     
     with open(output_path, "w") as output_file:
         query_doc = minidom.parse(input_path)
@@ -12,21 +14,10 @@ def convert_query_file(input_path, output_path, stopwords_path, tokenize=True, f
             query_id = query.getElementsByTagName("DOCNO")[0].firstChild.data
             query_text = query.lastChild.data
             
-            # Perform stopping
-            if stopwords_path is not None:
-                stopwords = [stopword.rstrip('\n') for stopword in open(stopwords_path)]
-                query_text = remove_stop_words(query_text, stopwords)
-            
-            # Perform case folding
-            if foldcase:
-                query_text = query_text.lower()
-            
-            # Perform punctuation handling, retain only alphanumeric characters
-            if handlePunctuation:
-                query_text = sub('[^0-9a-zA-Z-]+', ' ', query_text)
-            
             # Tokenize
             if tokenize:
-                query_text = ' '.join(query_text.split())
+                query_text = analyzer.analyze(query_text)
+            else:
+                query_text = analyzer.normalize(query_text)
             
             output_file.write("%s\t%s\n" % (query_id, query_text))
@@ -0,0 +1,122 @@
+from array import array
+from collections import OrderedDict
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from zlib import compress, decompress
+
+# Document store file format (version 1), little-endian:
+#
+#   header           see `HEADER` below
+#   docID blob       UTF-8 docIDs, separated by newlines, in document order
+#   document table   uint64[3 * num_docs]: chunk number, offset and length of
+#                    the text of each document within its uncompressed chunk
+#   chunk offsets    uint64[num_chunks + 1], into the chunk data
+#   chunk data       zlib-compressed chunks of concatenated UTF-8 texts
+#
+# Sections start at offsets aligned to 8 bytes, padded with zero bytes, so that
+# the tables can be read in place as uint64 arrays.
+#
+# Texts are packed into chunks of about `CHUNK_SIZE` bytes before compression,
+# so that small documents compress well together while a lookup decompresses
+# only the one chunk holding the document.
+MAGIC = b"CACMDOC\0"
+VERSION = 1
+CHUNK_SIZE = 8 * 1024
+
+# magic, version, num_docs, num_chunks, and the offsets of the four sections
+HEADER = Struct("<8sIxxxxQQ4Q")
+
+# Number of decompressed chunks kept in memory by a `DocumentStore`
+CHUNK_CACHE_SIZE = 8
+
+# Writes the (docID, text) pairs in `documents` to `output_path` in the document
+# store format.
+def write_document_store(output_path, documents):
+    doc_ids = []
+    table = array('Q')
+    chunks = []
+    chunk = bytearray()
+    for doc_id, text in documents:
+        encoded = text.encode("utf-8")
+        if len(chunk) > 0 and len(chunk) + len(encoded) > CHUNK_SIZE:
+            chunks.append(compress(bytes(chunk)))
+            chunk = bytearray()
+        doc_ids.append(doc_id)
+        table.extend((len(chunks), len(chunk), len(encoded)))
+        chunk += encoded
+    if len(chunk) > 0:
+        chunks.append(compress(bytes(chunk)))
+
+    chunk_offsets = array('Q', [0])
+    for compressed in chunks:
+        chunk_offsets.append(chunk_offsets[-1] + len(compressed))
+    sections = ["\n".join(doc_ids).encode("utf-8"), table.tobytes(), chunk_offsets.tobytes(), b"".join(chunks)]
+
+    with open(output_path, "wb") as output_file:
+        position = _aligned(HEADER.size)
+        section_offsets = []
+        for section in sections:
+            section_offsets.append(position)
+            position = _aligned(position + len(section))
+        output_file.write(HEADER.pack(MAGIC, VERSION, len(doc_ids), len(chunks), *section_offsets))
+        for offset, section in zip(section_offsets, sections):
+            output_file.write(b"\0" * (offset - output_file.tell()))
+            output_file.write(section)
+
+def _aligned(position):
+    return (position + 7) // 8 * 8
+
+# A read-only, memory-mapped document store. Opening the store reads the docID
+# table; texts are read with `get_text` by decompressing their chunk, and the
+# most recently used chunks are cached.
+class DocumentStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as input_file:
+            self.buffer = mmap(input_file.fileno(), 0, access=ACCESS_READ)
+
+        magic, version, num_docs, num_chunks, *section_offsets = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a document store" % path)
+        if version != VERSION:
+            raise ValueError("%s has document store version %s, expected %s" % (path, version, VERSION))
+
+        names_offset, table_offset, chunk_offsets_offset, chunks_offset = section_offsets
+        doc_ids = self.buffer[names_offset:table_offset].rstrip(b"\0").decode("utf-8").split("\n") if num_docs > 0 else []
+        # docID -> document number, for constant time lookups
+        self.doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        view = memoryview(self.buffer)
+        self.table = view[table_offset:table_offset + 3 * 8 * num_docs].cast('Q')
+        self.chunk_offsets = view[chunk_offsets_offset:chunk_offsets_offset + 8 * (num_chunks + 1)].cast('Q')
+        self.chunks_offset = chunks_offset
+        self._chunks = OrderedDict()
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_numbers
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    def __iter__(self):
+        return iter(self.doc_numbers)
+
+    # Returns the text of the document `doc_id`, or None if it is not stored
+    def get_text(self, doc_id):
+        doc_number = self.doc_numbers.get(doc_id)
+        if doc_number is None:
+            return None
+        chunk_number, offset, length = self.table[3 * doc_number:3 * doc_number + 3]
+        return bytes(self._chunk(chunk_number)[offset:offset + length]).decode("utf-8")
+
+    def _chunk(self, chunk_number):
+        if chunk_number in self._chunks:
+            self._chunks.move_to_end(chunk_number)
+            return self._chunks[chunk_number]
+        start = self.chunks_offset + self.chunk_offsets[chunk_number]
+        end = self.chunks_offset + self.chunk_offsets[chunk_number + 1]
+        chunk = decompress(self.buffer[start:end])
+        self._chunks[chunk_number] = chunk
+        if len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+        return chunk
@@ -0,0 +1,172 @@
+from json import dump as json_dump
+from scipy.stats import ttest_rel, wilcoxon
+
+import numpy as np
+
+# Rank cutoffs of the precision at k and NDCG at k metrics
+DEFAULT_K_VALUES = (5, 20)
+
+# Metrics compared by the significance tests of `compare_runs`
+COMPARED_METRICS = ("map", "mrr", "r-precision", "ndcg")
+
+# FILE MANAGEMENT
+################################################################################
+
+# Applies `function` to the split content of each line in the file at `path`.
+def _apply_to_split_rows(path, function):
+    with open(path, 'r') as infile:
+        for line in infile:
+            content = line.split()
+            if len(content) > 0:
+                function(content)
+
+def read_binary_relevance_file(path):
+    # map of query_id -> set of relevant documents
+    relevant_docs = dict()
+    # c[0] is query_id
+    # c[2] is doc_id
+    _apply_to_split_rows(path, lambda c: relevant_docs.setdefault(c[0], set()).add(c[2]))
+    return relevant_docs
+
+def read_result_file(path):
+    # map of query_id -> ordered list of retrieved documents
+    results = dict()
+    # c[0] is query_id
+    # c[2] is doc_id
+    _apply_to_split_rows(path, lambda c: results.setdefault(c[0], []).append(c[2]))
+    return results
+
+# Relevance arrays
+################################################################################
+
+# Returns the relevance arrays of `runs`, a list of results (query_id ->
+# ranked docIDs), for the queries in `query_ids`:
+#
+#   relevant       bool[runs, queries, depth], whether the document retrieved
+#                  at each rank is relevant (False past the end of a ranking)
+#   num_retrieved  int[runs, queries], the number of documents retrieved
+#   num_relevant   int[queries], the number of relevant documents
+#
+# where depth is the length of the longest ranking.
+def relevance_arrays(relevance_data, runs, query_ids):
+    depth = max([len(results.get(query_id, ())) for results in runs for query_id in query_ids] + [1])
+    relevant = np.zeros((len(runs), len(query_ids), depth), dtype=bool)
+    num_retrieved = np.zeros((len(runs), len(query_ids)), dtype=np.int64)
+    for r, results in enumerate(runs):
+        for q, query_id in enumerate(query_ids):
+            relevant_documents = relevance_data.get(query_id, ())
+            ranking = results.get(query_id, ())
+            num_retrieved[r, q] = len(ranking)
+            relevant[r, q, :len(ranking)] = [doc_id in relevant_documents for doc_id in ranking]
+    num_relevant = np.array([len(relevance_data.get(query_id, ())) for query_id in query_ids], dtype=np.int64)
+    return (relevant, num_retrieved, num_relevant)
+
+# Metrics
+################################################################################
+
+# Evaluates any number of runs (a list of results, query_id -> ranked docIDs)
+# against the relevance judgements, over the judged queries (or `query_ids`).
+# Returns the query IDs and a dictionary of metric -> float[runs, queries] of
+# the per-query values, with the metrics:
+#
+#   map            average precision (precision at each relevant document
+#                  retrieved, over the number of relevant documents)
+#   mrr            reciprocal rank of the first relevant document
+#   p@k            precision at k, for each k in `k_values`, over k even
+#                  when fewer than k documents are retrieved
+#   r-precision    precision at R, the number of relevant documents
+#   ndcg           normalized discounted cumulative gain of the ranking,
+#                  with binary gains; also ndcg@k for each k in `k_values`
+#   precision      precision of the whole ranking
+#   recall         recall of the whole ranking
+#
+# All metrics are computed together from the cumulative relevant counts of
+# the rankings.
+def evaluate_runs(relevance_data, runs, k_values=DEFAULT_K_VALUES, query_ids=None):
+    if query_ids is None:
+        query_ids = list(relevance_data.keys())
+    relevant, num_retrieved, num_relevant = relevance_arrays(relevance_data, runs, query_ids)
+    depth = relevant.shape[2]
+    ranks = np.arange(1, depth + 1)
+    hits = np.cumsum(relevant, axis=2)
+    num_hits = hits[:, :, -1]
+    relevant_count = np.maximum(num_relevant, 1)
+
+    scores = dict()
+    scores["map"] = (relevant * (hits / ranks)).sum(axis=2) / relevant_count
+    scores["mrr"] = np.where(relevant.any(axis=2), 1.0 / (relevant.argmax(axis=2) + 1), 0.0)
+    for k in k_values:
+        scores["p@%s" % k] = hits[:, :, min(k, depth) - 1] / k
+    scores["r-precision"] = hits[:, np.arange(len(query_ids)), np.clip(num_relevant, 1, depth) - 1] / relevant_count
+
+    # The ideal ranking retrieves every relevant document first
+    discounts = 1.0 / np.log2(np.arange(2, max(depth, num_relevant.max(initial=1)) + 2))
+    ideal_gains = np.cumsum(discounts)
+    gains = relevant * discounts[:depth]
+    scores["ndcg"] = gains.sum(axis=2) / ideal_gains[relevant_count - 1]
+    for k in k_values:
+        scores["ndcg@%s" % k] = gains[:, :, :k].sum(axis=2) / ideal_gains[np.minimum(relevant_count, k) - 1]
+
+    scores["precision"] = num_hits / np.maximum(num_retrieved, 1)
+    scores["recall"] = num_hits / relevant_count
+    return (query_ids, scores)
+
+# Returns the mean of each metric for each run, as metric -> float[runs]
+def mean_scores(scores):
+    return {metric: values.mean(axis=1) for metric, values in scores.items()}
+
+# Significance tests
+################################################################################
+
+# Compares each run with the run at index `baseline` with paired two-sided
+# tests over the per-query values of `metrics`. Returns a list, for each other
+# run, of metric -> (mean difference, t-test p-value, Wilcoxon signed-rank test
+# p-value).
+def compare_runs(scores, baseline=0, metrics=COMPARED_METRICS):
+    num_runs = next(iter(scores.values())).shape[0]
+    comparisons = []
+    for run in range(num_runs):
+        if run == baseline:
+            comparisons.append(None)
+            continue
+        comparison = dict()
+        for metric in metrics:
+            comparison[metric] = paired_tests(scores[metric][baseline], scores[metric][run])
+        comparisons.append(comparison)
+    return comparisons
+
+# Returns the mean difference of the paired values `b - a`, and the p-values
+# of the paired t-test and of the Wilcoxon signed-rank test. Identical values
+# have a p-value of 1.
+def paired_tests(a, b):
+    differences = b - a
+    if not np.any(differences):
+        return (0.0, 1.0, 1.0)
+    t_pvalue = ttest_rel(b, a).pvalue
+    w_pvalue = wilcoxon(b, a).pvalue
+    return (float(differences.mean()), float(t_pvalue), float(w_pvalue))
+
+# Output
+################################################################################
+
+# Writes the evaluation of the runs named `run_names` to `output_file` as JSON:
+# the mean and per-query values of each metric for each run, and the
+# comparisons with the baseline run, if any.
+def write_json(output_file, run_names, query_ids, scores, comparisons=None):
+    means = mean_scores(scores)
+    runs = dict()
+    for r, name in enumerate(run_names):
+        runs[name] = {
+            "mean": {metric: float(values[r]) for metric, values in means.items()},
+            "queries": {metric: dict(zip(query_ids, values[r].tolist())) for metric, values in scores.items()},
+        }
+    output = {"queries": list(query_ids), "runs": runs}
+    if comparisons is not None:
+        baseline = run_names[comparisons.index(None)]
+        output["baseline"] = baseline
+        output["comparisons"] = {
+            run_names[r]: {metric: {"difference": difference, "t-test p": t_pvalue, "wilcoxon p": w_pvalue} for metric, (difference, t_pvalue, w_pvalue) in comparison.items()}
+            for r, comparison in enumerate(comparisons) if comparison is not None
+        }
+    json_dump(output, output_file, indent=2)
+    output_file.write("\n")
@@ -1,7 +1,6 @@
-from re import sub, IGNORECASE
+from .analyzer import Analyzer
 
+# Removes the stop words from `string` in a single pass, keeping its case,
+# punctuation and whitespace (see `Analyzer.remove_stop_words`)
 def remove_stop_words(string, stop_words):
-    result = string
-    for sw in stop_words:
-        result = sub(r'(?<!-)\b' + sw + r'(?!-)\b', '', result, flags=IGNORECASE)
-    return result
\ No newline at end of file
+    return Analyzer(stop_words).remove_stop_words(string)
\ No newline at end of file
@@ -1,9 +1,17 @@
+from .document_store import DocumentStore
+from . import tracing
+
+from array import array
 from bs4 import BeautifulSoup
+from collections import OrderedDict
+from functools import lru_cache
+from glob import glob
 from nltk import download as nltk_download
 from nltk.data import find as nltk_find
 from nltk.tokenize import sent_tokenize as nltk_sent_tokenize, word_tokenize as word_tokenize
-from os.path import splitext
-from re import compile, IGNORECASE, split as re_split
+from os.path import basename, join, splitext
+from pickle import load as pickle_load, dump as pickle_dump
+from re import compile, escape, IGNORECASE, split as re_split
 
 # Download English data for tokenizing
 try:
@@ -60,10 +68,137 @@ def summarize(text, terms, limit=None):
     return highlight(result_text, terms)
 
 def highlight(text, terms):
-    h_text = text
-    for term in terms:
-        h_text = str(compile(r'(?<!-)\b(%s)(?<!-)\b' % (term), IGNORECASE).sub(r'\033[1m\1\033[0m', h_text))
-    return h_text
+    return highlighter(tuple(terms)).sub(r'\033[1m\1\033[0m', text)
+
+# Returns a single compiled pattern matching any of the terms as a whole word, 
+# for highlighting. Compiled once per query.
+@lru_cache(maxsize=256)
+def highlighter(terms):
+    # Longer terms first, so that they win over their prefixes
+    alternatives = "|".join(escape(term) for term in sorted(set(terms), key=lambda term: (-len(term), term)))
+    return compile(r'(?<!-)\b(%s)(?<!-)\b' % (alternatives or '(?!)'), IGNORECASE)
+
+# A precomputed sentence segmentation of a collection, so that snippets are 
+# scored without reading, parsing or tokenizing the documents at query time.
+# 
+# For each docID, the store keeps the whitespace-cleaned sentences of the 
+# document, the lowercased word tokens of all its sentences, and the offset of 
+# the first token of each sentence (the tokens of sentence i are 
+# `tokens[offsets[i]:offsets[i+1]]`).
+class SentenceStore:
+    
+    def __init__(self, documents=None):
+        # docID -> (sentences, tokens, offsets)
+        self.documents = dict() if documents is None else documents
+    
+    # Segments and tokenizes the text of a document, and adds it to the store
+    def add_document(self, doc_id, text):
+        sentences = []
+        tokens = []
+        offsets = array('I', [0])
+        for sent in sent_tokenize(text):
+            sentences.append(" ".join(sent.split()))
+            tokens.extend(word.lower() for word in word_tokenize(sent))
+            offsets.append(len(tokens))
+        self.documents[doc_id] = (sentences, tokens, offsets)
+    
+    # Adds the documents with the extension `docs_ext` in `docs_path`
+    def add_directory(self, docs_path, docs_ext):
+        for path in sorted(glob(join(docs_path, "*" + docs_ext))):
+            self.add_document(splitext(basename(path))[0], get_text_from_file(path))
+    
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+    
+    # Returns the summary of a document for the terms, like `summarize`, 
+    # scoring the stored sentence tokens
+    def summarize(self, doc_id, terms, limit=None):
+        sentences, tokens, offsets = self.documents[doc_id]
+        l_terms = set(term.lower() for term in terms)
+        scores = [token_score(tokens[offsets[i]:offsets[i+1]], l_terms) for i in range(len(sentences))]
+        sent_scores = sorted([(sent, score) for sent, score in zip(sentences, scores) if score > 0], key=lambda tup: tup[1], reverse=True)
+        
+        # Take top sentences based on limit, if applicable
+        if limit is not None:
+            sent_scores = sent_scores[:limit]
+        
+        result_text = " ".join([sent for sent, score in sent_scores])
+        return highlight(result_text, terms)
+    
+    def write(self, output_path):
+        with open(output_path, "wb") as output_file:
+            pickle_dump(self.documents, output_file)
+    
+    @classmethod
+    def read(cls, input_path):
+        with open(input_path, "rb") as input_file:
+            return cls(pickle_load(input_file))
+
+# Scores a sentence, given as lowercased tokens, like `sent_score`
+def token_score(l_words, l_terms):
+    keyword_indexes = [i for i, x in enumerate(l_words) if x in l_terms]
+    if len(keyword_indexes) > 0:
+        key_phrase_len = 1 + keyword_indexes[-1] - keyword_indexes[0]
+        return float(len(keyword_indexes) ** 2) / key_phrase_len
+    else:
+        return 0
+
+# The sentence store used by `summarize_document`, when read
+sentence_store = None
+
+# The document store read by `read_document_store`, or None
+document_store = None
+
+# Number of snippets kept by `summarize_document`
+SNIPPET_CACHE_SIZE = 1024
+
+# (docs_path, docID, docs_ext, terms, limit) -> snippet, least recently used
+# first
+_snippet_cache = OrderedDict()
+
+# Reads the sentence store used by `summarize_document` from `input_path`.
+def read_sentence_store(input_path):
+    global sentence_store
+    sentence_store = SentenceStore.read(input_path)
+    _snippet_cache.clear()
+
+# Reads the document store used by `get_document_text` from `input_path`.
+def read_document_store(input_path):
+    global document_store
+    document_store = DocumentStore(input_path)
+    _snippet_cache.clear()
+
+# Returns the text of the document `doc_id`, from the document store if it has 
+# been read and holds the document, or else from its file in `docs_path` (with 
+# the extension `docs_ext`).
+def get_document_text(docs_path, doc_id, docs_ext):
+    if document_store is not None:
+        text = document_store.get_text(doc_id)
+        if text is not None:
+            return text
+    return get_text_from_file(join(docs_path, doc_id + docs_ext))
+
+# Returns the summary of the document `doc_id` for the terms. The sentence 
+# store is used if it has been read and holds the document; otherwise the 
+# document text is read with `get_document_text` and summarized. The most 
+# recently used snippets are cached.
+def summarize_document(docs_path, doc_id, docs_ext, terms, limit=None):
+    key = (docs_path, doc_id, docs_ext, tuple(terms), limit)
+    if key in _snippet_cache:
+        _snippet_cache.move_to_end(key)
+        tracing.count("snippet_cache_hits")
+        return _snippet_cache[key]
+    tracing.count("snippet_cache_misses")
+    
+    if sentence_store is not None and doc_id in sentence_store:
+        snippet = sentence_store.summarize(doc_id, terms, limit)
+    else:
+        snippet = summarize(get_document_text(docs_path, doc_id, docs_ext), terms, limit)
+    
+    _snippet_cache[key] = snippet
+    if len(_snippet_cache) > SNIPPET_CACHE_SIZE:
+        _snippet_cache.popitem(last=False)
+    return snippet
 
 #text = get_text_from_file('../../cacm/CACM-3182.html')
 #print(summarize(text, ['Technological', 'Advances']))
@@ -0,0 +1,147 @@
+from collections import Counter
+from glob import glob
+from os import makedirs
+from os.path import join
+
+import numpy as np
+
+# Synthesizes collections of preprocessed documents that are statistically
+# like a real collection but larger, for benchmarking indexing and retrieval.
+#
+# Terms occurring more than once in the real collection keep their relative
+# frequencies; past them, frequencies follow a Zipf distribution whose exponent
+# is fitted to the rank-frequency curve of the real collection. The vocabulary
+# grows with the collection following Heaps' law (V = K * n^beta), also fitted
+# to the real collection: the term of rank r first occurs at the token where
+# the fitted vocabulary size reaches r + 1, and every token is drawn from the
+# terms that have occurred. Real terms keep their frequency ranks, so that
+# real queries still match, and synthetic terms fill the ranks past the real
+# vocabulary. Document lengths are drawn from the real document lengths.
+
+# Number of documents generated at a time
+BATCH_SIZE = 1000
+
+# First rank of the rank-frequency curve used to fit the Zipf exponent
+ZIPF_FIT_START = 10
+
+# Number of points of the vocabulary growth curve used to fit Heaps' law
+HEAPS_POINTS = 20
+
+class CorpusModel:
+
+    def __init__(self, terms, head_frequencies, zipf_exponent, heaps_k, heaps_beta, doc_lengths):
+        # Real terms by decreasing collection frequency
+        self.terms = terms
+        # Frequencies of the real terms occurring more than once
+        self.head_frequencies = np.asarray(head_frequencies, dtype=np.float64)
+        self.zipf_exponent = zipf_exponent
+        self.heaps_k = heaps_k
+        self.heaps_beta = heaps_beta
+        self.doc_lengths = np.asarray(doc_lengths)
+
+    # Fits the model to the tokenized text files (such as `cacm-clean`) in
+    # `directory`
+    @classmethod
+    def from_directory(cls, directory, pattern="*.txt"):
+        documents = []
+        for path in sorted(glob(join(directory, pattern))):
+            with open(path, "r") as text_file:
+                documents.append(text_file.read().split())
+        return cls.from_documents(documents)
+
+    @classmethod
+    def from_documents(cls, documents):
+        counts = Counter(token for document in documents for token in document)
+        terms = [term for term, _ in counts.most_common()]
+        frequencies = np.array([counts[term] for term in terms], dtype=np.float64)
+        doc_lengths = [len(document) for document in documents]
+
+        # Zipf: log f = c - s log r, fitted past the first few ranks on the
+        # terms occurring more than once (the hapax tail is flat)
+        head = int((frequencies > 1).sum())
+        ranks = np.arange(1, head + 1)
+        fitted = slice(min(ZIPF_FIT_START, head // 2), head)
+        zipf_exponent = -np.polyfit(np.log(ranks[fitted]), np.log(frequencies[:head][fitted]), 1)[0]
+
+        # Heaps: log V = log K + beta log n, over the growth of the vocabulary
+        # as documents are added
+        seen = set()
+        num_tokens = 0
+        points = []
+        step = max(1, len(documents) // HEAPS_POINTS)
+        for i, document in enumerate(documents):
+            seen.update(document)
+            num_tokens += len(document)
+            if (i + 1) % step == 0 and num_tokens > 0:
+                points.append((num_tokens, len(seen)))
+        heaps_beta, log_k = np.polyfit(np.log([n for n, _ in points]), np.log([v for _, v in points]), 1)
+        return cls(terms, frequencies[:head], float(zipf_exponent), float(np.exp(log_k)), float(heaps_beta), doc_lengths)
+
+    # Returns the vocabulary size expected for a collection of `num_tokens`
+    # tokens, at least the size of the real vocabulary
+    def vocabulary_size(self, num_tokens):
+        return max(len(self.terms), int(self.heaps_k * num_tokens ** self.heaps_beta))
+
+    # Returns the relative frequencies of the first `vocabulary_size` ranks:
+    # the real frequencies of the head, continued by the fitted Zipf curve
+    def weights(self, vocabulary_size):
+        head = len(self.head_frequencies)
+        if head == 0:
+            return np.arange(1, vocabulary_size + 1, dtype=np.float64) ** -self.zipf_exponent
+        tail_ranks = np.arange(head + 1, max(vocabulary_size, head) + 1, dtype=np.float64)
+        tail = self.head_frequencies[-1] * (tail_ranks / head) ** -self.zipf_exponent
+        return np.concatenate([self.head_frequencies, tail])[:vocabulary_size]
+
+    # Returns the (1-based) token positions at which the first `vocabulary_size`
+    # ranks first occur in a collection of `num_tokens` tokens, so that the
+    # vocabulary grows by Heaps' law; the positions are distinct and increasing
+    def first_positions(self, num_tokens, vocabulary_size):
+        ranks = np.arange(vocabulary_size)
+        firsts = np.ceil(num_tokens * ((ranks + 1) / vocabulary_size) ** (1 / self.heaps_beta)).astype(np.int64)
+        firsts[0] = 1
+        return np.maximum.accumulate(firsts - ranks) + ranks
+
+    # Returns the term of frequency rank `rank` (from 0)
+    def term(self, rank):
+        return self.terms[rank] if rank < len(self.terms) else "syn%x" % rank
+
+    # Writes a collection of `scale` times as many documents as the real
+    # collection to `output_dir`, one tokenized text file per document
+    # (named `<prefix>-<number>.txt`). Returns the number of documents and
+    # tokens written.
+    def generate(self, output_dir, scale, seed=0, prefix="SYN"):
+        rng = np.random.default_rng(seed)
+        num_docs = int(round(scale * len(self.doc_lengths)))
+        lengths = rng.choice(self.doc_lengths, num_docs)
+        num_tokens = int(lengths.sum())
+
+        vocabulary_size = self.vocabulary_size(num_tokens)
+        firsts = self.first_positions(num_tokens, vocabulary_size)
+        # Every rank occurs once at its first position; the other occurrences
+        # are drawn, from the ranks that have occurred, by the weights
+        weights = self.weights(vocabulary_size)
+        cumulative = np.cumsum(np.maximum(weights * (num_tokens / weights.sum()) - 1, 0))
+        vocabulary = [self.term(rank) for rank in range(vocabulary_size)]
+
+        makedirs(output_dir, exist_ok=True)
+        width = len(str(num_docs))
+        # Number of tokens generated before the batch
+        position = 0
+        for start in range(0, num_docs, BATCH_SIZE):
+            batch_lengths = lengths[start:start + BATCH_SIZE]
+            batch_tokens = int(batch_lengths.sum())
+            positions = np.arange(position + 1, position + batch_tokens + 1)
+            occurred = np.searchsorted(firsts, positions, side='right')
+            ranks = np.searchsorted(cumulative, rng.random(batch_tokens) * cumulative[occurred - 1], side='right')
+            ranks = np.minimum(ranks, occurred - 1)
+            new = slice(np.searchsorted(firsts, position + 1), np.searchsorted(firsts, position + batch_tokens, side='right'))
+            ranks[firsts[new] - position - 1] = np.arange(vocabulary_size)[new]
+            ranks = ranks.tolist()
+            position += batch_tokens
+            offset = 0
+            for i, length in enumerate(batch_lengths):
+                tokens = [vocabulary[rank] for rank in ranks[offset:offset + length]]
+                offset += length
+                with open(join(output_dir, "%s-%0*d.txt" % (prefix, width, start + i + 1)), "w") as text_file:
+                    text_file.write(" ".join(tokens))
+        return (num_docs, num_tokens)
@@ -0,0 +1,109 @@
+from json import dumps
+from time import perf_counter
+
+# Per-query tracing of the retrieval pipeline: the wall time of each stage
+# (tokenizing, scoring, sorting, spelling suggestions, snippets, ...) and
+# counters (postings touched, candidates scored, cache hits, ...).
+#
+# Tracing is off by default. While it is off, `begin_query` and `end_query`
+# return at once, `stage` returns a shared no-op context manager and `count`
+# only checks a global, so instrumented code costs a function call per stage
+# rather than per posting. Counters are added once per stage, never inside
+# posting loops.
+#
+# Each traced query produces a record:
+#
+#   {"query": ..., "model": ..., "total_ms": ..., "stages": {stage: ms},
+#    "counters": {counter: value}}
+#
+# Stages and counters of nested or repeated calls add up.
+
+enabled = False
+
+# Records of the finished queries
+_records = []
+
+# Record of the query being traced, or None
+_current = None
+
+# Turns tracing on
+def enable():
+    global enabled
+    enabled = True
+
+# Turns tracing off, dropping the query being traced if any
+def disable():
+    global enabled, _current
+    enabled = False
+    _current = None
+
+# Returns the records of the traced queries, and forgets them if `clear`
+def records(clear=False):
+    result = list(_records)
+    if clear:
+        _records.clear()
+    return result
+
+# Starts the record of a query. A query already being traced is finished
+# first.
+def begin_query(query, model=None):
+    global _current
+    if not enabled:
+        return
+    if _current is not None:
+        end_query()
+    _current = {"query": query, "model": model, "stages": dict(), "counters": dict(), "start": perf_counter()}
+
+# Finishes the record of the current query and returns it
+def end_query():
+    global _current
+    if _current is None:
+        return None
+    record = _current
+    _current = None
+    start = record.pop("start")
+    record["total_ms"] = (perf_counter() - start) * 1000
+    _records.append(record)
+    return record
+
+# Adds `value` to the counter `name` of the current query
+def count(name, value=1):
+    if _current is not None:
+        counters = _current["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+# Returns a context manager timing the stage `name` of the current query
+def stage(name):
+    if _current is None:
+        return _NULL_STAGE
+    return _Stage(_current, name)
+
+class _Stage:
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = self.record["stages"]
+        stages[self.name] = stages.get(self.name, 0) + (perf_counter() - self.start) * 1000
+        return False
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Writes the records as JSON lines to `output_file`
+def write_records(output_file, query_records=None):
+    for record in (query_records if query_records is not None else _records):
+        output_file.write(dumps(record) + "\n")
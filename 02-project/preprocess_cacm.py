@@ -1,11 +1,15 @@
-from lib.shared_utils.article_processor import process_directory
+from lib.shared_utils.article_processor import build_document_store, process_directory
 
 from argparse import ArgumentParser
 
 parser = ArgumentParser(description='Preprocesses CACM documents by tokenizing, removing non-alphanumeric characters, performing case folding, and removing trailing digit tokens at end of file.')
 parser.add_argument("input_directory", help="the path to read the CACM documents from")
 parser.add_argument("output_directory", help="the path to output processed documents to")
+parser.add_argument("--workers", help="the number of processes preprocessing documents in parallel", type=int, default=1)
+parser.add_argument("--store", help="the path to also write the clean text of the documents to, as a compressed document store for reading documents by docID", default=None)
 
 args = parser.parse_args()
 
-process_directory(args.input_directory, args.output_directory)
\ No newline at end of file
+process_directory(args.input_directory, args.output_directory, workers=args.workers)
+if args.store is not None:
+    build_document_store(args.input_directory, args.store)
\ No newline at end of file
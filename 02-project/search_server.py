@@ -0,0 +1,49 @@
+from lib.from_scratch.indexer import read_document_norms, read_ngram_index, read_positional_index, read_spelling_index, read_term_counts, read_index
+from lib.shared_utils.summarizer import read_document_store, read_sentence_store
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description='Serves ranked, snippet and spelling requests over HTTP as JSON, reading the index once. See lib/from_scratch/search_server.py for the endpoints.')
+parser.add_argument("index_path", help="the path to read the index from")
+parser.add_argument("term_counts_path", help="the path to read the term counts from")
+parser.add_argument("-host", help="the address to listen on", default="127.0.0.1")
+parser.add_argument("-port", help="the port to listen on", type=int, default=8080)
+parser.add_argument("-unix", help="the path of a Unix socket to listen on instead of a TCP port", default=None)
+parser.add_argument("-models", help="the retrieval models to serve (the first is the default)", nargs='+', choices=["bm25", "jm", "dirichlet", "vector"], default=["bm25"])
+parser.add_argument("-workers", help="the number of worker processes scoring queries (0 scores in threads of the server process)", type=int, default=2)
+parser.add_argument("-cache", help="the number of query results kept in the result cache (0 disables it)", type=int, default=1024)
+parser.add_argument("-docs", help="the path to the documents for snippets (must be named with doc id)", default=None)
+parser.add_argument("-ext", help="the extension of the documents for snippets", default=".html")
+parser.add_argument("-sentences", help="the path to read the sentence store built with build_sentence_store.py from", default=None)
+parser.add_argument("-docstore", help="the path to read the document store written by preprocess_cacm.py --store from", default=None)
+parser.add_argument("-spelling", help="the path to read the spelling index from (built from the index at startup otherwise)", default=None)
+parser.add_argument("-bi", help="the path to read the bigram index from (used for whole-query spelling correction, unless -ngrams is given)", default=None)
+parser.add_argument("-ngrams", help="the path to read the compact n-gram index from", default=None)
+parser.add_argument("-pos", help="the path to read the positional index from", default=None)
+parser.add_argument("-norms", help="the path to read the document vector norms from (for the vector model; computed at startup otherwise)", default=None)
+parser.add_argument("-lucene", help="the path to a Lucene index, served as the \"lucene\" model (requires PyLucene)", default=None)
+
+args = parser.parse_args()
+
+# Read everything once, before the worker processes are forked
+read_term_counts(args.term_counts_path)
+read_index(args.index_path)
+if args.sentences is not None:
+    read_sentence_store(args.sentences)
+if args.docstore is not None:
+    read_document_store(args.docstore)
+if args.spelling is not None:
+    read_spelling_index(args.spelling)
+if args.bi is not None:
+    read_index(args.bi, n=2)
+if args.ngrams is not None:
+    read_ngram_index(args.ngrams)
+if args.pos is not None:
+    read_positional_index(args.pos)
+if args.norms is not None:
+    read_document_norms(args.norms)
+
+from lib.from_scratch.search_server import SearchServer
+
+server = SearchServer(args.models, args.workers, args.cache, args.docs, args.ext, args.lucene)
+server.run(args.host, args.port, args.unix)
\ No newline at end of file
@@ -0,0 +1,42 @@
+from lib.from_scratch.indexer import read_term_counts, read_index
+from lib.shared_utils.evaluation import read_binary_relevance_file
+
+from argparse import ArgumentParser
+
+parser = ArgumentParser(description='Evaluates a range of parameters of the BM25 and query likelihood models in memory, reading the index once, and prints a leaderboard of the configurations.')
+parser.add_argument("index_path", help="the path to read the index from")
+parser.add_argument("term_counts_path", help="the path to read the term counts from")
+parser.add_argument("query_file_path", help="the path to a TSV query file containing query IDs and stopped, case-folded test queries")
+parser.add_argument("relevance_file_path", help="the path to read the trec binary relevance file from")
+parser.add_argument("-models", help="the models to evaluate", nargs='+', choices=["bm25", "jm", "dirichlet"], default=["bm25", "jm", "dirichlet"])
+parser.add_argument("-search", help="evaluate every combination of the parameter values (grid), or -trials configurations drawn between the smallest and largest values at random (random) or by Bayesian optimization of -sort (bayes)", choices=["grid", "random", "bayes"], default="grid")
+parser.add_argument("-trials", help="the number of configurations of each model evaluated by random and Bayesian search", type=int, default=20)
+parser.add_argument("-workers", help="the number of processes evaluating configurations in parallel", type=int, default=1)
+parser.add_argument("-k1", help="the k1 values (BM25)", type=float, nargs='+', default=None)
+parser.add_argument("-b", help="the b values (BM25)", type=float, nargs='+', default=None)
+parser.add_argument("-k2", help="the k2 values (BM25)", type=float, nargs='+', default=None)
+parser.add_argument("-l", help="the lambda values (JM-smoothed query likelihood)", type=float, nargs='+', default=None)
+parser.add_argument("-mu", help="the mu values (Dirichlet-smoothed query likelihood)", type=float, nargs='+', default=None)
+parser.add_argument("-r", help="the number of results ranked for each query", type=int, default=100)
+parser.add_argument("-k", help="the rank cutoffs for precision at k", type=int, nargs='+', default=[5, 20])
+parser.add_argument("-sort", help="the metric to rank the configurations by", default="map")
+parser.add_argument("-top", help="the number of configurations to print (all by default)", type=int, default=None)
+parser.add_argument("-seed", help="the seed of random and Bayesian search", type=int, default=0)
+
+args = parser.parse_args()
+
+# Read the index once, before the worker processes are started
+read_term_counts(args.term_counts_path)
+read_index(args.index_path)
+
+from lib.from_scratch.parameter_sweep import MODELS, print_leaderboard, sweep
+
+# Parameter values of each model, from the arguments or the defaults
+values = {"k1": args.k1, "b": args.b, "k2": args.k2, "λ": args.l, "μ": args.mu}
+model_params = dict()
+for name in args.models:
+    _, param_names, defaults = MODELS[name]
+    model_params[name] = {param_name: values[param_name] if values[param_name] is not None else default for param_name, default in zip(param_names, defaults)}
+
+leaderboard = sweep(model_params, args.query_file_path, read_binary_relevance_file(args.relevance_file_path), args.search, args.trials, args.workers, args.r, args.k, args.sort, args.seed)
+print_leaderboard(leaderboard[:args.top], [args.sort] + [metric for metric in ["map", "mrr"] + ["p@%s" % k for k in args.k] if metric != args.sort])
\ No newline at end of file
@@ -0,0 +1,86 @@
+from os.path import abspath, dirname, join
+import sys
+
+# The tests import the project's modules as the scripts do, from the project
+# directory
+PROJECT_DIR = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from lib.from_scratch import indexer
+
+from csv import reader as csv_reader
+from glob import glob
+import pytest
+
+# The fixture corpus: the first documents of the cleaned CACM collection (and
+# of the HTML sources they were cleaned from), and the first CACM queries and
+# their relevance judgements
+CORPUS_DIRECTORY = join(PROJECT_DIR, "cacm-clean")
+SOURCE_DIRECTORY = join(PROJECT_DIR, "cacm")
+QUERY_FILE = join(PROJECT_DIR, "unclean_queries.tsv")
+RELEVANCE_FILE = join(PROJECT_DIR, "test-collection", "cacm.rel.txt")
+NUM_DOCUMENTS = 150
+NUM_QUERIES = 12
+
+# Returns the paths of the first `count` documents of the fixture corpus
+def corpus_files(count=NUM_DOCUMENTS):
+	return sorted(glob(join(CORPUS_DIRECTORY, "*.txt")))[:count]
+
+# Returns the (query ID, query string) pairs of the fixture queries
+def fixture_queries(count=NUM_QUERIES):
+	with open(QUERY_FILE) as query_file:
+		return [(row[0].strip(), row[1]) for row in csv_reader(query_file, delimiter='\t')][:count]
+
+@pytest.fixture(scope="session")
+def corpus():
+	return corpus_files()
+
+# The index structures of the fixture corpus, built into the indexer's module
+# globals, which the retrieval models rank
+@pytest.fixture(scope="session")
+def structures(corpus):
+	for path in corpus:
+		indexer.index_document(path)
+	return indexer.indexes, indexer.term_counts, indexer.positional_index
+
+# The retrieval model module, bound to the index of the fixture corpus
+@pytest.fixture
+def retrieval_model(structures):
+	# Imported here: the module binds the index when it is first imported
+	from lib.from_scratch import retrieval_model
+	return retrieval_model
+
+@pytest.fixture(scope="session")
+def queries():
+	return fixture_queries()
+
+# Returns a function making a given unigram index (and its document lengths,
+# if given) the index the retrieval models rank, until the end of the test.
+# Models must be built after calling it.
+@pytest.fixture
+def use_index(retrieval_model, monkeypatch):
+	def use(index, doc_lengths=None):
+		monkeypatch.setattr(retrieval_model, "index", index)
+		if doc_lengths is not None:
+			monkeypatch.setattr(retrieval_model, "doc_lengths", doc_lengths)
+			monkeypatch.setattr(retrieval_model, "terms", doc_lengths)
+		return retrieval_model
+	return use
+
+# Returns a function making a given (indexes, term counts, positional index)
+# triple the index of the indexer, as reading another index does, and binding
+# the retrieval models to it. The index of the fixture corpus is bound again
+# at the end of the test.
+@pytest.fixture
+def change_index(retrieval_model, monkeypatch):
+	def change(structures):
+		for name, value in zip(("indexes", "term_counts", "positional_index"), structures):
+			monkeypatch.setattr(indexer, name, value)
+		monkeypatch.setattr(indexer, "document_norms", dict())
+		indexer._next_generation()
+		retrieval_model.refresh_index()
+		return retrieval_model
+	yield change
+	monkeypatch.undo()
+	indexer._next_generation()
+	retrieval_model.refresh_index()
@@ -0,0 +1,71 @@
+from conftest import PROJECT_DIR
+from lib.shared_utils.analyzer import Analyzer, read_stop_words
+from lib.shared_utils.convert_queries import convert_query_file
+
+from csv import reader as csv_reader
+from os.path import join
+from re import IGNORECASE, escape, sub
+from xml.dom import minidom
+import pytest
+
+QUERY_XML_FILE = join(PROJECT_DIR, "test-collection", "cacm.query.txt")
+STOP_WORDS_FILE = join(PROJECT_DIR, "test-collection", "common_words")
+
+# Returns the (query ID, query text) of the CACM queries
+@pytest.fixture(scope="module")
+def query_texts():
+	queries = minidom.parse(QUERY_XML_FILE).getElementsByTagName("DOC")
+	return [(query.getElementsByTagName("DOCNO")[0].firstChild.data.strip(), query.lastChild.data) for query in queries]
+
+@pytest.fixture(scope="module")
+def stop_words():
+	return read_stop_words(STOP_WORDS_FILE)
+
+# Preprocesses text the way queries were before the analyzer: one
+# substitution per stop word, used as a pattern unless `literal` is set, then
+# case folding, punctuation handling and tokenizing
+def reference_analyze(text, stop_words, literal=True):
+	for stop_word in stop_words:
+		text = sub(r'(?<!-)\b' + (escape(stop_word) if literal else stop_word) + r'(?!-)\b', '', text, flags=IGNORECASE)
+	return ' '.join(sub('[^0-9a-zA-Z-]+', ' ', text.lower()).split())
+
+def test_terms_match_reference(query_texts, stop_words):
+	analyzer = Analyzer(stop_words)
+	for _, text in query_texts:
+		assert analyzer.analyze(text) == reference_analyze(text, stop_words)
+		assert Analyzer().analyze(text) == reference_analyze(text, [])
+
+# Stop words are literal words: the "/*" entry of the stop word list used to
+# delete slashes as a pattern, so "EL/1" in query 64 became "el1"
+def test_stop_words_are_not_patterns(query_texts, stop_words):
+	analyzer = Analyzer(stop_words)
+	changed = [query_id for query_id, text in query_texts if analyzer.analyze(text) != reference_analyze(text, stop_words, literal=False)]
+	assert changed == ["64"]
+	text = dict(query_texts)["64"]
+	assert "el 1" in analyzer.analyze(text)
+	assert "el 1" not in reference_analyze(text, stop_words, literal=False)
+	assert Analyzer(["/*"]).analyze("EL/1 and EL1") == "el 1 and el1"
+
+def test_stopping_keeps_hyphenated_words():
+	analyzer = Analyzer(["time", "and"])
+	assert analyzer.analyze("Time-sharing AND time sharing") == "time-sharing sharing"
+	assert analyzer.remove_stop_words("Time-sharing AND time sharing") == "Time-sharing   sharing"
+
+def test_normalize_keeps_case_punctuation_and_whitespace(query_texts, stop_words):
+	analyzer = Analyzer(stop_words, foldcase=False, handlePunctuation=False)
+	for _, text in query_texts:
+		expected = text
+		for stop_word in stop_words:
+			expected = sub(r'(?<![\w-])' + escape(stop_word) + r'(?![\w-])', '', expected, flags=IGNORECASE)
+		assert analyzer.normalize(text) == expected
+		assert analyzer.tokens(text) == expected.split()
+
+def test_query_file_conversion(query_texts, stop_words, tmp_path):
+	output_path = str(tmp_path / "queries.tsv")
+	convert_query_file(QUERY_XML_FILE, output_path, STOP_WORDS_FILE)
+	with open(output_path) as query_file:
+		rows = [(row[0].strip(), row[1]) for row in csv_reader(query_file, delimiter='\t')]
+	assert rows == [(query_id, reference_analyze(text, stop_words)) for query_id, text in query_texts]
+
+def test_query_terms(retrieval_model):
+	assert retrieval_model._get_terms("EL/1 and Time-Sharing, (ALGOL)") == ["el", "1", "and", "time-sharing", "algol"]
@@ -0,0 +1,117 @@
+from conftest import SOURCE_DIRECTORY, corpus_files
+from lib.from_scratch import indexer
+from lib.from_scratch.indexer import document_id
+from lib.shared_utils.article_processor import MANIFEST_FILE, clean_article, process_directory, stream_documents
+
+from hashlib import sha256
+from os import listdir, remove, stat, utime
+from os.path import join
+from pickle import dumps, load as pickle_load
+from shutil import copy
+import pytest
+
+NUM_DOCUMENTS = 20
+
+# A directory with copies of the HTML sources of the first fixture documents
+@pytest.fixture
+def input_dir(tmp_path):
+	directory = tmp_path / "input"
+	directory.mkdir()
+	for path in corpus_files(NUM_DOCUMENTS):
+		copy(join(SOURCE_DIRECTORY, document_id(path) + ".html"), str(directory))
+	return str(directory)
+
+# The cleaned texts of the first fixture documents (docID -> text)
+@pytest.fixture(scope="module")
+def clean_texts():
+	texts = dict()
+	for path in corpus_files(NUM_DOCUMENTS):
+		with open(path) as text_file:
+			texts[document_id(path)] = text_file.read()
+	return texts
+
+# Returns the texts of the output files in `directory` (docID -> text)
+def output_texts(directory):
+	texts = dict()
+	for name in sorted(listdir(directory)):
+		if name != MANIFEST_FILE:
+			with open(join(directory, name)) as text_file:
+				texts[document_id(name)] = text_file.read()
+	return texts
+
+def read_manifest(directory):
+	with open(join(directory, MANIFEST_FILE), "rb") as manifest_file:
+		return pickle_load(manifest_file)
+
+def test_outputs_match_clean_texts(input_dir, clean_texts, tmp_path):
+	process_directory(input_dir, str(tmp_path / "serial"))
+	process_directory(input_dir, str(tmp_path / "parallel"), workers=2)
+	assert output_texts(str(tmp_path / "serial")) == clean_texts
+	assert output_texts(str(tmp_path / "parallel")) == clean_texts
+
+def test_manifest_holds_input_signatures(input_dir, tmp_path):
+	output_dir = str(tmp_path / "output")
+	process_directory(input_dir, output_dir)
+	files = read_manifest(output_dir)["files"]
+	assert set(files) == set(listdir(input_dir))
+	for name, (size, mtime_ns, content_hash) in files.items():
+		file_stat = stat(join(input_dir, name))
+		with open(join(input_dir, name), "rb") as input_file:
+			assert (size, mtime_ns, content_hash) == (file_stat.st_size, file_stat.st_mtime_ns, sha256(input_file.read()).hexdigest())
+
+def test_only_changed_inputs_are_reprocessed(input_dir, clean_texts, tmp_path):
+	output_dir = str(tmp_path / "output")
+	process_directory(input_dir, output_dir)
+	names = sorted(listdir(input_dir))
+	inputs = [join(input_dir, name) for name in names]
+	outputs = [join(output_dir, document_id(name) + ".txt") for name in names]
+
+	# Mark the outputs, to see which ones are written again
+	for output in outputs:
+		with open(output, "w") as output_file:
+			output_file.write("not reprocessed")
+
+	# 0: touched, with the same content; 1: changed, with the same size and
+	# mtime; 2: changed; 3: removed; 4: output deleted
+	utime(inputs[0], ns=(stat(inputs[0]).st_atime_ns, stat(inputs[0]).st_mtime_ns + 10 ** 9))
+	file_stat = stat(inputs[1])
+	with open(inputs[1], "r+b") as input_file:
+		data = input_file.read()
+		assert b"<pre>" in data
+		input_file.seek(0)
+		input_file.write(data.replace(b"<pre>", b"<PRE>", 1))
+	utime(inputs[1], ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+	with open(inputs[2], "a") as input_file:
+		input_file.write("appended text")
+	remove(inputs[3])
+	remove(outputs[4])
+
+	process_directory(input_dir, output_dir)
+	texts = output_texts(output_dir)
+	assert texts[document_id(names[0])] == "not reprocessed"
+	assert texts[document_id(names[1])] == "not reprocessed"
+	with open(inputs[2]) as input_file:
+		assert texts[document_id(names[2])] == clean_article(input_file.read())
+	assert document_id(names[3]) not in texts
+	assert texts[document_id(names[4])] == clean_texts[document_id(names[4])]
+	assert all(texts[document_id(name)] == "not reprocessed" for name in names[5:])
+	assert set(read_manifest(output_dir)["files"]) == set(listdir(input_dir))
+	assert read_manifest(output_dir)["files"][names[0]][1] == stat(inputs[0]).st_mtime_ns
+
+	# Other options reprocess every input
+	process_directory(input_dir, output_dir, removeFinalInts=False)
+	with open(inputs[5]) as input_file:
+		assert output_texts(output_dir)[document_id(names[5])] == clean_article(input_file.read(), removeFinalInts=False)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_streamed_token_lists_match_clean_texts(input_dir, clean_texts, workers):
+	documents = list(stream_documents(input_dir, workers))
+	assert documents == [(doc_id, text.split()) for doc_id, text in sorted(clean_texts.items())]
+
+def test_streamed_index_matches_text_file_index(input_dir, monkeypatch):
+	structures = indexer.new_index_structures()
+	monkeypatch.setattr(indexer, "indexes", structures[0])
+	monkeypatch.setattr(indexer, "term_counts", structures[1])
+	monkeypatch.setattr(indexer, "positional_index", structures[2])
+	indexer.index_token_lists(stream_documents(input_dir))
+	assert dumps(structures) == dumps(indexer.index_files(corpus_files(NUM_DOCUMENTS)))
@@ -0,0 +1,39 @@
+from conftest import QUERY_FILE
+
+import pytest
+
+NUM_RESULTS = 100
+
+# Returns the TREC result lines printed by `process`
+def printed_results(capsys, process, *args, **kwargs):
+	capsys.readouterr()
+	process(*args, **kwargs)
+	return [line for line in capsys.readouterr().out.splitlines() if " Q0 " in line]
+
+@pytest.mark.parametrize("model_name, params", [
+	("BM25RetrievalModel", ()),
+	("JMQueryLikelihoodModel", (0.35,)),
+	("DirichletQueryLikelihoodModel", (2000,)),
+	("VectorSpaceRetrievalModel", ()),
+])
+def test_batch_output_matches_query_file_output(retrieval_model, capsys, model_name, params):
+	model = getattr(retrieval_model, model_name)(*params)
+	expected = printed_results(capsys, model.process_query_file, QUERY_FILE, num_results=NUM_RESULTS)
+	assert len(expected) > 0
+	assert printed_results(capsys, model.process_query_file_batch, QUERY_FILE, num_results=NUM_RESULTS) == expected
+
+def test_batch_ranking_matches_ranked_documents(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	all_terms = [retrieval_model._get_terms(query_string) for _, query_string in queries] + [["udo", "computer"], ["qwertyuiop"], []]
+	for terms, ranked in zip(all_terms, model.batch_ranked_documents(all_terms, 10)):
+		assert ranked == model.ranked_documents(terms)[:10]
+
+@pytest.mark.parametrize("λ", [0.1, 0.35, 0.7])
+def test_jm_posting_values_match_posting_value(retrieval_model, λ):
+	model = retrieval_model.JMQueryLikelihoodModel(λ)
+	matrix = retrieval_model.term_document_matrix()
+	values = model.batch_posting_values(matrix)
+	for term, row in matrix.term_rows.items():
+		columns, counts = matrix.postings(term)
+		expected = [model.posting_value(term, count, matrix.doc_ids[column]) for column, count in zip(columns, counts)]
+		assert values.data[values.indptr[row]:values.indptr[row + 1]].tolist() == expected
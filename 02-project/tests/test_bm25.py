@@ -0,0 +1,22 @@
+# The accumulator and the reference scorer sum the contributions of the query
+# terms in the same order, and both order tied scores by descending docID, so
+# their rankings must be identical: scores are compared without tolerance.
+def test_ranked_documents_match_reference(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	for _, query_string in queries:
+		terms = retrieval_model._get_terms(query_string)
+		assert model.ranked_documents(terms) == model.reference_ranked_documents(terms)
+
+def test_repeated_query_terms_are_weighted_by_query_frequency(retrieval_model):
+	model = retrieval_model.BM25RetrievalModel()
+	terms = ["computer", "computer", "system"]
+	assert all(term in retrieval_model.index for term in terms)
+	assert model.ranked_documents(terms) == model.reference_ranked_documents(terms)
+	assert model.ranked_documents(terms) != model.ranked_documents(["computer", "system"])
+
+def test_ranked_documents_follow_parameter_changes(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	terms = retrieval_model._get_terms(queries[0][1])
+	model.ranked_documents(terms)
+	model.k1, model.b = 2.0, 0.3
+	assert model.ranked_documents(terms) == model.reference_ranked_documents(terms)
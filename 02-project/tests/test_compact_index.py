@@ -0,0 +1,39 @@
+from lib.from_scratch.compact_index import CompactIndex
+
+from pickle import dumps, loads
+import pytest
+
+@pytest.fixture(scope="module")
+def compact_index(structures):
+	return CompactIndex.from_inverted_index(structures[0][0])
+
+def test_postings_match_inverted_index(structures, compact_index):
+	index = structures[0][0]
+	assert set(compact_index.keys()) == set(index.keys())
+	for term, postings in index.items():
+		assert dict(compact_index[term].items()) == dict(postings)
+		assert compact_index.document_frequency(term) == len(postings)
+		assert compact_index.collection_frequency(term) == sum(postings.values())
+
+def test_unknown_terms_and_documents_read_as_empty(compact_index):
+	assert len(compact_index["qwertyuiop"]) == 0
+	assert compact_index.get("qwertyuiop") is None
+	assert "qwertyuiop" not in compact_index
+	term = next(iter(compact_index))
+	assert compact_index[term]["CACM-9999"] == 0
+
+def test_pickle_round_trip(compact_index):
+	copy = loads(dumps(compact_index))
+	for term in compact_index:
+		assert copy[term].items() == compact_index[term].items()
+
+def test_rankings_match_inverted_index(retrieval_model, use_index, compact_index, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	expected = [model.ranked_documents(retrieval_model._get_terms(query_string)) for _, query_string in queries]
+
+	use_index(compact_index)
+	model = retrieval_model.BM25RetrievalModel()
+	for (_, query_string), ranked in zip(queries, expected):
+		terms = retrieval_model._get_terms(query_string)
+		assert model.ranked_documents(terms) == ranked
+		assert model.top_k_documents(terms, 10) == ranked[:10]
@@ -0,0 +1,83 @@
+from lib.from_scratch.compressed_positions import CompressedPositionalIndex
+from lib.from_scratch.indexer import document_id, read_tokenized_document
+
+from collections import defaultdict
+from pickle import dumps, loads
+import pytest
+
+# Returns the positions of every term in every document (term -> docID ->
+# positions), read directly from the token lists
+def reference_positions(paths):
+	positions = defaultdict(dict)
+	for path in paths:
+		doc_id = document_id(path)
+		for i, term in enumerate(read_tokenized_document(path)):
+			positions[term].setdefault(doc_id, []).append(i)
+	return positions
+
+# Returns the positions of every term in every document of a positional index
+def index_positions(positional_index):
+	return {term: dict(positional_index[term].positions()) for term in positional_index}
+
+@pytest.fixture(scope="module")
+def expected(corpus):
+	return reference_positions(corpus)
+
+def test_positions_match_token_lists(structures, expected):
+	positional_index = structures[2]
+	assert index_positions(positional_index) == expected
+	for term in list(expected)[:200]:
+		for doc_id, positions in expected[term].items():
+			assert positional_index.positions(term, doc_id) == positions
+	assert positional_index.positions("qwertyuiop", "CACM-0001") == []
+	assert positional_index.positions(next(iter(expected)), "CACM-9999") == []
+
+# Looks up every document in the postings of the first terms
+def check_lookups(positional_index, expected, doc_ids):
+	for term in list(expected)[:100]:
+		postings = positional_index[term]
+		assert len(postings) == len(expected[term])
+		for doc_id in doc_ids:
+			assert (doc_id in postings) == (doc_id in expected[term])
+			assert positional_index.positions(term, doc_id) == expected[term].get(doc_id, [])
+
+def test_lookups_match_token_lists(structures, expected, monkeypatch):
+	positional_index = loads(dumps(structures[2]))
+	check_lookups(positional_index, expected, positional_index.doc_ids)
+	# The postings of a term are walked once, by the first lookup
+	walked = []
+	monkeypatch.setattr(positional_index, "cursor", walked.append)
+	monkeypatch.setattr(positional_index, "_encoded_postings", walked.append)
+	check_lookups(positional_index, expected, positional_index.doc_ids)
+	assert walked == []
+
+def test_pickle_round_trip(structures, expected):
+	assert index_positions(loads(dumps(structures[2]))) == expected
+
+def test_merge_matches_single_index(corpus, structures, expected):
+	split = len(corpus) // 3
+	first = CompressedPositionalIndex()
+	second = CompressedPositionalIndex()
+	for i, path in enumerate(corpus):
+		term_positions = defaultdict(list)
+		for position, term in enumerate(read_tokenized_document(path)):
+			term_positions[term].append(position)
+		(first if i < split else second).add_document(document_id(path), term_positions)
+	# Merging into an unpickled index appends to its read-only buffers
+	first = loads(dumps(first))
+	check_lookups(first, reference_positions(corpus[:split]), structures[2].doc_ids)
+	first.merge(second)
+	assert first.doc_ids == structures[2].doc_ids
+	assert index_positions(first) == expected
+	check_lookups(first, expected, structures[2].doc_ids)
+	# Lookups stay current as documents are added
+	first.add_document("CACM-9999", {term: [0] for term in list(expected)[:100]})
+	for term in list(expected)[:100]:
+		assert first.positions(term, "CACM-9999") == [0]
+		assert len(first[term]) == len(expected[term]) + 1
+
+def test_without_drops_documents(corpus, structures, expected):
+	deleted = {document_id(path) for path in corpus[::7]}
+	remaining = structures[2].without(deleted)
+	expected_remaining = {term: {doc_id: positions for doc_id, positions in postings.items() if doc_id not in deleted} for term, postings in expected.items()}
+	assert index_positions(remaining) == {term: postings for term, postings in expected_remaining.items() if postings}
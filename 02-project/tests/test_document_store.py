@@ -0,0 +1,59 @@
+from lib.from_scratch.indexer import document_id
+from lib.shared_utils.document_store import CHUNK_SIZE, HEADER, DocumentStore, write_document_store
+
+import pytest
+
+@pytest.fixture(scope="module")
+def documents(corpus):
+	texts = dict()
+	for path in corpus:
+		with open(path, "r", encoding="utf-8") as text_file:
+			texts[document_id(path)] = text_file.read()
+	# A document larger than a chunk, one that is empty and one with non-ASCII
+	# text
+	texts["large"] = "lorem ipsum " * CHUNK_SIZE
+	texts["empty"] = ""
+	texts["unicode"] = "Gödel, Escher, Bach — naïve café"
+	return texts
+
+@pytest.fixture(scope="module")
+def store_path(documents, tmp_path_factory):
+	path = str(tmp_path_factory.mktemp("document_store") / "documents.store")
+	write_document_store(path, documents.items())
+	return path
+
+def test_texts_match_source_texts(documents, store_path):
+	store = DocumentStore(store_path)
+	assert len(store) == len(documents)
+	assert list(store) == list(documents)
+	for doc_id, text in documents.items():
+		assert doc_id in store
+		assert store.get_text(doc_id) == text
+
+def test_random_access_order(documents, store_path):
+	store = DocumentStore(store_path)
+	for doc_id in reversed(list(documents)):
+		assert store.get_text(doc_id) == documents[doc_id]
+
+def test_unknown_documents(store_path):
+	store = DocumentStore(store_path)
+	assert "CACM-9999" not in store
+	assert store.get_text("CACM-9999") is None
+
+def test_sections_are_aligned(store_path):
+	store = DocumentStore(store_path)
+	section_offsets = HEADER.unpack_from(store.buffer, 0)[4:]
+	assert all(offset % 8 == 0 for offset in section_offsets)
+
+def test_empty_store(tmp_path):
+	path = str(tmp_path / "empty.store")
+	write_document_store(path, [])
+	store = DocumentStore(path)
+	assert len(store) == 0
+	assert store.get_text("CACM-0001") is None
+
+def test_not_a_store(tmp_path):
+	path = tmp_path / "not.store"
+	path.write_bytes(b"\0" * HEADER.size)
+	with pytest.raises(ValueError):
+		DocumentStore(str(path))
@@ -0,0 +1,98 @@
+from conftest import PROJECT_DIR, RELEVANCE_FILE
+from lib.shared_utils.evaluation import compare_runs, evaluate_runs, mean_scores, read_binary_relevance_file, read_result_file, write_json
+
+from io import StringIO
+from json import loads
+from math import log2
+from os.path import join
+from re import sub
+from subprocess import check_output
+from sys import executable
+import pytest
+
+# Per-query metrics computed one by one, from their definitions
+def average_precision(ranking, relevant):
+	hits = 0
+	total = 0.0
+	for rank, doc_id in enumerate(ranking, 1):
+		if doc_id in relevant:
+			hits += 1
+			total += hits / rank
+	return total / max(len(relevant), 1)
+
+def reciprocal_rank(ranking, relevant):
+	for rank, doc_id in enumerate(ranking, 1):
+		if doc_id in relevant:
+			return 1.0 / rank
+	return 0.0
+
+def precision_at(ranking, relevant, k):
+	return len([doc_id for doc_id in ranking[:k] if doc_id in relevant]) / k
+
+def ndcg(ranking, relevant, k=None):
+	ranking = ranking if k is None else ranking[:k]
+	gain = sum(1.0 / log2(rank + 1) for rank, doc_id in enumerate(ranking, 1) if doc_id in relevant)
+	ideal_length = max(len(relevant), 1) if k is None else min(max(len(relevant), 1), k)
+	return gain / sum(1.0 / log2(rank + 1) for rank in range(1, ideal_length + 1))
+
+RELEVANCE = {"1": {"a", "c", "f"}, "2": {"b"}, "3": {"x", "y"}}
+RUNS = [
+	{"1": ["a", "b", "c", "d", "e", "f"], "2": ["c", "a", "b"], "3": ["q"]},
+	{"1": ["c", "a"], "2": ["b"], "3": []},
+]
+
+def test_metrics_match_definitions():
+	query_ids, scores = evaluate_runs(RELEVANCE, RUNS, k_values=(2, 5))
+	for r, run in enumerate(RUNS):
+		for q, query_id in enumerate(query_ids):
+			ranking, relevant = run.get(query_id, []), RELEVANCE[query_id]
+			hits = len([doc_id for doc_id in ranking if doc_id in relevant])
+			assert scores["map"][r][q] == pytest.approx(average_precision(ranking, relevant))
+			assert scores["mrr"][r][q] == pytest.approx(reciprocal_rank(ranking, relevant))
+			assert scores["p@2"][r][q] == pytest.approx(precision_at(ranking, relevant, 2))
+			assert scores["p@5"][r][q] == pytest.approx(precision_at(ranking, relevant, 5))
+			assert scores["r-precision"][r][q] == pytest.approx(precision_at(ranking, relevant, len(relevant)))
+			assert scores["ndcg"][r][q] == pytest.approx(ndcg(ranking, relevant))
+			assert scores["ndcg@2"][r][q] == pytest.approx(ndcg(ranking, relevant, 2))
+			assert scores["precision"][r][q] == pytest.approx(hits / max(len(ranking), 1))
+			assert scores["recall"][r][q] == pytest.approx(hits / len(relevant))
+
+def test_precision_at_k_divides_by_k():
+	_, scores = evaluate_runs({"1": {"a"}}, [{"1": ["a"]}], k_values=(5,))
+	assert scores["p@5"][0][0] == pytest.approx(0.2)
+
+def test_identical_runs_are_not_significantly_different():
+	_, scores = evaluate_runs(RELEVANCE, [RUNS[0], RUNS[0], RUNS[1]])
+	comparisons = compare_runs(scores)
+	assert comparisons[0] is None
+	assert comparisons[1]["map"] == (0.0, 1.0, 1.0)
+	assert comparisons[2]["map"][0] == pytest.approx(mean_scores(scores)["map"][2] - mean_scores(scores)["map"][0])
+
+def test_json_output():
+	query_ids, scores = evaluate_runs(RELEVANCE, RUNS)
+	output = StringIO()
+	write_json(output, ["first", "second"], query_ids, scores, compare_runs(scores))
+	result = loads(output.getvalue())
+	assert result["baseline"] == "first"
+	assert result["runs"]["second"]["queries"]["mrr"]["2"] == 1.0
+	assert "second" in result["comparisons"]
+
+def test_committed_baseline_run_matches_definitions():
+	relevance_data = read_binary_relevance_file(RELEVANCE_FILE)
+	results = read_result_file(join(PROJECT_DIR, "results_baseline_bm25.txt"))
+	query_ids, scores = evaluate_runs(relevance_data, [results])
+	for q, query_id in enumerate(query_ids):
+		ranking = results.get(query_id, [])
+		assert scores["map"][0][q] == pytest.approx(average_precision(ranking, relevance_data[query_id]))
+		assert scores["p@20"][0][q] == pytest.approx(precision_at(ranking, relevance_data[query_id], 20))
+
+# Replaces the numbers of a line of the evaluation output by "#"
+def layout(line):
+	return sub(r"\d+(\.\d+)?(e-?\d+)?", "#", line)
+
+# The script prints a single run in the layout of the committed eval_*.txt files
+def test_single_run_output_keeps_layout():
+	output = check_output([executable, "evaluation.py", RELEVANCE_FILE, "results_baseline_bm25.txt"], cwd=PROJECT_DIR, universal_newlines=True)
+	with open(join(PROJECT_DIR, "eval_baseline_bm25.txt")) as eval_file:
+		expected = eval_file.read()
+	assert [layout(line) for line in output.splitlines()] == [layout(line) for line in expected.splitlines()]
@@ -0,0 +1,65 @@
+from lib.from_scratch.index_file import HEADER, MappedIndex, is_index_file, write_index_file
+
+from math import log2
+from pickle import dumps, loads
+import pytest
+
+@pytest.fixture(scope="module")
+def index_path(structures, tmp_path_factory):
+	path = str(tmp_path_factory.mktemp("index_file") / "index.bin")
+	write_index_file(path, structures[0][0], structures[1])
+	return path
+
+def test_mapped_postings_match_inverted_index(structures, index_path):
+	index = structures[0][0]
+	mapped_index = MappedIndex(index_path)
+	assert is_index_file(index_path)
+	assert sorted(mapped_index.keys()) == sorted(index.keys())
+	for term, postings in index.items():
+		assert dict(mapped_index[term].items()) == dict(postings)
+	assert "qwertyuiop" not in mapped_index
+
+def test_document_lengths_match_term_counts(structures, index_path):
+	doc_lengths = MappedIndex(index_path).doc_lengths
+	assert dict(zip(doc_lengths, doc_lengths.values())) == dict(structures[1])
+	assert doc_lengths["CACM-9999"] == 0
+
+def test_sections_are_aligned(index_path):
+	section_offsets = HEADER.unpack_from(MappedIndex(index_path).buffer, 0)[7:]
+	assert all(offset % 8 == 0 for offset in section_offsets)
+
+def test_pickles_by_path(index_path):
+	copy = loads(dumps(MappedIndex(index_path)))
+	assert copy.path == index_path
+
+def test_rankings_match_inverted_index(retrieval_model, use_index, index_path, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	expected = [model.ranked_documents(retrieval_model._get_terms(query_string)) for _, query_string in queries]
+
+	mapped_index = MappedIndex(index_path)
+	use_index(mapped_index, mapped_index.doc_lengths)
+	model = retrieval_model.BM25RetrievalModel()
+	for (_, query_string), ranked in zip(queries, expected):
+		assert model.ranked_documents(retrieval_model._get_terms(query_string)) == ranked
+
+# Building the models and ranking a query only looks up the query terms in the
+# term table, with a binary search each, instead of reading every term. The
+# vector space model sums the query terms in the order of the terms of the
+# index, sorted here, so its scores match up to rounding.
+def test_models_read_only_query_terms(retrieval_model, use_index, index_path, queries, monkeypatch):
+	terms = retrieval_model._get_terms(queries[0][1])
+	document_norms = retrieval_model.VectorSpaceRetrievalModel().document_norms
+	expected_top_k = retrieval_model.BM25RetrievalModel().top_k_documents(terms, 10)
+	expected = retrieval_model.VectorSpaceRetrievalModel().ranked_documents(terms)
+
+	mapped_index = MappedIndex(index_path)
+	use_index(mapped_index, mapped_index.doc_lengths)
+	monkeypatch.setattr(retrieval_model, "document_norms", document_norms)
+	decoded = set()
+	encoded = mapped_index.terms._encoded
+	monkeypatch.setattr(mapped_index.terms, "_encoded", lambda i: decoded.add(i) or encoded(i))
+	assert retrieval_model.BM25RetrievalModel().top_k_documents(terms, 10) == expected_top_k
+	ranked = dict(retrieval_model.VectorSpaceRetrievalModel().ranked_documents(terms))
+	assert ranked.keys() == dict(expected).keys()
+	assert all(ranked[doc_id] == pytest.approx(score) for doc_id, score in expected)
+	assert len(decoded) <= len(set(terms)) * (log2(len(mapped_index)) + 1)
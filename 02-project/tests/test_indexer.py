@@ -0,0 +1,39 @@
+from lib.from_scratch import indexer
+
+from os import symlink
+from os.path import basename
+from pickle import dumps
+import pytest
+
+# A directory holding (links to) the fixture corpus
+@pytest.fixture(scope="module")
+def corpus_directory(corpus, tmp_path_factory):
+	directory = tmp_path_factory.mktemp("corpus")
+	for path in corpus:
+		symlink(path, directory / basename(path))
+	return str(directory)
+
+# Indexes the files of `directory` into fresh index structures, returning them
+def build(monkeypatch, directory, workers):
+	indexes, term_counts, positional_index = indexer.new_index_structures()
+	monkeypatch.setattr(indexer, "indexes", indexes)
+	monkeypatch.setattr(indexer, "term_counts", term_counts)
+	monkeypatch.setattr(indexer, "positional_index", positional_index)
+	indexer.index_documents(directory, workers)
+	return indexer.indexes, indexer.term_counts, indexer.positional_index
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_build_matches_serial_build(corpus_directory, monkeypatch, workers):
+	serial = dumps(build(monkeypatch, corpus_directory, 1))
+	assert dumps(build(monkeypatch, corpus_directory, workers)) == serial
+
+def test_compact_shards_merge_back_to_the_same_structures(corpus):
+	shard = indexer.index_files(corpus[:50])
+	merged = indexer.new_index_structures()
+	indexer._merge_compact_shard(merged, indexer._compact_shard(shard))
+	assert dumps(merged) == dumps(shard)
+
+def test_parallel_build_adds_to_structures(corpus):
+	target = indexer.index_files(corpus[:50])
+	indexer.index_files(corpus[50:], workers=2, structures=target)
+	assert dumps(target) == dumps(indexer.index_files(corpus))
@@ -0,0 +1,33 @@
+from lib.from_scratch.ngram_index import NGramIndex
+from lib.from_scratch.proximity import Phrase
+
+from pickle import dumps, loads
+import pytest
+
+@pytest.fixture(scope="module")
+def ngram_index(structures):
+	return NGramIndex.from_inverted_indexes(structures[0][1:3])
+
+def test_postings_match_inverted_indexes(structures, ngram_index):
+	kept = 0
+	for inverted_index in structures[0][1:3]:
+		for ngram, postings in inverted_index.items():
+			if sum(postings.values()) >= ngram_index.min_frequency:
+				assert ngram in ngram_index
+				assert dict(ngram_index.postings(list(ngram)).items()) == dict(postings)
+				kept += 1
+			else:
+				assert ngram not in ngram_index
+				assert not ngram_index.covers(ngram)
+	assert len(ngram_index) == kept
+
+def test_covered_phrases_match_positional_index(structures, ngram_index):
+	bigrams = sorted(structures[0][1].items(), key=lambda item: -sum(item[1].values()))[:20]
+	for ngram, _ in bigrams:
+		assert ngram_index.covers(ngram)
+		assert dict(ngram_index.postings(ngram).items()) == Phrase(list(ngram)).matches(structures[2])
+
+def test_pickle_round_trip(ngram_index):
+	copy = loads(dumps(ngram_index))
+	assert len(copy) == len(ngram_index)
+	assert copy.sizes == (2, 3)
@@ -0,0 +1,49 @@
+from conftest import QUERY_FILE, RELEVANCE_FILE, fixture_queries
+from lib.shared_utils.evaluation import evaluate_runs, mean_scores, read_binary_relevance_file
+
+import numpy as np
+import pytest
+
+MODEL_PARAMS = {
+	"bm25": {"k1": [0.9, 1.2], "b": [0.75], "k2": [100]},
+	"jm": {"λ": [0.3]},
+	"dirichlet": {"μ": [1000]},
+}
+
+# Returns the mean metrics of the queries ranked one by one by `model`
+def evaluate_model(retrieval_model, model, relevance_data, queries, num_results):
+	results = {retrieval_model._query_key(query_id): [doc_id for doc_id, _ in model.ranked_documents(retrieval_model._get_terms(query_string))[:num_results]] for query_id, query_string in queries}
+	_, scores = evaluate_runs(relevance_data, [results])
+	return {metric: float(values[0]) for metric, values in mean_scores(scores).items()}
+
+@pytest.fixture
+def parameter_sweep(retrieval_model):
+	from lib.from_scratch import parameter_sweep
+	# Models built for an earlier index
+	parameter_sweep._models.clear()
+	return parameter_sweep
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_leaderboard_matches_separate_runs(retrieval_model, parameter_sweep, workers):
+	relevance_data = read_binary_relevance_file(RELEVANCE_FILE)
+	leaderboard = parameter_sweep.sweep(MODEL_PARAMS, QUERY_FILE, relevance_data, workers=workers, num_results=50)
+	assert len(leaderboard) == 4
+	assert [entry[2]["map"] for entry in leaderboard] == sorted([entry[2]["map"] for entry in leaderboard], reverse=True)
+
+	# Every query of the query file
+	queries = fixture_queries(count=None)
+	for name, params, metrics in leaderboard:
+		model_class, param_names, _ = parameter_sweep.MODELS[name]
+		model = model_class(*[params[param_name] for param_name in param_names])
+		expected = evaluate_model(retrieval_model, model, relevance_data, queries, 50)
+		for metric, value in expected.items():
+			assert metrics[metric] == pytest.approx(value)
+
+def test_grid_configurations(parameter_sweep):
+	configurations = parameter_sweep.grid_configurations({"k1": [1, 2], "b": [0.5]})
+	assert configurations == [{"k1": 1, "b": 0.5}, {"k1": 2, "b": 0.5}]
+
+def test_random_search_stays_in_range(parameter_sweep):
+	configurations = parameter_sweep.random_configurations({"k1": [0.5, 2.0], "b": [0.25, 1.0]}, 20, np.random.default_rng(0))
+	assert len(configurations) == 20
+	assert all(0.5 <= params["k1"] <= 2.0 and 0.25 <= params["b"] <= 1.0 for params in configurations)
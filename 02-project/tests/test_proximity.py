@@ -0,0 +1,71 @@
+from lib.from_scratch.indexer import document_id, read_tokenized_document
+from lib.from_scratch.proximity import OrderedWindow, Phrase, ProximityOperator, UnorderedWindow, parse_query
+
+from collections import Counter
+import pytest
+
+# Returns whether `terms` occur in order in `tokens` from `start`, each at most
+# `width` positions after the previous one
+def ordered_match(tokens, start, terms, width):
+	if not terms:
+		return True
+	return any(tokens[position] == terms[0] and ordered_match(tokens, position, terms[1:], width) for position in range(start + 1, min(start + width + 1, len(tokens))))
+
+# Counts the matches of the operators by scanning the token lists
+def reference_ordered(documents, terms, width):
+	counts = dict()
+	for doc_id, tokens in documents.items():
+		count = sum(1 for i, token in enumerate(tokens) if token == terms[0] and ordered_match(tokens, i, terms[1:], width))
+		if count > 0:
+			counts[doc_id] = count
+	return counts
+
+def reference_unordered(documents, terms, width):
+	counts = dict()
+	for doc_id, tokens in documents.items():
+		count = sum(1 for end, token in enumerate(tokens) if token in terms and all(term in tokens[max(0, end - width + 1):end + 1] for term in terms))
+		if count > 0:
+			counts[doc_id] = count
+	return counts
+
+@pytest.fixture(scope="module")
+def documents(corpus):
+	return {document_id(path): read_tokenized_document(path) for path in corpus}
+
+# The most frequent adjacent pairs and triples of the fixture corpus
+@pytest.fixture(scope="module")
+def term_lists(documents):
+	pairs = Counter(pair for tokens in documents.values() for pair in zip(tokens, tokens[1:]))
+	triples = Counter(triple for tokens in documents.values() for triple in zip(tokens, tokens[1:], tokens[2:]))
+	return [list(terms) for terms, _ in pairs.most_common(15) + triples.most_common(5)] + [["computer", "qwertyuiop"], ["system", "system"]]
+
+def test_phrases_match_token_lists(structures, documents, term_lists):
+	for terms in term_lists:
+		assert Phrase(terms).matches(structures[2]) == reference_ordered(documents, terms, 1)
+
+@pytest.mark.parametrize("width", [2, 5])
+def test_ordered_windows_match_token_lists(structures, documents, term_lists, width):
+	for terms in term_lists:
+		assert OrderedWindow(terms, width).matches(structures[2]) == reference_ordered(documents, terms, width)
+
+@pytest.mark.parametrize("width", [2, 8])
+def test_unordered_windows_match_token_lists(structures, documents, term_lists, width):
+	for terms in term_lists:
+		assert UnorderedWindow(terms, width).matches(structures[2]) == reference_unordered(documents, list(dict.fromkeys(terms)), width)
+
+def test_base_operator_matches_nothing(structures, term_lists):
+	assert ProximityOperator(term_lists[0], 1).matches(structures[2]) == dict()
+
+def test_parse_query():
+	query_text, operators = parse_query('"time sharing" systems #uw5(ibm operating) #od2(a)', str.split)
+	assert query_text.split() == ["time", "sharing", "systems", "ibm", "operating", "a"]
+	assert operators == [Phrase(["time", "sharing"]), UnorderedWindow(["ibm", "operating"], 5)]
+
+def test_proximity_scoring_without_operators_matches_plain_ranking(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	terms = retrieval_model._get_terms(queries[0][1])
+	expected = model.ranked_documents(terms)
+	model.proximity_weight = 1.0
+	boosted = dict(model.ranked_documents(terms))
+	assert boosted.keys() == dict(expected).keys()
+	assert all(boosted[doc_id] >= score for doc_id, score in expected)
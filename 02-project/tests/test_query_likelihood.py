@@ -0,0 +1,23 @@
+import pytest
+
+# The posting-driven scorers match the per-document reference scorers up to
+# rounding; documents with near-equal scores may be ordered differently
+@pytest.mark.parametrize("model_name, parameter", [("JMQueryLikelihoodModel", 0.3), ("DirichletQueryLikelihoodModel", 1000)])
+def test_scores_match_reference(retrieval_model, queries, model_name, parameter):
+	model = getattr(retrieval_model, model_name)(parameter)
+	for _, query_string in queries:
+		terms = retrieval_model._get_terms(query_string)
+		ranked = model.ranked_documents(terms)
+		reference = dict(model.reference_ranked_documents(terms))
+		assert dict(ranked).keys() == reference.keys()
+		for doc_id, score in ranked:
+			assert score == pytest.approx(reference[doc_id], rel=1e-9)
+		assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+
+# Both paths break exact ties by descending docID
+@pytest.mark.parametrize("model_name, parameter", [("JMQueryLikelihoodModel", 0.3), ("DirichletQueryLikelihoodModel", 1000)])
+def test_reference_breaks_ties_by_document(retrieval_model, queries, model_name, parameter):
+	model = getattr(retrieval_model, model_name)(parameter)
+	for _, query_string in queries:
+		reference = model.reference_ranked_documents(retrieval_model._get_terms(query_string))
+		assert reference == sorted(reference, key=lambda x: (x[1], x[0]), reverse=True)
@@ -0,0 +1,80 @@
+from conftest import RELEVANCE_FILE
+
+from math import log, sqrt
+import pytest
+
+# Returns the cosine-normalized tf-idf vector of a document over every
+# indexed term, as a dictionary of term -> weight
+def dense_document_vector(retrieval_model, model, doc_id):
+	weights = {term: ((log(postings[doc_id]) + 1) * model.computeIDF(term) if postings.get(doc_id, 0) > 0 else 0) for term, postings in retrieval_model.index.items()}
+	sqsum = sqrt(sum(weight ** 2 for weight in weights.values()))
+	return {term: weight / sqsum for term, weight in weights.items()}
+
+# Returns the mean of the dense vectors of the given documents
+def dense_centroid(document_vectors, doc_ids):
+	return {term: sum(document_vectors[doc_id][term] for doc_id in doc_ids) / len(doc_ids) for term in next(iter(document_vectors.values()))}
+
+# Applies Rocchio's Algorithm to dense vectors over every indexed term: the
+# documents matching the query that are not relevant are non-relevant, and
+# the `feedback_terms` highest positive weights are kept
+def dense_rocchio(retrieval_model, model, query_terms, relevant_docs):
+	index = retrieval_model.index
+	idfs = {term: model.computeIDF(term) if term in query_terms else 0 for term in index.keys()}
+	sqsum = sqrt(sum(idf ** 2 for idf in idfs.values()))
+	matches = set(doc_id for term in query_terms for doc_id, f in index.get(term, {}).items() if f > 0)
+	document_vectors = {doc_id: dense_document_vector(retrieval_model, model, doc_id) for doc_id in matches | set(relevant_docs)}
+	relevant = dense_centroid(document_vectors, relevant_docs)
+	non_relevant = dense_centroid(document_vectors, [doc_id for doc_id in matches if doc_id not in relevant_docs])
+	modified = {term: model.alpha * idfs[term] / sqsum + model.beta * relevant[term] - model.gamma * non_relevant[term] for term in index.keys()}
+	weighted_terms = sorted(((term, weight) for term, weight in modified.items() if weight > 0), key=lambda x: (x[1], x[0]), reverse=True)
+	return weighted_terms[:model.feedback_terms]
+
+# Scores the documents containing any term of a query vector by the dot
+# product of their dense vectors with it
+def dense_scores(retrieval_model, model, query_vector):
+	index = retrieval_model.index
+	matches = set(doc_id for term, _ in query_vector for doc_id, f in index[term].items() if f > 0)
+	document_vectors = {doc_id: dense_document_vector(retrieval_model, model, doc_id) for doc_id in matches}
+	return {doc_id: sum(weight * document_vectors[doc_id][term] for term, weight in query_vector) for doc_id in matches}
+
+def test_relevance_judgements_match_file(retrieval_model):
+	expected = dict()
+	with open(RELEVANCE_FILE) as rel_file:
+		for line in rel_file:
+			query_id, _, doc_id = line.split()[:3]
+			expected.setdefault(str(int(query_id)), set()).add(doc_id)
+	assert retrieval_model.read_relevance_judgements(RELEVANCE_FILE) == expected
+
+	model = retrieval_model.VectorSpaceRetrievalModel()
+	assert model.relevance_judgements(RELEVANCE_FILE) == expected
+	assert model.relevance_judgements(RELEVANCE_FILE) is model.relevance_judgements(RELEVANCE_FILE)
+
+def test_centroid_matches_dense_vectors(retrieval_model, queries):
+	model = retrieval_model.VectorSpaceRetrievalModel()
+	doc_ids = [doc_id for doc_id, _ in model.ranked_documents(retrieval_model._get_terms(queries[0][1]))[:5]]
+	centroid = model.centroid(doc_ids)
+	for term, weight in dense_centroid({doc_id: dense_document_vector(retrieval_model, model, doc_id) for doc_id in doc_ids}, doc_ids).items():
+		assert centroid.get(term, 0) == pytest.approx(weight)
+
+# The top documents of the original ranking are taken as relevant
+@pytest.mark.parametrize("alpha, beta, gamma, feedback_terms", [(8, 16, 4, 100), (8, 16, 4, 10), (1, 1, 50, 100)])
+def test_feedback_matches_dense_rocchio(retrieval_model, queries, alpha, beta, gamma, feedback_terms):
+	model = retrieval_model.VectorSpaceRetrievalModel(alpha, beta, gamma, feedback_terms)
+	for _, query_string in queries[:3]:
+		terms = retrieval_model._get_terms(query_string)
+		query_vector = model.query_vector(terms)
+		ranked = model.ranked_documents_for_vector(query_vector)
+		relevant_docs = [doc_id for doc_id, _ in ranked[:3]]
+		non_relevant_docs = [doc_id for doc_id, _ in ranked[3:]]
+
+		expected = dense_rocchio(retrieval_model, model, terms, relevant_docs)
+		modified = model.rocchio_query_vector(query_vector, relevant_docs, non_relevant_docs)
+		assert len(modified) <= feedback_terms
+		assert [term for term, _ in modified] == [term for term, _ in expected]
+		assert [weight for _, weight in modified] == pytest.approx([weight for _, weight in expected])
+
+		feedback_ranked = dict(model.feedback_ranked_documents(terms, relevant_docs))
+		reference = dense_scores(retrieval_model, model, expected)
+		assert feedback_ranked.keys() == reference.keys()
+		for doc_id, score in reference.items():
+			assert feedback_ranked[doc_id] == pytest.approx(score)
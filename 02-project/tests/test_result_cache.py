@@ -0,0 +1,90 @@
+from conftest import QUERY_FILE
+from lib.from_scratch import indexer
+from lib.from_scratch.result_cache import ResultCache, _size, cache_key
+
+from io import StringIO
+
+# A stand-in for a retrieval model, for cache keys
+class Model:
+
+	def __init__(self, generation=0, params=()):
+		self.generation = generation
+		self.params = params
+
+	def cache_params(self):
+		return self.params
+
+def test_least_recently_used_entries_are_evicted():
+	cache = ResultCache(max_entries=2)
+	cache.put("a", [("CACM-0001", 1.0)])
+	cache.put("b", [("CACM-0002", 2.0)])
+	assert cache.get("a") == [("CACM-0001", 1.0)]
+	cache.put("c", [("CACM-0003", 3.0)])
+	assert cache.get("b") is None
+	assert cache.get("a") is not None and cache.get("c") is not None
+	stats = cache.stats()
+	assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 1, 1)
+
+def test_memory_limit():
+	results = [("CACM-%04d" % i, float(i)) for i in range(10)]
+	cache = ResultCache(max_bytes=_size(tuple(results)) * 2)
+	cache.put("a", results)
+	cache.put("b", results)
+	cache.put("c", results)
+	assert len(cache) == 2 and cache.get("a") is None
+	# Results larger than the whole limit are not cached
+	cache.put("large", results * 10)
+	assert cache.get("large") is None
+	assert len(cache) == 2
+
+def test_new_index_generation_clears_cache():
+	cache = ResultCache()
+	cache.put("a", [])
+	indexer._next_generation()
+	assert cache.get("a") is None
+	assert cache.stats()["invalidations"] == 1
+
+def test_keys_depend_on_model_parameters_and_generation():
+	assert cache_key(Model(), ["a"], 10) == cache_key(Model(), ["a"], 10)
+	assert cache_key(Model(), ["a"], 10) != cache_key(Model(params=(1,)), ["a"], 10)
+	assert cache_key(Model(), ["a"], 10) != cache_key(Model(generation=1), ["a"], 10)
+	assert cache_key(Model(), ["a"], 10) != cache_key(Model(), ["a"], 5)
+
+def test_cached_rankings_match_uncached_rankings(retrieval_model, queries):
+	models = [retrieval_model.BM25RetrievalModel(), retrieval_model.JMQueryLikelihoodModel(0.3), retrieval_model.DirichletQueryLikelihoodModel(1000), retrieval_model.VectorSpaceRetrievalModel()]
+	for model in models:
+		expected = [model._ranked_results(retrieval_model._get_terms(query_string), 10) for _, query_string in queries]
+		model.result_cache = ResultCache()
+		for _ in range(2):
+			for (_, query_string), ranked in zip(queries, expected):
+				assert model._ranked_results(retrieval_model._get_terms(query_string), 10) == ranked
+		assert model.result_cache.stats()["hits"] == len(queries)
+
+def test_models_built_after_an_index_change_miss_the_cache(corpus, retrieval_model, change_index, queries):
+	cache = ResultCache()
+	model = retrieval_model.BM25RetrievalModel()
+	model.result_cache = cache
+	terms = retrieval_model._get_terms(queries[0][1])
+	model._ranked_results(terms, 10)
+
+	smaller = indexer.index_files(corpus[:50])
+	change_index(smaller)
+	new_model = retrieval_model.BM25RetrievalModel()
+	new_model.result_cache = cache
+	# The old model still ranks the index it was built from
+	model._ranked_results(terms, 10)
+	assert new_model._ranked_results(terms, 10) == new_model.ranked_documents(terms)[:10]
+	assert all(doc_id in smaller[1] for doc_id, _ in new_model._ranked_results(terms, 10))
+
+def test_stats_of_cached_queries(retrieval_model, monkeypatch):
+	stats_output = StringIO()
+	monkeypatch.setattr(retrieval_model, "stderr", stats_output)
+	model = retrieval_model.BM25RetrievalModel()
+	model.top_k_pruning = True
+	model.result_cache = ResultCache()
+	model.process_query_file(QUERY_FILE, 10, print_stats=True)
+	model.process_query_file(QUERY_FILE, 10, print_stats=True)
+	lines = stats_output.getvalue().splitlines()
+	assert len(lines) == 128
+	assert all("skipped" in line for line in lines[:64])
+	assert all(line.endswith("cached results") for line in lines[64:])
@@ -0,0 +1,79 @@
+from json import loads
+import asyncio
+import pytest
+
+@pytest.fixture(params=[0, 1], ids=["threads", "processes"])
+def server(retrieval_model, request):
+	# Imported here: the module imports the retrieval models, which need an
+	# index when they are first imported
+	from lib.from_scratch.search_server import SearchServer
+	server = SearchServer(models=("bm25", "jm"), workers=request.param, cache_size=16)
+	server.start_workers()
+	yield server
+	server.close()
+
+def get(server, target):
+	return asyncio.run(server.dispatch("GET", target))
+
+def test_search_matches_model_rankings(retrieval_model, server, queries):
+	bm25 = retrieval_model.BM25RetrievalModel()
+	jm = retrieval_model.JMQueryLikelihoodModel(0.1)
+	for _, query_string in queries[:4]:
+		terms = retrieval_model._get_terms(query_string)
+		for name, model in (("bm25", bm25), ("jm", jm)):
+			status, response = get(server, "/search?model=%s&r=5&q=%s" % (name, "+".join(query_string.split())))
+			assert status == 200
+			assert [(result["doc_id"], result["score"]) for result in response["results"]] == model.ranked_documents(terms)[:5]
+
+def test_repeated_queries_are_cached(server):
+	_, first = get(server, "/search?q=time+sharing&r=3")
+	_, second = get(server, "/search?q=time+sharing&r=3")
+	assert (first["cached"], second["cached"]) == (False, True)
+	assert first["results"] == second["results"]
+	_, metrics = get(server, "/metrics")
+	assert metrics["result_cache"]["hits"] == 1
+	assert metrics["endpoints"]["/search"]["requests"] == 2
+
+def test_spelling(server):
+	status, response = get(server, "/spelling?q=compuetr+systems")
+	assert status == 200
+	assert "computer" in response["suggestions"]["compuetr"]
+	assert response["correction"][0] == "computer"
+
+def test_bad_requests(server):
+	assert get(server, "/search")[0] == 400
+	assert get(server, "/search?q=a&model=unknown")[0] == 400
+	assert get(server, "/search?q=a&r=0")[0] == 400
+	assert get(server, "/snippets?q=a")[0] == 400
+	assert get(server, "/unknown")[0] == 404
+	assert asyncio.run(server.dispatch("POST", "/search?q=a"))[0] == 405
+
+def test_http_keep_alive(server, tmp_path):
+	socket_path = str(tmp_path / "server.sock")
+
+	async def requests():
+		listener = await asyncio.start_unix_server(server.handle_connection, socket_path)
+		async with listener:
+			reader, writer = await asyncio.open_unix_connection(socket_path)
+			responses = []
+			for target in ("/health", "/search?q=computer&r=2"):
+				writer.write(("GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % target).encode("latin-1"))
+				await writer.drain()
+				status_line = await reader.readline()
+				headers = dict()
+				while True:
+					line = (await reader.readline()).decode("latin-1").strip()
+					if not line:
+						break
+					name, _, value = line.partition(":")
+					headers[name.strip().lower()] = value.strip()
+				body = await reader.readexactly(int(headers["content-length"]))
+				responses.append((status_line.split()[1], headers["connection"], loads(body)))
+			writer.close()
+			return responses
+
+	health, search = asyncio.run(requests())
+	assert health[:2] == (b"200", "keep-alive")
+	assert health[2]["models"] == ["bm25", "jm"]
+	assert search[0] == b"200"
+	assert len(search[2]["results"]) == 2
@@ -0,0 +1,104 @@
+from lib.from_scratch.indexer import document_id, index_files
+from lib.from_scratch import segments as segments_module
+from lib.from_scratch.segments import SEGMENT_FILE, SegmentedIndex, open_segments
+
+from os import listdir
+from os.path import basename, join
+from shutil import copy
+
+# Returns the structures as plain dictionaries, ignoring the order of terms and
+# documents: the postings of each n-gram index, the term counts and the
+# position gaps of each term
+def contents(structures):
+	indexes, term_counts, positional_index = structures
+	return (
+		[{term: dict(postings) for term, postings in index.items()} for index in indexes],
+		dict(term_counts),
+		{term: dict(positional_index[term].items()) for term in positional_index},
+	)
+
+# Copies the documents at `paths` to `directory`, with the text of the document
+# at the same position in `texts` if given
+def write_documents(directory, paths, texts=None):
+	copies = []
+	for i, path in enumerate(paths):
+		target = join(directory, basename(path))
+		if texts is None:
+			copy(path, target)
+		else:
+			with open(target, "w") as target_file:
+				target_file.write(texts[i])
+		copies.append(target)
+	return copies
+
+def test_snapshot_matches_fresh_build(corpus, tmp_path):
+	documents = tmp_path / "documents"
+	documents.mkdir()
+	paths = write_documents(str(documents), corpus[:90])
+	segments = SegmentedIndex(str(tmp_path / "index"), max_segments=100)
+	for start in range(0, 90, 30):
+		segments.add_documents(paths[start:start + 30])
+
+	# Replace two documents and delete three
+	replaced = write_documents(str(documents), corpus[:2], ["new text for a replaced document", "computer systems time sharing"])
+	segments.update(replaced, [document_id(path) for path in paths[40:43]])
+	live = replaced + paths[2:40] + paths[43:]
+	assert contents(segments.snapshot().structures()) == contents(index_files(live))
+
+	segments.merge()
+	assert contents(segments.snapshot().structures()) == contents(index_files(live))
+	assert contents(SegmentedIndex(str(tmp_path / "index")).snapshot().structures()) == contents(index_files(live))
+
+def test_merged_segments_are_removed_by_next_commit(corpus, tmp_path):
+	directory = str(tmp_path / "index")
+	segments = SegmentedIndex(directory, max_segments=100)
+	segments.add_documents(corpus[:10])
+	segments.add_documents(corpus[10:20])
+	old_files = [SEGMENT_FILE % 1, SEGMENT_FILE % 2]
+	snapshot = segments.snapshot()
+
+	# Readers of the previous manifest can still open its segments
+	segments.merge()
+	assert set(old_files) <= set(listdir(directory))
+	assert len(snapshot.term_counts()) == 20
+
+	segments.add_documents(corpus[20:30])
+	assert not set(old_files) & set(listdir(directory))
+	assert len(SegmentedIndex(directory).snapshot().term_counts()) == 30
+
+def test_update_directory_indexes_changes_only(corpus, tmp_path):
+	documents = tmp_path / "documents"
+	documents.mkdir()
+	paths = write_documents(str(documents), corpus[:20])
+	segments = SegmentedIndex(str(tmp_path / "index"), max_segments=100)
+	segments.update_directory(str(documents))
+	generation = segments.generation
+	segments.update_directory(str(documents))
+	assert segments.generation == generation
+
+	(documents / basename(paths[0])).unlink()
+	segments.update_directory(str(documents))
+	assert contents(segments.snapshot().structures()) == contents(index_files(paths[1:]))
+
+# A reader sees the updates another process (here, another instance) commits
+# to the directory, and reads the segments again only when they change
+def test_snapshots_follow_updates_by_other_processes(corpus, tmp_path, monkeypatch):
+	monkeypatch.setattr(segments_module, "_opened", dict())
+	directory = str(tmp_path / "index")
+	writer = SegmentedIndex(directory, max_segments=100)
+	writer.add_documents(corpus[:10])
+	reader = open_segments(directory)
+	snapshot = reader.snapshot()
+	assert reader.snapshot() is snapshot
+	assert open_segments(directory) is reader
+
+	writer.add_documents(corpus[10:20])
+	writer.delete_documents([document_id(corpus[0])])
+	assert contents(reader.snapshot().structures()) == contents(index_files(corpus[1:20]))
+	assert len(snapshot.term_counts()) == 10
+
+	# After a merge and the commit removing the merged segments
+	writer.merge()
+	writer.add_documents(corpus[20:30])
+	assert contents(reader.snapshot().structures()) == contents(index_files(corpus[1:30]))
+	assert reader.generation == writer.generation
@@ -0,0 +1,152 @@
+from lib.from_scratch import spell_corrector
+from lib.from_scratch.spell_corrector import EDIT_LOG_PROBABILITY, MAX_EDIT_DISTANCE, SpellCorrector, SpellingIndex, edit_distance
+
+from pickle import dumps, loads
+import pytest
+
+@pytest.fixture(scope="module")
+def spelling_index(structures):
+	return SpellingIndex.from_index(structures[0][0])
+
+# Misspellings of some vocabulary terms: a deletion, a swap, a replacement and
+# two edits, plus words far from any term
+@pytest.fixture(scope="module")
+def words(spelling_index):
+	terms = [term for term in spelling_index.terms if len(term) >= 5 and term.isalpha()][::40]
+	words = []
+	for term in terms:
+		words.append(term[:2] + term[3:])
+		words.append(term[0] + term[2] + term[1] + term[3:])
+		words.append(term[:3] + "x" + term[4:])
+		words.append(term[1:3] + "q" + term[4:])
+	return words + ["qwertyuiop", "zzzzzzzz", "a"]
+
+# Returns the (term, distance) of every vocabulary term within `max_distance`
+# edits of `word`, by checking every term
+def reference_lookup(spelling_index, word, max_distance=MAX_EDIT_DISTANCE):
+	distances = [(term, edit_distance(word, term, max_distance)) for term in spelling_index.terms]
+	return {(term, distance) for term, distance in distances if distance <= max_distance}
+
+def test_edit_distance():
+	assert edit_distance("system", "system", 2) == 0
+	assert edit_distance("system", "sytsem", 2) == 1
+	assert edit_distance("system", "sysem", 2) == 1
+	assert edit_distance("system", "sytem", 2) == 1
+	assert edit_distance("system", "xystex", 2) == 2
+	assert edit_distance("system", "computer", 2) == 3
+
+def test_lookup_matches_vocabulary_scan(spelling_index, words):
+	for word in words:
+		assert set(spelling_index.lookup(word)) == reference_lookup(spelling_index, word)
+		assert set(spelling_index.lookup(word, 1)) == reference_lookup(spelling_index, word, 1)
+
+def test_frequencies_match_index(structures, spelling_index):
+	index = structures[0][0]
+	assert spelling_index.frequencies == {term: sum(postings.values()) for term, postings in index.items() if sum(postings.values()) > 0}
+	assert spelling_index.term_count == sum(spelling_index.frequencies.values())
+
+def test_suggestions_prefer_closest_and_most_frequent_terms(structures, spelling_index, words):
+	corrector = SpellCorrector(structures[0][0], loads(dumps(spelling_index)))
+	frequencies = spelling_index.frequencies
+	for word in words:
+		matches = reference_lookup(spelling_index, word)
+		closest = [term for term, distance in matches if distance <= 1] or [term for term, _ in matches]
+		assert corrector.suggestions(word) == sorted(closest, key=lambda term: (-frequencies[term], term))
+
+@pytest.fixture
+def corrector(structures, spelling_index):
+	return SpellCorrector(structures[0][0], spelling_index, structures[0][1])
+
+# Returns the best correction of `terms` over every combination of the
+# candidates of the terms, scored like the beam search; ties go to the
+# alphabetically first correction
+def reference_correction(corrector, terms):
+	paths = [(0.0, [])]
+	for term in terms:
+		paths = [(score + corrector.log_probability(candidate, corrected[-1] if corrected else None) + distance * EDIT_LOG_PROBABILITY, corrected + [candidate]) for score, corrected in paths for candidate, distance in corrector.candidates(term)]
+	return min(paths, key=lambda x: (-x[0], x[1]))[1]
+
+# Queries of fixture query terms, with misspellings of two of the terms
+@pytest.fixture
+def misspelled_queries(corrector, queries):
+	spelling_index = corrector.spelling_index()
+	misspelled_queries = []
+	for _, query_string in queries:
+		terms = [term for term in query_string.lower().split() if term.isalpha() and term in spelling_index][:5]
+		for i in set([0, len(terms) // 2]) if terms else ():
+			if len(terms[i]) >= 5:
+				terms[i] = terms[i][0] + terms[i][2] + terms[i][1] + terms[i][3:]
+		misspelled_queries.append(terms)
+	return misspelled_queries
+
+def test_query_correction_matches_exhaustive_search(corrector, misspelled_queries):
+	for terms in misspelled_queries:
+		assert corrector.correct_query(terms) == reference_correction(corrector, terms)
+
+def test_query_correction_keeps_known_terms(corrector):
+	terms = ["computer", "programming", "language"]
+	assert all(term in corrector.spelling_index() for term in terms)
+	assert corrector.correct_query(terms) == terms
+	assert corrector.correct_query(["compuetr", "programming"]) == ["computer", "programming"]
+	# With no time left, terms are kept as they are
+	assert corrector.correct_query(["compuetr"], time_budget=-1) == ["compuetr"]
+
+# An index failing when read
+class UnreadableIndex:
+
+	def get(self, *args):
+		raise AssertionError("not memoized")
+
+def test_candidates_and_bigrams_are_memoized(corrector, misspelled_queries, monkeypatch):
+	for terms in misspelled_queries:
+		corrector.correct_query(terms)
+	corrections = [corrector.correct_query(terms) for terms in misspelled_queries]
+
+	# Correcting the queries again reads neither index
+	monkeypatch.setattr(corrector.spelling_index(), "lookup", UnreadableIndex().get)
+	monkeypatch.setattr(corrector, "bigram_index", UnreadableIndex())
+	assert [corrector.correct_query(terms) for terms in misspelled_queries] == corrections
+
+# A `perf_counter` replacement advancing by `step` seconds per call
+class FakeClock:
+
+	def __init__(self, step=0):
+		self.time = 0
+		self.step = step
+
+	def __call__(self):
+		self.time += self.step
+		return self.time
+
+def test_time_budget_bounds_lookups(corrector, monkeypatch):
+	clock = FakeClock()
+	monkeypatch.setattr(spell_corrector, "perf_counter", clock)
+	spelling_index = corrector.spelling_index()
+	delete_candidates = spelling_index.delete_candidates
+	lookups = []
+
+	# Every lookup step takes a second
+	def slow_delete_candidates(delete):
+		lookups.append(delete)
+		clock.time += 1
+		return delete_candidates(delete)
+	monkeypatch.setattr(spelling_index, "delete_candidates", slow_delete_candidates)
+
+	assert corrector.correct_query(["compuetr", "programming"], time_budget=5) == ["compuetr", "programming"]
+	assert len(lookups) == 6
+	assert "compuetr" not in corrector._candidates
+	assert corrector.correct_query(["compuetr", "programming"]) == ["computer", "programming"]
+
+def test_time_budget_bounds_beam_search(corrector, misspelled_queries, monkeypatch):
+	for terms in misspelled_queries:
+		corrector.correct_query(terms)
+	monkeypatch.setattr(spell_corrector, "perf_counter", FakeClock(1))
+	for terms in misspelled_queries:
+		expected = corrector.correct_query(terms)
+		corrections = [corrector.correct_query(terms, time_budget) for time_budget in range(50)]
+		assert corrections[0] == terms
+		assert corrections[-1] == expected
+		# Corrections of the first terms, followed by the other terms as they are
+		for corrected in corrections:
+			assert len(corrected) == len(terms)
+			assert any(corrected[i:] == terms[i:] for i in range(len(terms) + 1))
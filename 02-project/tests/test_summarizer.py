@@ -0,0 +1,118 @@
+from conftest import CORPUS_DIRECTORY, SOURCE_DIRECTORY, corpus_files
+from lib.from_scratch.indexer import document_id
+from lib.shared_utils import summarizer
+from lib.shared_utils.document_store import write_document_store
+from lib.shared_utils.summarizer import SentenceStore, get_document_text, get_text_from_file, highlight, highlighter, summarize, summarize_document
+
+from array import array
+from os.path import join
+import pytest
+
+# Snippets for these terms are compared
+TERMS = [["computer"], ["time", "sharing", "system"], ["ALGOL", "algorithm"], ["qwertyuiop"]]
+
+# Returns whether the nltk tokenizer models the summarizer needs are installed
+# (the summarizer downloads them when it is imported, if it can)
+def has_tokenizer_models():
+	try:
+		summarizer.sent_tokenize("Tokenizer models.")
+		return True
+	except LookupError:
+		return False
+
+requires_tokenizer_models = pytest.mark.skipif(not has_tokenizer_models(), reason="the nltk punkt tokenizer models are not installed")
+
+# Returns a sentence store of made-up documents, each with one sentence with
+# the text of `texts`, lowercased and split on spaces
+def made_up_store(texts):
+	return SentenceStore({doc_id: ([text], text.lower().split(), array('I', [0, len(text.split())])) for doc_id, text in texts.items()})
+
+# Makes `summarize_document` use the sentence store read from a file written
+# from `store`, with a cache of 3 snippets
+@pytest.fixture
+def use_store(tmp_path, monkeypatch):
+	monkeypatch.setattr(summarizer, "SNIPPET_CACHE_SIZE", 3)
+	monkeypatch.setattr(summarizer, "sentence_store", None)
+	def use(store):
+		path = str(tmp_path / "sentences.p")
+		store.write(path)
+		summarizer.read_sentence_store(path)
+	yield use
+	summarizer._snippet_cache.clear()
+
+@requires_tokenizer_models
+def test_store_snippets_match_summarize(tmp_path):
+	paths = [join(SOURCE_DIRECTORY, document_id(path) + ".html") for path in corpus_files(30)]
+	store = SentenceStore()
+	for path in paths:
+		store.add_document(document_id(path), get_text_from_file(path))
+	store.write(str(tmp_path / "sentences.p"))
+	store = SentenceStore.read(str(tmp_path / "sentences.p"))
+	for path in paths:
+		for terms in TERMS:
+			for limit in (None, 2):
+				assert store.summarize(document_id(path), terms, limit) == summarize(get_text_from_file(path), terms, limit)
+
+def test_snippet_cache_evicts_least_recently_used(use_store):
+	store = made_up_store({"DOC-%s" % i: "Document %s about computer systems" % i for i in range(4)})
+	use_store(store)
+	snippets = [summarize_document(SOURCE_DIRECTORY, "DOC-%s" % i, ".html", ["computer"]) for i in range(3)]
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) == snippets[0]
+	summarize_document(SOURCE_DIRECTORY, "DOC-3", ".html", ["computer"])
+
+	# Cached snippets are returned even though the store changed; the least
+	# recently used one (DOC-1) was evicted
+	changed = made_up_store({"DOC-%s" % i: "Changed computer document %s" % i for i in range(4)})
+	summarizer.sentence_store.documents.update(changed.documents)
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) == snippets[0]
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-2", ".html", ["computer"]) == snippets[2]
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-1", ".html", ["computer"]) == changed.summarize("DOC-1", ["computer"])
+	assert len(summarizer._snippet_cache) == 3
+
+def test_reading_sentence_store_clears_snippet_cache(use_store):
+	use_store(made_up_store({"DOC-0": "A document about computer systems"}))
+	snippet = summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"])
+	use_store(made_up_store({"DOC-0": "Another document about computer systems"}))
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) != snippet
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) == summarizer.sentence_store.summarize("DOC-0", ["computer"])
+
+def test_reading_document_store_clears_snippet_cache(use_store, tmp_path, monkeypatch):
+	monkeypatch.setattr(summarizer, "document_store", None)
+	use_store(made_up_store({"DOC-0": "A document about computer systems"}))
+	snippet = summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"])
+	summarizer.sentence_store.documents.update(made_up_store({"DOC-0": "Another document about computer systems"}).documents)
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) == snippet
+
+	write_document_store(str(tmp_path / "documents.store"), [("DOC-0", "Text")])
+	summarizer.read_document_store(str(tmp_path / "documents.store"))
+	assert summarize_document(SOURCE_DIRECTORY, "DOC-0", ".html", ["computer"]) == summarizer.sentence_store.summarize("DOC-0", ["computer"])
+
+def test_snippets_are_cached_per_document_file(use_store, tmp_path, monkeypatch):
+	use_store(SentenceStore())
+	monkeypatch.setattr(summarizer, "document_store", None)
+	monkeypatch.setattr(summarizer, "summarize", lambda text, terms, limit=None: text)
+	for directory in ("a", "b"):
+		(tmp_path / directory).mkdir()
+		for ext in (".txt", ".html"):
+			(tmp_path / directory / ("DOC-0" + ext)).write_text("Text of " + directory + " " + ext[1:])
+	for directory in ("a", "b"):
+		for ext in (".txt", ".html"):
+			assert summarize_document(str(tmp_path / directory), "DOC-0", ext, ["computer"]) == "Text of " + directory + " " + ext[1:]
+	assert len(summarizer._snippet_cache) == 3
+
+def test_document_texts_come_from_document_store(tmp_path, monkeypatch):
+	monkeypatch.setattr(summarizer, "document_store", None)
+	paths = corpus_files(2)
+	texts = [get_text_from_file(path) for path in paths]
+	assert get_document_text(CORPUS_DIRECTORY, document_id(paths[0]), ".txt") == texts[0]
+
+	write_document_store(str(tmp_path / "documents.store"), [(document_id(paths[0]), "Stored text")])
+	summarizer.read_document_store(str(tmp_path / "documents.store"))
+	assert get_document_text(CORPUS_DIRECTORY, document_id(paths[0]), ".txt") == "Stored text"
+	assert get_document_text(CORPUS_DIRECTORY, document_id(paths[1]), ".txt") == texts[1]
+
+def test_highlight_marks_terms_as_whole_words():
+	text = "Computer systems and computers. A SYSTEMS view"
+	assert highlight(text, ["computer", "systems"]) == "\033[1mComputer\033[0m \033[1msystems\033[0m and computers. A \033[1mSYSTEMS\033[0m view"
+	assert highlight(text, []) == text
+	assert highlighter(("computer", "systems")) is highlighter(("computer", "systems"))
@@ -0,0 +1,61 @@
+from lib.from_scratch.indexer import read_tokenized_document
+from lib.shared_utils import synthetic_corpus
+from lib.shared_utils.synthetic_corpus import CorpusModel
+
+from os import listdir
+from os.path import join
+import numpy as np
+import pytest
+
+@pytest.fixture(scope="module")
+def documents(corpus):
+	return [read_tokenized_document(path) for path in corpus]
+
+@pytest.fixture(scope="module")
+def model(documents):
+	return CorpusModel.from_documents(documents)
+
+# Returns the token lists of the generated collection in `directory`, by file name
+def generated_documents(directory):
+	return {name: read_tokenized_document(join(directory, name)) for name in sorted(listdir(directory))}
+
+def test_generation_is_deterministic_per_seed(model, tmp_path):
+	for name, seed in [("first", 0), ("second", 0), ("other", 1)]:
+		model.generate(str(tmp_path / name), 2, seed=seed)
+	first = generated_documents(str(tmp_path / "first"))
+	assert first == generated_documents(str(tmp_path / "second"))
+	assert first != generated_documents(str(tmp_path / "other"))
+
+def test_generated_collection_size(model, documents, tmp_path):
+	num_docs, num_tokens = model.generate(str(tmp_path), 2.5, prefix="TEST")
+	generated = generated_documents(str(tmp_path))
+	assert num_docs == len(generated) == round(2.5 * len(documents))
+	assert num_tokens == sum(len(tokens) for tokens in generated.values())
+	assert sorted(generated)[0] == "TEST-001.txt"
+	assert set(len(tokens) for tokens in generated.values()) <= set(len(tokens) for tokens in documents)
+
+def test_weights_continue_head_with_zipf_tail(model):
+	head = len(model.head_frequencies)
+	weights = model.weights(head + 100)
+	assert np.array_equal(weights[:head], model.head_frequencies)
+	slopes = np.diff(np.log(weights[head - 1:])) / np.diff(np.log(np.arange(head, head + 101)))
+	assert slopes == pytest.approx(-model.zipf_exponent)
+	assert model.vocabulary_size(0) == len(model.terms)
+
+# Refitting the model to a generated collection gives back its parameters
+@pytest.mark.parametrize("scale", [1, 4])
+def test_generated_collection_follows_model(model, tmp_path, scale):
+	_, num_tokens = model.generate(str(tmp_path), scale, seed=1)
+	generated = CorpusModel.from_directory(str(tmp_path))
+	assert len(generated.terms) == model.vocabulary_size(num_tokens)
+	assert generated.terms[0] == model.terms[0]
+	assert set(model.terms) <= set(generated.terms)
+	assert generated.heaps_k == pytest.approx(model.heaps_k, rel=0.02)
+	assert generated.heaps_beta == pytest.approx(model.heaps_beta, rel=0.02)
+	assert generated.zipf_exponent == pytest.approx(model.zipf_exponent, rel=0.1)
+
+def test_generation_does_not_depend_on_batches(model, tmp_path, monkeypatch):
+	model.generate(str(tmp_path / "batches"), 2)
+	monkeypatch.setattr(synthetic_corpus, "BATCH_SIZE", 7)
+	model.generate(str(tmp_path / "small_batches"), 2)
+	assert generated_documents(str(tmp_path / "batches")) == generated_documents(str(tmp_path / "small_batches"))
@@ -0,0 +1,37 @@
+import pytest
+
+# Returns the analyzed terms of the fixture queries, plus queries with terms
+# that are not in the index
+def query_terms(retrieval_model, queries):
+	terms = [retrieval_model._get_terms(query_string) for _, query_string in queries]
+	return terms + [["udo", "computer"], ["qwertyuiop"], []]
+
+@pytest.mark.parametrize("k", [1, 5, 10, 1000])
+def test_top_k_matches_exhaustive_ranking(retrieval_model, queries, k):
+	model = retrieval_model.BM25RetrievalModel()
+	for terms in query_terms(retrieval_model, queries):
+		assert model.top_k_documents(terms, k) == model.ranked_documents(terms)[:k]
+
+def test_top_k_skips_postings(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	terms = retrieval_model._get_terms(queries[0][1])
+	model.top_k_documents(terms, 5)
+	stats = model.last_query_stats
+	assert stats["postings_scored"] + stats["postings_skipped"] == stats["postings"]
+	assert stats["postings_skipped"] > 0
+
+def test_top_k_follows_parameter_changes(retrieval_model, queries):
+	model = retrieval_model.BM25RetrievalModel()
+	terms = retrieval_model._get_terms(queries[1][1])
+	model.top_k_documents(terms, 10)
+	model.k1, model.b = 2.0, 0.3
+	assert model.top_k_documents(terms, 10) == model.ranked_documents(terms)[:10]
+
+def test_unknown_terms_leave_index_unchanged(retrieval_model):
+	model = retrieval_model.BM25RetrievalModel()
+	num_terms = len(retrieval_model.index)
+	model.reference_ranked_documents(["udo", "computer"])
+	model.overall_ranked_value(["udo"], next(iter(retrieval_model.doc_lengths)))
+	model.top_k_documents(["udo", "computer"], 5)
+	assert len(retrieval_model.index) == num_terms
+	assert "udo" not in retrieval_model.index
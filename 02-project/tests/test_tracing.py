@@ -0,0 +1,60 @@
+from conftest import fixture_queries
+from lib.shared_utils import tracing
+
+import pytest
+
+MODELS = [("BM25RetrievalModel", ()), ("JMQueryLikelihoodModel", (0.35,)), ("DirichletQueryLikelihoodModel", (2000,)), ("VectorSpaceRetrievalModel", ())]
+
+@pytest.fixture(scope="module")
+def query_file(tmp_path_factory):
+	path = tmp_path_factory.mktemp("queries") / "queries.tsv"
+	path.write_text("".join("%s\t%s\n" % query for query in fixture_queries(3)))
+	return str(path)
+
+# Leaves tracing off and without records after each test
+@pytest.fixture(autouse=True)
+def reset_tracing():
+	yield
+	tracing.disable()
+	tracing.records(clear=True)
+
+def printed_output(capsys, process, *args, **kwargs):
+	capsys.readouterr()
+	process(*args, **kwargs)
+	return capsys.readouterr().out
+
+def test_records_add_up_stages_and_counters():
+	tracing.enable()
+	tracing.begin_query("q1", "model")
+	for _ in range(2):
+		with tracing.stage("scoring"):
+			tracing.count("postings_touched", 3)
+	tracing.count("cache_hits")
+	record = tracing.end_query()
+	assert record["query"] == "q1" and record["model"] == "model"
+	assert list(record["stages"]) == ["scoring"]
+	assert 0 <= record["stages"]["scoring"] <= record["total_ms"]
+	assert record["counters"] == {"postings_touched": 6, "cache_hits": 1}
+	assert tracing.records() == [record]
+
+def test_nothing_is_recorded_when_off():
+	tracing.begin_query("q1", "model")
+	with tracing.stage("scoring"):
+		tracing.count("postings_touched", 3)
+	assert tracing.end_query() is None
+	assert tracing.records() == []
+
+@pytest.mark.parametrize("model_name, params", MODELS)
+def test_traced_queries_record_stages_and_counters(retrieval_model, query_file, capsys, model_name, params):
+	model = getattr(retrieval_model, model_name)(*params)
+	untraced = printed_output(capsys, model.process_query_file, query_file, num_results=10)
+	assert tracing.records() == []
+
+	tracing.enable()
+	assert printed_output(capsys, model.process_query_file, query_file, num_results=10) == untraced
+	records = tracing.records()
+	assert [record["query"] for record in records] == [query_id for query_id, _ in fixture_queries(3)]
+	for record in records:
+		assert {"tokenize", "scoring", "sorting"} <= set(record["stages"])
+		assert record["counters"]["postings_touched"] > 0
+		assert record["counters"]["candidates_scored"] > 0
@@ -0,0 +1,46 @@
+from math import log, sqrt
+import pytest
+
+# Returns the cosine-normalized tf-idf weights of a dense term frequency
+# vector over every indexed term, the way the vector space model weighted
+# documents and queries before it was scored sparsely
+def dense_weights(model, frequencies):
+	weights = {term: ((log(f) + 1) if f > 0 else 0) * model.computeIDF(term) for term, f in frequencies.items()}
+	sqsum = sqrt(sum(weight ** 2 for weight in weights.values()))
+	return {term: weight / sqsum for term, weight in weights.items()}
+
+# Scores the documents containing any query term by the dot product of their
+# dense weight vectors with the dense query vector
+def dense_scores(retrieval_model, model, query_terms):
+	index = retrieval_model.index
+	query_vector = dense_weights(model, {term: int(term in query_terms) for term in index.keys()})
+	matches = set(doc_id for term in query_terms for doc_id, f in index.get(term, {}).items() if f > 0)
+	scores = dict()
+	for doc_id in matches:
+		document_vector = dense_weights(model, {term: postings.get(doc_id, 0) for term, postings in index.items()})
+		scores[doc_id] = sum(weight * query_vector[term] for term, weight in document_vector.items())
+	return scores
+
+def test_sparse_scores_match_dense_vectors(retrieval_model, queries):
+	model = retrieval_model.VectorSpaceRetrievalModel()
+	for _, query_string in queries[:4]:
+		terms = retrieval_model._get_terms(query_string)
+		ranked = dict(model.ranked_documents(terms))
+		reference = dense_scores(retrieval_model, model, terms)
+		assert ranked.keys() == reference.keys()
+		for doc_id, score in reference.items():
+			assert ranked[doc_id] == pytest.approx(score)
+
+def test_document_norms_match_dense_vectors(retrieval_model):
+	model = retrieval_model.VectorSpaceRetrievalModel()
+	index = retrieval_model.index
+	for doc_id in retrieval_model.doc_lengths:
+		weights = [((log(postings[doc_id]) + 1) * model.computeIDF(term)) for term, postings in index.items() if postings.get(doc_id, 0) > 0]
+		assert model.document_norms[doc_id] == pytest.approx(sqrt(sum(weight ** 2 for weight in weights)))
+
+# "cacm" occurs in every fixture document, so its idf is 0
+def test_query_of_zero_idf_terms_matches_nothing(retrieval_model):
+	model = retrieval_model.VectorSpaceRetrievalModel()
+	assert model.computeIDF("cacm") == 0
+	assert model.query_vector(["cacm", "qwertyuiop"]) == []
+	assert model.ranked_documents(["cacm"]) == []